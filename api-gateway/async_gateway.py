@@ -0,0 +1,176 @@
+# api-gateway/async_gateway.py (v1.0 - ASSÍNCRONO COM POOL DE CONEXÕES)
+"""
+Modo assíncrono do gateway (aiohttp), com as mesmas rotas de gateway.py.
+
+- Uma ClientSession por microsserviço, com pool de conexões keep-alive.
+- Corpo da requisição e da resposta repassados em streaming, sem buffer.
+- Timeout por rota (search, discover, recommend...) e limite de requisições
+  simultâneas por microsserviço: enquanto um serviço está saturado, as
+  requisições esperam na fila (até o timeout) em vez de ocupar threads.
+
+Uso: python async_gateway.py
+"""
+
+import os
+import sys
+import time
+import asyncio
+import aiohttp
+from aiohttp import web
+from dotenv import load_dotenv
+
+# Métricas compartilhadas com o backend (formato Prometheus, rota /metrics)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from common import metrics
+
+load_dotenv()
+
+GAMES_API_URL = os.getenv("GAMES_API_URL", "http://localhost:5001")
+MUSIC_API_URL = os.getenv("MUSIC_API_URL", "http://localhost:5002")
+MOVIES_API_URL = os.getenv("MOVIES_API_URL", "http://localhost:5003")
+
+SERVICES = {
+    "games": GAMES_API_URL,
+    "music": MUSIC_API_URL,
+    "movies": MOVIES_API_URL,
+}
+
+GATEWAY_PORT = int(os.getenv("GATEWAY_PORT", "5000"))
+GATEWAY_DEBUG = os.getenv("GATEWAY_DEBUG", "false").lower() == "true"
+# Conexões keep-alive mantidas por microsserviço
+GATEWAY_POOL_SIZE = int(os.getenv("GATEWAY_POOL_SIZE", "100"))
+# Requisições simultâneas por microsserviço (as demais aguardam na fila)
+GATEWAY_MAX_CONCURRENCY = int(os.getenv("GATEWAY_MAX_CONCURRENCY", "64"))
+GATEWAY_TIMEOUT = float(os.getenv("GATEWAY_TIMEOUT", "30"))
+# Rotas dos microsserviços (primeiro segmento do caminho) com rótulo próprio nas métricas; as demais viram 'other'
+ROUTES = frozenset(('search', 'genres', 'discover', 'recommend', 'get-track-details'))
+
+
+def parse_route_timeouts(spec):
+    """Lê "rota=segundos,..."; recusa rotas fora de ROUTES e timeouts que não sejam números positivos."""
+    timeouts = {}
+    for item in (item.strip() for item in spec.split(',')):
+        if not item: continue
+        route, _, seconds = (part.strip() for part in item.partition('='))
+        try:
+            timeouts[route] = float(seconds)
+        except ValueError:
+            raise ValueError(f"GATEWAY_ROUTE_TIMEOUTS: '{item}' não está no formato rota=segundos.") from None
+        if route not in ROUTES: raise ValueError(f"GATEWAY_ROUTE_TIMEOUTS: rota '{route}' desconhecida; use uma de {sorted(ROUTES)}.")
+        if not timeouts[route] > 0: raise ValueError(f"GATEWAY_ROUTE_TIMEOUTS: o timeout de '{route}' deve ser positivo.")
+    return timeouts
+
+
+# Timeouts por rota, em segundos, no formato "search=5,genres=5,discover=10,recommend=30"
+ROUTE_TIMEOUTS = parse_route_timeouts(os.getenv("GATEWAY_ROUTE_TIMEOUTS", "search=5,genres=5,discover=10,recommend=30"))
+
+# Cabeçalhos hop-by-hop (RFC 7230) não são repassados
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailers', 'transfer-encoding', 'upgrade', 'host', 'content-length',
+}
+STREAM_CHUNK_SIZE = 64 * 1024
+
+UPSTREAM_SECONDS = metrics.Histogram('gateway_upstream_duration_seconds', 'Latência das chamadas aos microsserviços (até o fim do streaming)', ('service', 'route', 'status'))
+QUEUE_SECONDS = metrics.Histogram('gateway_queue_duration_seconds', 'Espera na fila de concorrência de cada microsserviço', ('service',))
+
+
+def route_label(path):
+    """Rota do caminho: o primeiro segmento (ex.: 'recommend') se for uma das conhecidas, senão 'other'."""
+    return metrics.bounded_label(path.split('/', 1)[0], ROUTES)
+
+
+def route_timeout(route):
+    """Timeout da rota (as sem timeout próprio, e 'other', usam GATEWAY_TIMEOUT)."""
+    return ROUTE_TIMEOUTS.get(route, GATEWAY_TIMEOUT)
+
+
+async def on_startup(app):
+    app['sessions'] = {
+        name: aiohttp.ClientSession(
+            base_url=url,
+            connector=aiohttp.TCPConnector(limit=GATEWAY_POOL_SIZE, keepalive_timeout=60),
+            auto_decompress=False,
+        )
+        for name, url in SERVICES.items()
+    }
+    app['semaphores'] = {name: asyncio.Semaphore(GATEWAY_MAX_CONCURRENCY) for name in SERVICES}
+
+
+async def on_cleanup(app):
+    await asyncio.gather(*(session.close() for session in app['sessions'].values()))
+
+
+async def proxy_request(request):
+    service, path = request.match_info['service'], request.match_info['path']
+    if GATEWAY_DEBUG: print(f"[GATEWAY] Requisição recebida: {request.method} para /api/{service}/{path}")
+
+    if service not in SERVICES:
+        return web.json_response({"error": f"Serviço '{service}' não encontrado."}, status=404)
+
+    session, semaphore = request.app['sessions'][service], request.app['semaphores'][service]
+    route = route_label(path)
+    timeout = route_timeout(route)
+    headers = {key: value for key, value in request.headers.items() if key.lower() not in HOP_BY_HOP_HEADERS}
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    queued_at = time.perf_counter()
+    try:
+        # A espera na fila conta para o timeout da rota
+        await asyncio.wait_for(semaphore.acquire(), timeout)
+    except asyncio.TimeoutError:
+        QUEUE_SECONDS.observe(time.perf_counter() - queued_at, service)
+        return web.json_response({"error": f"Serviço de '{service}' sobrecarregado. Tente novamente."}, status=503)
+
+    started = time.perf_counter()
+    QUEUE_SECONDS.observe(started - queued_at, service)
+    response, status = None, 'error'
+    try:
+        async with session.request(
+            request.method, f"/api/{service}/{path}", params=request.query, headers=headers,
+            data=request.content if request.body_exists else None,
+            timeout=aiohttp.ClientTimeout(total=max(deadline - loop.time(), 0.001)),
+        ) as upstream:
+            if GATEWAY_DEBUG: print(f"[GATEWAY] Resposta de {SERVICES[service]} com status: {upstream.status}")
+            status = str(upstream.status)
+            response = web.StreamResponse(status=upstream.status, reason=upstream.reason)
+            for key, value in upstream.headers.items():
+                if key.lower() not in HOP_BY_HOP_HEADERS: response.headers.add(key, value)
+            if upstream.content_length is not None: response.content_length = upstream.content_length
+            await response.prepare(request)
+            async for chunk in upstream.content.iter_chunked(STREAM_CHUNK_SIZE):
+                await response.write(chunk)
+            await response.write_eof()
+            return response
+    except Exception as e:
+        # Com a resposta já iniciada não há como trocar o status: a conexão com o cliente é abortada
+        if response is not None and response.prepared: raise
+        if isinstance(e, aiohttp.ClientConnectorError):
+            return web.json_response({"error": f"Não foi possível conectar ao serviço de '{service}'. Ele está rodando?"}, status=503)
+        if isinstance(e, asyncio.TimeoutError):
+            status = 'timeout'
+            return web.json_response({"error": f"O serviço de '{service}' não respondeu em {timeout:g}s."}, status=504)
+        print(f"[GATEWAY] ERRO INESPERADO: {str(e)}")
+        return web.json_response({"error": f"Um erro inesperado ocorreu no gateway: {str(e)}"}, status=500)
+    finally:
+        semaphore.release()
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, service, route, status)
+
+
+async def metrics_endpoint(request):
+    return web.Response(body=metrics.render().encode('utf-8'), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+
+def create_app():
+    app = web.Application()
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    app.router.add_route('GET', '/metrics', metrics_endpoint)
+    app.router.add_route('GET', '/api/{service}/{path:.+}', proxy_request)
+    app.router.add_route('POST', '/api/{service}/{path:.+}', proxy_request)
+    return app
+
+
+if __name__ == '__main__':
+    web.run_app(create_app(), port=GATEWAY_PORT)
@@ -1,9 +1,16 @@
-# api-gateway/gateway.py (v3.1 - MODO DEPURACAO)
+# api-gateway/gateway.py (v3.2 - DEPURACAO OPCIONAL, SESSÕES REUTILIZADAS)
+# Para o modo assíncrono com pool de conexões e streaming, veja async_gateway.py
 from flask import Flask, request, jsonify
 import requests
 import os
+import sys
+import time
 from dotenv import load_dotenv
 
+# Métricas compartilhadas com o backend (formato Prometheus, rota /metrics)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from common import metrics
+
 load_dotenv()
 app = Flask(__name__)
 
@@ -17,40 +24,60 @@ SERVICES = {
     "movies": MOVIES_API_URL,
 }
 
+# Rotas dos microsserviços (primeiro segmento do caminho) com rótulo próprio nas métricas; as demais viram 'other'
+ROUTES = frozenset(('search', 'genres', 'discover', 'recommend', 'get-track-details'))
+
+# Modo depuração: imprime cada requisição (desligado por padrão)
+GATEWAY_DEBUG = os.getenv("GATEWAY_DEBUG", "false").lower() == "true"
+# Uma sessão por microsserviço reaproveita conexões keep-alive entre requisições
+SESSIONS = {name: requests.Session() for name in SERVICES}
+
+UPSTREAM_SECONDS = metrics.Histogram('gateway_upstream_duration_seconds', 'Latência das chamadas aos microsserviços', ('service', 'route', 'status'))
+
+def debug(message):
+    if GATEWAY_DEBUG: print(message)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return metrics.render(), 200, {'Content-Type': metrics.CONTENT_TYPE}
+
 @app.route('/api/<service>/<path:path>', methods=['GET', 'POST'])
 def proxy_request(service, path):
-    # --- MODO DEPURACAO: Imprime tudo o que chega ---
-    print("\n--- INICIANDO DEPURACAO DE ROTA (GATEWAY) ---")
-    print(f"[GATEWAY] Requisição recebida: {request.method} para /api/{service}/{path}")
+    debug("\n--- INICIANDO DEPURACAO DE ROTA (GATEWAY) ---")
+    debug(f"[GATEWAY] Requisição recebida: {request.method} para /api/{service}/{path}")
     
     if service not in SERVICES:
-        print(f"[GATEWAY] ERRO: Serviço '{service}' não existe no mapeamento.")
+        debug(f"[GATEWAY] ERRO: Serviço '{service}' não existe no mapeamento.")
         return jsonify({"error": f"Serviço '{service}' não encontrado."}), 404
 
     service_url = f"{SERVICES[service]}/api/{service}/{path}"
-    print(f"[GATEWAY] Redirecionando para: {service_url}")
+    debug(f"[GATEWAY] Redirecionando para: {service_url}")
 
     headers = {key: value for key, value in request.headers if key.lower() not in ['host', 'content-length']}
     params = {key: value for key, value in request.args.items()}
     
-    print(f"[GATEWAY] Parâmetros da URL (params): {params}")
-    # --- FIM DO MODO DEPURACAO ---
+    debug(f"[GATEWAY] Parâmetros da URL (params): {params}")
 
+    # A rota é o primeiro segmento do caminho (ex.: 'recommend'), limitada às conhecidas
+    route, status, started = metrics.bounded_label(path.split('/', 1)[0], ROUTES), 'error', time.perf_counter()
     try:
         if request.method == 'POST':
-            resp = requests.post(service_url, json=request.get_json(), headers=headers, params=params, timeout=30)
+            resp = SESSIONS[service].post(service_url, json=request.get_json(), headers=headers, params=params, timeout=30)
         else: # GET
-            resp = requests.get(service_url, params=params, headers=headers, timeout=30)
+            resp = SESSIONS[service].get(service_url, params=params, headers=headers, timeout=30)
+        status = str(resp.status_code)
 
-        print(f"[GATEWAY] Resposta recebida do microsserviço com status: {resp.status_code}")
+        debug(f"[GATEWAY] Resposta recebida do microsserviço com status: {resp.status_code}")
         return (resp.content, resp.status_code, resp.headers.items())
 
     except requests.exceptions.ConnectionError:
-        print(f"[GATEWAY] ERRO DE CONEXÃO: Não foi possível conectar a {service_url}")
+        debug(f"[GATEWAY] ERRO DE CONEXÃO: Não foi possível conectar a {service_url}")
         return jsonify({"error": f"Não foi possível conectar ao serviço de '{service}'. Ele está rodando?"}), 503
     except Exception as e:
         print(f"[GATEWAY] ERRO INESPERADO: {str(e)}")
         return jsonify({"error": f"Um erro inesperado ocorreu no gateway: {str(e)}"}), 500
+    finally:
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, service, route, status)
 
 if __name__ == '__main__':
     app.run(port=5000)
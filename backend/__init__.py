@@ -1,24 +1,52 @@
-# backend/__init__.py (v6.0 - COM AUTENTICAÇÃO)
+# backend/__init__.py (v6.1 - COM AUTENTICAÇÃO E CARGA SOB DEMANDA)
+import os
+import sys
+import importlib
 from flask import Flask, jsonify
 from flask_cors import CORS
 
-def create_app():
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from common import metrics
+from common import lazy
+from common.response_cache import RESPONSE_CACHE
+
+# Domínio -> (módulo do blueprint, blueprint, recomendador preguiçoso, prefixo da URL)
+DOMAINS = {
+    'games': ('.blueprints.games', 'games_bp', 'recommender_games', '/api/games'),
+    'music': ('.blueprints.music', 'music_bp', 'recommender_music', '/api/music'),
+    'movies': ('.blueprints.movies', 'movies_bp', 'recommender_movies', '/api/movies'),
+}
+
+def create_app(domains=None):
     """
     Fábrica de aplicação: cria e configura a instância do Flask.
+
+    Args:
+        domains: domínios a servir (ex.: ['games']). Se omitido, usa a variável
+            de ambiente APP_DOMAINS (lista separada por vírgulas) ou todos.
     """
+    if domains is None:
+        domains = [d.strip() for d in os.getenv('APP_DOMAINS', ','.join(DOMAINS)).split(',') if d.strip()]
+    unknown = [d for d in domains if d not in DOMAINS]
+    if unknown: raise ValueError(f"Domínios desconhecidos: {unknown}. Opções: {list(DOMAINS)}")
+
     app = Flask(__name__)
     CORS(app) # Habilita CORS para toda a aplicação
 
     # Importa e registra os blueprints AQUI, dentro da função.
-    # Isso evita problemas de importação circular.
-    from .blueprints.games import games_bp
-    from .blueprints.music import music_bp
-    from .blueprints.movies import movies_bp
-    from .blueprints.auth import auth_bp  # <--- NOVO BLUEPRINT DE AUTENTICAÇÃO
+    # Isso evita problemas de importação circular e permite pods de um único domínio,
+    # que nunca importam (nem carregam) os caches dos outros dois.
+    recommenders = {}
+    for domain in domains:
+        module_name, bp_name, recommender_name, url_prefix = DOMAINS[domain]
+        module = importlib.import_module(module_name, __name__)
+        app.register_blueprint(getattr(module, bp_name), url_prefix=url_prefix)
+        recommenders[domain] = getattr(module, recommender_name)
+
+    # Acessíveis fora das rotas (ex.: serve.py pré-carrega os caches antes de criar os workers)
+    app.extensions['recommenders'] = recommenders
 
-    app.register_blueprint(games_bp, url_prefix='/api/games')
-    app.register_blueprint(music_bp, url_prefix='/api/music')
-    app.register_blueprint(movies_bp, url_prefix='/api/movies')
+    from .blueprints.auth import auth_bp  # <--- NOVO BLUEPRINT DE AUTENTICAÇÃO
     app.register_blueprint(auth_bp, url_prefix='/api/auth')  # <--- REGISTRADO AQUI
 
     # Uma rota simples para verificar se a API está no ar.
@@ -26,8 +54,17 @@ def create_app():
     def health_check():
         return jsonify({"status": "API is running!"})
 
-    print(">>> Aplicação Flask criada e pronta para rodar. <<<")
-    print("✅ Blueprint de autenticação registrado em /api/auth")
-    return app
+    # Contadores do cache de respostas (acertos, falhas, remoções) deste processo
+    @app.route('/api/cache/stats')
+    def response_cache_stats():
+        return jsonify(RESPONSE_CACHE.stats())
 
+    # Latência por rota e por etapa, em /metrics (formato Prometheus)
+    metrics.init_app(app)
 
+    # Prontidão (/api/ready), gerações (/api/admin/cache), aquecimento e troca de geração sem reiniciar o processo
+    lazy.init_app(app, recommenders)
+
+    print(f">>> Aplicação Flask criada e pronta para rodar (domínios: {', '.join(domains)}). <<<")
+    print("✅ Blueprint de autenticação registrado em /api/auth")
+    return app
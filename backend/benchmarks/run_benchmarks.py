@@ -0,0 +1,354 @@
+# backend/benchmarks/run_benchmarks.py
+"""
+Benchmark dos caminhos quentes dos recomendadores sobre catálogos sintéticos.
+
+Para cada domínio e tamanho, gera a entrada sintética (synthetic.py), roda o
+build de cache do próprio repositório sobre ela (o resultado fica guardado em
+BENCHMARK_DATA_DIR e é reaproveitado enquanto as fontes do build e as
+variáveis de BUILD_ENV não mudarem) e mede, num processo separado, a carga do
+recomendador e as chamadas de busca, descoberta, recomendação e do corpo
+completo das rotas de recomendação (ranking, payload da página e
+serialização): p50/p95/p99, pico de RSS do processo e pico de alocações por
+chamada (tracemalloc, numa passada à parte para não distorcer os tempos).
+Além dos blueprints, o alvo games_app mede o serviço independente
+steam/app.py sobre o mesmo catálogo de jogos.
+
+Uso:
+    python run_benchmarks.py                                   # 10k/100k/1M, todos os alvos
+    python run_benchmarks.py --sizes 10000 --domains movies --output base.json
+    python run_benchmarks.py --sizes 10000 --baseline base.json  # compara e falha se regredir
+"""
+
+import os
+import re
+import sys
+import json
+import hashlib
+import time
+import random
+import shutil
+import argparse
+import platform
+import importlib
+import subprocess
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCHMARKS_DIR)
+sys.path.append(BACKEND_DIR)
+sys.path.append(BENCHMARKS_DIR)
+import synthetic
+from common.serialization import dumps
+
+DATA_DIR = os.getenv('BENCHMARK_DATA_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'recommender-benchmarks'))
+DEFAULT_SIZES = '10000,100000,1000000'
+DOMAINS = ('games', 'music', 'movies')
+# Variáveis do processo medido: sem aquecimento nem vigia de gerações (o serviço independente liga as duas ao ser importado)
+WORKER_ENV = {'RECOMMENDER_WARMUP': 'false', 'CACHE_SWAP_SECONDS': '0'}
+
+# Domínio -> (script de build, pasta do cache relativa ao diretório de trabalho do build)
+BUILDERS = {
+    'games': ('steam/build_games_cache.py', 'cache'),
+    'music': ('music/build_music_cache.py', 'cache'),
+    'movies': ('movies/build_movie_cache.py', '.'),
+}
+# Variáveis de ambiente que mudam o que o build grava (um catálogo construído com outros valores é refeito)
+BUILD_ENV = ('VECTOR_DTYPE', 'NEIGHBORS_K', 'ANN_TARGET_RECALL', 'ANN_RECALL_K', 'ANN_CALIBRATION_QUERIES')
+
+
+# --- Medições ---
+
+def current_rss():
+    """RSS atual em bytes (Linux); None em outras plataformas."""
+    try:
+        with open('/proc/self/statm') as f: return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss():
+    """Pico de RSS do processo em bytes; None se o módulo resource não existir (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def measure(calls, warmup=5, alloc_samples=20):
+    """
+    Args:
+        calls: funções sem argumentos, uma por chamada a medir
+        warmup: chamadas iniciais executadas antes da medição (não entram nas estatísticas)
+        alloc_samples: chamadas repetidas com o tracemalloc ligado para medir as alocações
+    """
+    for call in calls[:warmup]: call()
+    timings = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - start)
+    timings_ms = np.array(timings) * 1000
+
+    alloc_peaks = []
+    tracemalloc.start()
+    try:
+        for call in calls[:alloc_samples]:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            call()
+            alloc_peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+    finally:
+        tracemalloc.stop()
+
+    p50, p95, p99 = np.percentile(timings_ms, [50, 95, 99])
+    return {
+        'calls': len(calls),
+        'mean_ms': round(float(timings_ms.mean()), 4),
+        'p50_ms': round(float(p50), 4),
+        'p95_ms': round(float(p95), 4),
+        'p99_ms': round(float(p99), 4),
+        'max_ms': round(float(timings_ms.max()), 4),
+        'alloc_peak_bytes_p50': int(np.median(alloc_peaks)) if alloc_peaks else None,
+        'alloc_peak_bytes_max': int(max(alloc_peaks)) if alloc_peaks else None,
+    }
+
+
+# --- Cargas de trabalho por domínio ---
+
+def _search_terms(titles, rng, n):
+    # Uma ou duas palavras de títulos do catálogo, como o usuário digitaria
+    picks = [str(titles[i]).lower().split() for i in rng.integers(0, len(titles), size=n)]
+    return [' '.join(words[:rng.integers(1, 3)]) or 'a' for words in picks]
+
+
+def _selections(ids, rng, n):
+    return [[ids[i] for i in rng.choice(len(ids), size=rng.integers(3, 6), replace=False)] for _ in range(n)]
+
+
+def _profiles(ids, genres, rng, n):
+    # Seleções com um gênero a explorar sorteado (metade das vezes nenhum), como no corpo do /recommend
+    genres = list(genres) + [None] * len(genres)
+    return [(sel, genres[rng.integers(0, len(genres))]) for sel in _selections(ids, rng, n)]
+
+
+def games_workload(recommender, rng, n):
+    from blueprints.games import recommendation_payload
+    df = recommender.df
+    ids = df['appid'].tolist()
+    return {
+        'search_games': [lambda q=q: recommender.search_games(q) for q in _search_terms(df['name'].to_numpy(), rng, n)],
+        'discover_games': [lambda s=s: recommender.discover_games(seed=s) for s in range(n)],
+        'get_recommendations': [lambda ids=sel: recommender.get_recommendations(ids) for sel in _selections(ids, rng, n)],
+        # Corpo da rota (sem o cache de respostas): ranking, categorias e perfil da página e serialização
+        'recommend_route': [lambda ids=sel, g=g: dumps(recommendation_payload(recommender, ids, g, recommender.get_recommendations(ids))) for sel, g in _profiles(ids, recommender.genres, rng, n)],
+    }
+
+
+def games_app_workload(recommender, rng, n):
+    """Serviço independente steam/app.py (porta 5001), com ranking e categorias próprios."""
+    from steam.app import recommendation_payload
+    df = recommender.df
+    ids = df['appid'].tolist()
+    return {
+        'search_games': [lambda q=q: recommender.search_games(q) for q in _search_terms(df['name'].to_numpy(), rng, n)],
+        'discover_games': [lambda s=s: recommender.discover_games(seed=s) for s in range(n)],
+        'get_recommendations': [lambda ids=sel, g=g: recommender.get_recommendations(ids, genre_to_explore=g) for sel, g in _profiles(ids, recommender.genres, rng, n)],
+        'recommend_route': [lambda ids=sel, g=g: dumps(recommendation_payload(recommender, ids, g, recommender.get_recommendations(ids, genre_to_explore=g))) for sel, g in _profiles(ids, recommender.genres, rng, n)],
+    }
+
+
+def music_workload(recommender, rng, n):
+    from blueprints.music import recommendation_payload
+    df = recommender.df_music
+    ids = df['id'].tolist()
+    return {
+        'search_tracks': [lambda q=q: recommender.search_tracks(q) for q in _search_terms(df['name'].to_numpy(), rng, n)],
+        'discover_tracks': [lambda s=s: recommender.discover_tracks(seed=s) for s in range(n)],
+        'get_recommendations': [lambda ids=sel, g=g: recommender.get_recommendations(ids, genre_to_explore=g) for sel, g in _profiles(ids, recommender.all_genres, rng, n)],
+        'recommend_route': [lambda ids=sel, g=g: dumps(recommendation_payload(recommender, ids, g, recommender.get_recommendations(ids, genre_to_explore=g))) for sel, g in _profiles(ids, recommender.all_genres, rng, n)],
+    }
+
+
+def movies_workload(recommender, rng, n):
+    from blueprints.movies import recommendation_payload
+    df = recommender.df_movies
+    ids = df['id'].tolist()
+    return {
+        'search_movies': [lambda q=q: recommender.search_movies(q) for q in _search_terms(df['title'].to_numpy(), rng, n)],
+        'discover_movies': [recommender.discover_movies] * n,
+        'recommend_movie_categories': [lambda ids=sel, g=g: recommender.recommend_movie_categories(ids, g) for sel, g in _profiles(ids, recommender.GENRES_LIST, rng, n)],
+        'recommend_route': [lambda ids=sel, g=g: dumps(recommendation_payload(recommender, ids, g, recommender.recommend_movie_categories(ids, g))) for sel, g in _profiles(ids, recommender.GENRES_LIST, rng, n)],
+    }
+
+
+# Alvo -> (domínio do catálogo, módulo, classe do recomendador, carga de trabalho)
+RECOMMENDERS = {
+    'games': ('games', 'blueprints.games', 'GameRecommender', games_workload),
+    'games_app': ('games', 'steam.app', 'GameRecommender', games_app_workload),
+    'music': ('music', 'blueprints.music', 'MusicRecommender', music_workload),
+    'movies': ('movies', 'blueprints.movies', 'MovieRecommender', movies_workload),
+}
+
+
+def run_worker(domain, cache_dir, queries, seed):
+    """Mede um alvo num processo limpo (o pico de RSS é o do processo inteiro)."""
+    random.seed(seed); np.random.seed(seed)
+    _, module_name, class_name, workload = RECOMMENDERS[domain]
+    recommender_class = getattr(importlib.import_module(module_name), class_name)
+    start = time.perf_counter()
+    recommender = recommender_class(cache_dir=cache_dir)
+    load_seconds = time.perf_counter() - start
+    if not recommender.is_ready: raise RuntimeError(f"Recomendador de {domain} não carregou a partir de {cache_dir}")
+    rss_after_load = current_rss()
+    operations = {name: measure(calls) for name, calls in workload(recommender, np.random.default_rng(seed), queries).items()}
+    return {'load_seconds': round(load_seconds, 4), 'rss_after_load_bytes': rss_after_load, 'peak_rss_bytes': peak_rss(), 'operations': operations}
+
+
+# --- Catálogos e orquestração ---
+
+def build_sources(script):
+    """Arquivos que definem o build: o script, os módulos de common que ele importa (transitivamente) e o gerador sintético."""
+    sources, pending = [], [os.path.join(BACKEND_DIR, script)]
+    while pending:
+        path = pending.pop()
+        if path in sources or not os.path.exists(path): continue
+        sources.append(path)
+        with open(path, encoding='utf-8') as f: code = f.read()
+        # `from common.x import ...`, `from common import x` e, dentro de common, `from .x import ...`
+        for package, module, names in re.findall(r'^\s*from (common)?\.?(\w*) import ([\w, ]+)', code, flags=re.MULTILINE):
+            if not package and (not module or os.path.dirname(path) != os.path.join(BACKEND_DIR, 'common')): continue
+            modules = [module] if module else [name.strip() for name in names.split(',')]
+            pending.extend(os.path.join(BACKEND_DIR, 'common', f"{module}.py") for module in modules)
+    return sorted(sources) + [os.path.join(BENCHMARKS_DIR, 'synthetic.py')]
+
+
+def build_key(domain):
+    """Identifica o build: hash das fontes (build_sources) e as variáveis de BUILD_ENV definidas."""
+    digest = hashlib.sha256()
+    for path in build_sources(BUILDERS[domain][0]):
+        digest.update(os.path.relpath(path, BACKEND_DIR).encode())
+        with open(path, 'rb') as f: digest.update(f.read())
+    return {'sources_sha256': digest.hexdigest()[:16], 'env': {name: os.environ[name] for name in BUILD_ENV if name in os.environ}}
+
+
+def ensure_catalog(domain, size, seed, log):
+    """Gera a entrada e roda o build do domínio, a menos que o mesmo catálogo, do mesmo build, já exista; retorna (pasta do cache, metadados do build)."""
+    workdir = os.path.join(DATA_DIR, f"{domain}-{size}-seed{seed}")
+    script, cache_subdir = BUILDERS[domain]
+    cache_dir = os.path.normpath(os.path.join(workdir, cache_subdir))
+    marker = os.path.join(workdir, 'build.json')
+    key = build_key(domain)
+    if os.path.exists(marker):
+        with open(marker) as f: metadata = json.load(f)
+        if metadata.get('build_key') == key: return cache_dir, metadata
+        print(f"  - build existente feito com outras fontes ou ambiente ({metadata.get('build_key')}); refazendo...", flush=True)
+
+    shutil.rmtree(workdir, ignore_errors=True)
+    start = time.perf_counter()
+    synthetic.write_inputs(domain, size, workdir, seed)
+    generate_seconds = time.perf_counter() - start
+    print(f"  - catálogo sintético gerado em {generate_seconds:.1f}s; rodando o build...", flush=True)
+    start = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(BACKEND_DIR, script)], cwd=workdir, stdout=log, stderr=subprocess.STDOUT, check=True)
+    build_seconds = time.perf_counter() - start
+
+    metadata = {'generate_seconds': round(generate_seconds, 2), 'build_seconds': round(build_seconds, 2), 'build_key': key}
+    with open(marker, 'w') as f: json.dump(metadata, f)
+    return cache_dir, metadata
+
+
+def run_case(domain, size, seed, queries):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    log_path = os.path.join(DATA_DIR, f"{domain}-{size}-seed{seed}.log")
+    with open(log_path, 'a') as log:
+        cache_dir, build = ensure_catalog(RECOMMENDERS[domain][0], size, seed, log)
+        result_path = os.path.join(DATA_DIR, f"{domain}-{size}-seed{seed}.result.json")
+        worker = [sys.executable, os.path.abspath(__file__), '--worker', domain, '--cache-dir', cache_dir,
+                  '--queries', str(queries), '--seed', str(seed), '--result-file', result_path]
+        subprocess.run(worker, stdout=log, stderr=subprocess.STDOUT, check=True, env={**os.environ, **WORKER_ENV})
+    with open(result_path) as f: measured = json.load(f)
+    return {'domain': domain, 'size': size, **build, **measured}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Imprime a variação de p50/p95 contra um resultado anterior; retorna quantas medições pioraram além da tolerância."""
+    previous = {(r['domain'], r['size'], op): stats for r in baseline['results'] for op, stats in r['operations'].items()}
+    regressions = 0
+    print(f"\nComparação com {baseline.get('git_commit') or 'base'} (tolerância {tolerance:.0%}):")
+    for result in results:
+        for op, stats in result['operations'].items():
+            before = previous.get((result['domain'], result['size'], op))
+            if before is None: continue
+            for metric in ('p50_ms', 'p95_ms'):
+                change = stats[metric] / before[metric] - 1 if before[metric] else 0.0
+                flag = 'REGRESSÃO' if change > tolerance else ''
+                regressions += bool(flag)
+                print(f"  {result['domain']:7s} {result['size']:>8d} {op:28s} {metric}: {before[metric]:9.3f} -> {stats[metric]:9.3f} ms ({change:+.1%}) {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dos recomendadores sobre catálogos sintéticos")
+    parser.add_argument('--domains', default=','.join(RECOMMENDERS), help="alvos (domínios e games_app, o serviço steam/app.py), separados por vírgula")
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help="tamanhos dos catálogos (itens na entrada do build)")
+    parser.add_argument('--queries', type=int, default=200, help="chamadas medidas por operação")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="arquivo JSON de saída (padrão: benchmarks/results/<data>.json)")
+    parser.add_argument('--baseline', help="resultado anterior para comparação")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="piora relativa aceita na comparação")
+    parser.add_argument('--worker', choices=tuple(RECOMMENDERS), help=argparse.SUPPRESS)
+    parser.add_argument('--cache-dir', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_worker(args.worker, args.cache_dir, args.queries, args.seed)
+        with open(args.result_file, 'w') as f: json.dump(result, f)
+        return 0
+
+    domains = [d.strip() for d in args.domains.split(',') if d.strip()]
+    sizes = [int(s) for s in args.sizes.split(',') if s.strip()]
+    results = []
+    for size in sizes:
+        for domain in domains:
+            print(f"[{domain} / {size} itens]", flush=True)
+            result = run_case(domain, size, args.seed, args.queries)
+            results.append(result)
+            for op, stats in result['operations'].items():
+                print(f"  {op:28s} p50 {stats['p50_ms']:9.3f} ms  p95 {stats['p95_ms']:9.3f} ms  p99 {stats['p99_ms']:9.3f} ms")
+            if result['peak_rss_bytes']: print(f"  carga {result['load_seconds']:.2f}s, pico de RSS {result['peak_rss_bytes'] / 2**20:.0f} MiB")
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'queries': args.queries,
+        'results': results,
+    }
+    output = args.output or os.path.join(BENCHMARKS_DIR, 'results', datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f: json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados salvos em '{output}'.")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f: baseline = json.load(f)
+        return 1 if compare(results, baseline, args.tolerance) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+# backend/benchmarks/synthetic.py
+"""
+Catálogos sintéticos com os mesmos esquemas das entradas reais dos builds de cache.
+
+- jogos: `games_processed_df.parquet` (gêneros, categorias e desenvolvedores em listas)
+- músicas: `spotify_dataset.csv` (esquema do dataset de faixas do Spotify)
+- filmes: `TMDB_movie_dataset.csv` (esquema do dataset do TMDB, gêneros como texto)
+
+Os textos usam um vocabulário de pseudo-palavras com frequências de Zipf, e
+os catálogos são determinísticos para a mesma semente e o mesmo tamanho, então
+não dependem dos arquivos do LFS nem de rede.
+"""
+
+import os
+import itertools
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+GAME_GENRES = ['Ação', 'Aventura', 'RPG', 'Estratégia', 'Simulação', 'Esportes', 'Corrida', 'Quebra-Cabeça', 'Indie', 'Casual', 'Multijogador Massivo', 'Acesso Antecipado']
+GAME_CATEGORIES = ['Single-player', 'Multi-player', 'Co-op', 'Online PvP', 'Steam Achievements', 'Full controller support', 'Steam Trading Cards', 'Steam Cloud', 'In-App Purchases', 'Remote Play Together']
+# Os jogos "icônicos" do discover precisam existir no catálogo
+ICONIC_APPIDS = [570, 730, 271590, 1091500, 292030, 1245620, 620, 413150]
+
+MUSIC_GENRES = ['acoustic', 'alt-rock', 'ambient', 'blues', 'bossanova', 'classical', 'country', 'dance', 'deep-house', 'disco', 'drum-and-bass', 'edm', 'electronic',
+                'folk', 'funk', 'garage', 'grunge', 'hard-rock', 'heavy-metal', 'hip-hop', 'house', 'indie', 'indie-pop', 'j-pop', 'jazz', 'k-pop', 'latin', 'metal', 'mpb',
+                'pagode', 'pop', 'punk', 'punk-rock', 'r-n-b', 'reggae', 'rock', 'rock-n-roll', 'samba', 'sertanejo', 'soul', 'synth-pop', 'techno', 'trance', 'world-music']
+ICONIC_ARTISTS = ['Arctic Monkeys', 'Billie Eilish', 'The Weeknd', 'Daft Punk', 'Queen', 'Kendrick Lamar', 'Tame Impala', 'Radiohead', 'Red Hot Chili Peppers', 'Foo Fighters']
+AUDIO_FEATURES = ['danceability', 'energy', 'loudness', 'speechiness', 'acousticness', 'instrumentalness', 'liveness', 'valence', 'tempo']
+
+MOVIE_GENRES = ['Action', 'Adventure', 'Animation', 'Comedy', 'Crime', 'Documentary', 'Drama', 'Family', 'Fantasy', 'History', 'Horror', 'Music', 'Mystery',
+                'Romance', 'Science Fiction', 'Thriller', 'War', 'Western', 'TV Movie', 'Erotic']
+
+
+def vocabulary(size=6000):
+    """Pseudo-palavras de 2 e 3 sílabas, sempre na mesma ordem."""
+    syllables = [c + v for c in 'bcdfgklmnprstvz' for v in 'aeiou']
+    words = (''.join(p) for n in (2, 3) for p in itertools.product(syllables, repeat=n))
+    return np.array(list(itertools.islice(words, size)))
+
+
+class TextGenerator:
+    def __init__(self, rng, size=6000, exponent=1.1):
+        self.rng = rng
+        self.words = vocabulary(size)
+        weights = 1.0 / np.arange(1, size + 1) ** exponent
+        self.probabilities = weights / weights.sum()
+
+    def words_for(self, n_rows, n_words):
+        """Matriz (n_rows, n_words) de palavras sorteadas pela distribuição de Zipf."""
+        return self.words[self.rng.choice(len(self.words), size=(n_rows, n_words), p=self.probabilities)]
+
+    def sentences(self, n_rows, n_words, sep=' '):
+        return [sep.join(row) for row in self.words_for(n_rows, n_words)]
+
+    def titles(self, n_rows, sequel_rate=0.03):
+        """Títulos de 1 a 4 palavras; uma parte repete um título anterior com número de sequência (quase duplicatas)."""
+        lengths = self.rng.integers(1, 5, size=n_rows)
+        words = self.words_for(n_rows, 4)
+        titles = [' '.join(w[:n]).title() for w, n in zip(words, lengths)]
+        sequels = np.flatnonzero(self.rng.random(n_rows) < sequel_rate)
+        for row in sequels[sequels > 0]:
+            titles[row] = f"{titles[self.rng.integers(0, row)]} {self.rng.integers(2, 5)}"
+        return titles
+
+
+def _pick_lists(rng, choices, n_rows, low, high, p=None):
+    counts = rng.integers(low, high + 1, size=n_rows)
+    return [list(rng.choice(choices, size=min(c, len(choices)), replace=False, p=p)) for c in counts]
+
+
+def _dates(rng, n_rows, start=date(1980, 1, 1), end=None):
+    end = end or date.today()
+    days = rng.integers(0, (end - start).days + 1, size=n_rows)
+    return pd.to_datetime(start) + pd.to_timedelta(days, unit='D')
+
+
+def games_catalog(n_items, seed=0):
+    """DataFrame no formato do `games_processed_df.parquet` (entrada do build de jogos)."""
+    rng = np.random.default_rng(seed)
+    text = TextGenerator(rng)
+    appids = np.concatenate([ICONIC_APPIDS, 2_000_000 + rng.permutation(n_items * 2)[:max(n_items - len(ICONIC_APPIDS), 0)]])[:n_items]
+    genre_weights = np.linspace(2.0, 0.5, len(GAME_GENRES)); genre_weights /= genre_weights.sum()
+    developers = np.array([' '.join(w).title() + ' Studios' for w in text.words_for(max(n_items // 8, 10), 2)])
+    return pd.DataFrame({
+        'appid': appids,
+        'name': text.titles(n_items),
+        'genres': _pick_lists(rng, GAME_GENRES, n_items, 1, 4, p=genre_weights),
+        'categories': [[{'id': int(i), 'description': GAME_CATEGORIES[i]} for i in sorted(idx)] for idx in _pick_lists(rng, np.arange(len(GAME_CATEGORIES)), n_items, 1, 5)],
+        'developers': [list(d) for d in _pick_lists(rng, developers, n_items, 0, 2)],
+        'short_description': text.sentences(n_items, 20),
+        'release_date': _dates(rng, n_items, start=date(1995, 1, 1)).strftime('%d %b, %Y'),
+        'quality': rng.beta(5, 2, size=n_items),
+        'header_image': [f"https://cdn.akamai.steamstatic.com/steam/apps/{a}/header.jpg" for a in appids],
+    })
+
+
+def music_catalog(n_items, seed=0):
+    """DataFrame no formato do `spotify_dataset.csv` (entrada do build de músicas)."""
+    rng = np.random.default_rng(seed + 1)
+    text = TextGenerator(rng)
+    artists = np.concatenate([ICONIC_ARTISTS, [' '.join(w).title() for w in text.words_for(max(n_items // 6, 20), 2)]])
+    primary = artists[rng.integers(0, len(artists), size=n_items)]
+    featured = np.where(rng.random(n_items) < 0.15, ';' + artists[rng.integers(0, len(artists), size=n_items)], '')
+    df = pd.DataFrame({
+        'track_id': [f"{i:022x}" for i in rng.permutation(n_items * 4)[:n_items]],
+        'artists': np.char.add(primary.astype(str), featured.astype(str)),
+        'album_name': text.titles(n_items, sequel_rate=0),
+        'track_name': text.titles(n_items, sequel_rate=0),
+        'popularity': np.clip(rng.normal(45, 20, size=n_items), 0, 100).astype(int),
+        'duration_ms': rng.integers(90_000, 420_000, size=n_items),
+        'explicit': rng.random(n_items) < 0.1,
+        'key': rng.integers(0, 12, size=n_items),
+        'mode': rng.integers(0, 2, size=n_items),
+        'time_signature': rng.choice([3, 4, 5], size=n_items, p=[0.1, 0.85, 0.05]),
+        'track_genre': rng.choice(MUSIC_GENRES, size=n_items),
+    })
+    for column in AUDIO_FEATURES: df[column] = rng.random(n_items)
+    df['loudness'] = -60 * (1 - df['loudness'])
+    df['tempo'] = 60 + 140 * df['tempo']
+    return df
+
+
+def movies_catalog(n_items, seed=0):
+    """DataFrame no formato do `TMDB_movie_dataset.csv` (entrada do build de filmes)."""
+    rng = np.random.default_rng(seed + 2)
+    text = TextGenerator(rng)
+    titles = text.titles(n_items)
+    genre_weights = np.linspace(2.0, 0.2, len(MOVIE_GENRES)); genre_weights /= genre_weights.sum()
+    return pd.DataFrame({
+        'id': 1 + rng.permutation(n_items * 3)[:n_items],
+        'title': titles,
+        'vote_average': np.round(rng.uniform(3, 9.5, size=n_items), 1),
+        # Uma parte fica abaixo do mínimo de votos e é descartada pelo build, como no dataset real
+        'vote_count': rng.integers(0, 20_000, size=n_items) * (rng.random(n_items) > 0.05),
+        'status': 'Released',
+        'release_date': _dates(rng, n_items).strftime('%Y-%m-%d'),
+        'revenue': rng.integers(0, 10**9, size=n_items),
+        'runtime': rng.integers(70, 180, size=n_items),
+        'adult': np.where(rng.random(n_items) < 0.01, 'True', 'False'),
+        'budget': rng.integers(0, 3 * 10**8, size=n_items),
+        'original_language': rng.choice(['en', 'pt', 'es', 'fr', 'ja', 'ko'], size=n_items),
+        'original_title': titles,
+        'overview': text.sentences(n_items, 30),
+        'popularity': rng.gamma(2, 10, size=n_items),
+        'poster_path': [f"/{w}.jpg" for w in text.sentences(n_items, 2, sep='')],
+        'tagline': text.sentences(n_items, 6),
+        'genres': [', '.join(g) for g in _pick_lists(rng, MOVIE_GENRES, n_items, 1, 3, p=genre_weights)],
+        'keywords': text.sentences(n_items, 6, sep=', '),
+    })
+
+
+def write_inputs(domain, n_items, directory, seed=0):
+    """
+    Grava a entrada do build de `domain` em `directory`, no caminho que o builder espera
+    (relativo ao diretório de trabalho dele, ver BUILDERS em run_benchmarks.py).
+    """
+    if domain == 'games':
+        os.makedirs(os.path.join(directory, 'cache'), exist_ok=True)
+        games_catalog(n_items, seed).to_parquet(os.path.join(directory, 'cache', 'games_processed_df.parquet'))
+    elif domain == 'music':
+        os.makedirs(os.path.join(directory, 'cache'), exist_ok=True)
+        music_catalog(n_items, seed).to_csv(os.path.join(directory, 'cache', 'spotify_dataset.csv'), index=False)
+    elif domain == 'movies':
+        os.makedirs(directory, exist_ok=True)
+        movies_catalog(n_items, seed).to_csv(os.path.join(directory, 'TMDB_movie_dataset.csv'), index=False)
+    else:
+        raise ValueError(f"Domínio desconhecido: {domain}")
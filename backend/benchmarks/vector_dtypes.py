@@ -0,0 +1,153 @@
+# backend/benchmarks/vector_dtypes.py
+"""
+Precisão e latência de cada tipo de armazenamento dos vetores (VECTOR_DTYPE, common/compact.py).
+
+Usa os catálogos sintéticos do run_benchmarks.py (gerados e construídos se
+ainda não existirem). A referência é a matriz de features completa do build
+(pickle em float64), normalizada; para float64, float32, float16 e int8
+mede, com as mesmas consultas de perfil:
+
+- bytes dos vetores (valores + índices, se CSR);
+- erro absoluto máximo e médio dos scores do cosseno;
+- recall@k da busca exata e do IVF do cache contra a busca exata em float64;
+- p50/p95 das duas buscas.
+
+Com --dense mede também a matriz densificada (caminho do steam/app.py sem
+artefatos), onde float16 se aplica; nas esparsas ele cai para float32.
+
+Uso:
+    python vector_dtypes.py --sizes 10000 --domains games,movies --dense
+"""
+
+import os
+import sys
+import json
+import pickle
+import argparse
+import platform
+from datetime import datetime
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.dirname(BENCHMARKS_DIR))
+sys.path.append(BENCHMARKS_DIR)
+from run_benchmarks import DATA_DIR, DOMAINS, ensure_catalog, git_commit, measure
+from common.ann_index import ExactIndex, IVFIndex, artifact_nprobe, dot_scores, prepare_vectors, profile_query, top_k
+from common.artifacts import ARTIFACTS_DIR, load_artifacts
+from common.compact import VECTOR_DTYPES, compact, matrix_nbytes, storage_dtype
+from common.generations import resolve
+
+# Pickles com a matriz de features completa de cada domínio (jogos: soma ponderada pelos pesos do manifesto)
+RAW_MATRICES = {
+    'games': ['genres_matrix.pkl', 'categories_matrix.pkl', 'description_matrix.pkl', 'developers_matrix.pkl'],
+    'music': ['feature_matrix.pkl'],
+    'movies': ['movie_tfidf_matrix.pkl'],
+}
+# Matrizes densas maiores que isto (float64) não são medidas com --dense
+DENSE_LIMIT_BYTES = int(os.getenv('DENSE_LIMIT_BYTES', str(2 * 2**30)))
+
+
+def reference_vectors(domain, directory, artifacts):
+    """Vetores normalizados em float64 e normas, como o build os calcula."""
+    matrices = []
+    for file_name in RAW_MATRICES[domain]:
+        with open(os.path.join(directory, file_name), 'rb') as f: matrices.append(pickle.load(f))
+    if domain == 'games':
+        weights = artifacts.metadata['feature_weights']
+        matrix = sum(m * weights[file_name.replace('_matrix.pkl', '')] for m, file_name in zip(matrices, RAW_MATRICES[domain]))
+    else:
+        matrix = matrices[0]
+    vectors, norms = prepare_vectors(matrix.astype(np.float64))
+    return vectors, norms
+
+
+def overlap(expected, found):
+    """Fração dos k esperados presentes no resultado (recall@k)."""
+    hits = sum(len(np.intersect1d(e, f[f >= 0])) for e, f in zip(expected, found))
+    return hits / expected.size if expected.size else 1.0
+
+
+def measure_layout(reference, norms, artifacts, queries_rows, k):
+    """Uma linha do relatório por tipo, para a matriz `reference` (esparsa ou densa)."""
+    queries = np.vstack([profile_query(reference, norms, rows) for rows in queries_rows])
+    reference_scores = dot_scores(queries, reference)
+    expected, _ = top_k(reference_scores, k)
+    results = []
+    for dtype in VECTOR_DTYPES:
+        vectors = compact(reference, dtype)
+        exact = ExactIndex(vectors)
+        ivf = IVFIndex(artifacts['ann_centroids'], artifacts['ann_list_offsets'], artifacts['ann_list_items'], vectors, nprobe=artifact_nprobe(artifacts))
+        error = np.abs(dot_scores(queries, vectors) - reference_scores)
+        results.append({
+            'dtype': dtype,
+            'stored_as': storage_dtype(vectors),
+            'vector_bytes': matrix_nbytes(vectors),
+            'max_abs_error': float(error.max()),
+            'mean_abs_error': float(error.mean()),
+            'exact_recall': round(overlap(expected, exact.search(queries, k)[0]), 4),
+            'ivf_recall': round(overlap(expected, ivf.search(queries, k)[0]), 4),
+            'exact_search': measure([lambda q=queries[i:i + 1]: exact.search(q, k) for i in range(len(queries))], alloc_samples=0),
+            'ivf_search': measure([lambda q=queries[i:i + 1]: ivf.search(q, k) for i in range(len(queries))], alloc_samples=0),
+        })
+    return results
+
+
+def run_case(domain, size, seed, n_queries, k, dense):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(os.path.join(DATA_DIR, f"{domain}-{size}-seed{seed}.log"), 'a') as log:
+        cache_dir, _ = ensure_catalog(domain, size, seed, log)
+    _, directory = resolve(cache_dir)
+    artifacts = load_artifacts(os.path.join(directory, ARTIFACTS_DIR))
+    reference, norms = reference_vectors(domain, directory, artifacts)
+    rng = np.random.default_rng(seed)
+    queries_rows = [rng.choice(reference.shape[0], size=rng.integers(3, 6), replace=False) for _ in range(n_queries)]
+    layouts = {'sparse': reference}
+    if dense:
+        if reference.shape[0] * reference.shape[1] * 8 <= DENSE_LIMIT_BYTES: layouts['dense'] = reference.toarray()
+        else: print(f"  - matriz densa {reference.shape} acima de DENSE_LIMIT_BYTES; medindo só a esparsa.")
+    return [{'domain': domain, 'size': size, 'n_items': reference.shape[0], 'n_features': reference.shape[1], 'layout': layout, **row}
+            for layout, matrix in layouts.items() for row in measure_layout(matrix, norms, artifacts, queries_rows, k)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precisão e latência dos tipos de armazenamento dos vetores")
+    parser.add_argument('--domains', default=','.join(DOMAINS), help="domínios, separados por vírgula")
+    parser.add_argument('--sizes', default='10000', help="tamanhos dos catálogos (itens na entrada do build)")
+    parser.add_argument('--queries', type=int, default=100, help="consultas de perfil por caso")
+    parser.add_argument('--k', type=int, default=100, help="resultados por consulta (recall@k)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dense', action='store_true', help="mede também a matriz densificada")
+    parser.add_argument('--output', help="arquivo JSON de saída (padrão: benchmarks/results/dtypes-<data>.json)")
+    args = parser.parse_args()
+
+    results = []
+    for size in [int(s) for s in args.sizes.split(',') if s.strip()]:
+        for domain in [d.strip() for d in args.domains.split(',') if d.strip()]:
+            print(f"[{domain} / {size} itens]", flush=True)
+            rows = run_case(domain, size, args.seed, args.queries, args.k, args.dense)
+            results.extend(rows)
+            print(f"  {'layout':7s} {'tipo':8s} {'gravado':8s} {'MiB':>8s} {'erro máx':>9s} {'recall':>7s} {'ivf':>7s} {'exata p50':>10s} {'ivf p50':>9s}")
+            for r in rows:
+                print(f"  {r['layout']:7s} {r['dtype']:8s} {r['stored_as']:8s} {r['vector_bytes'] / 2**20:8.2f} {r['max_abs_error']:9.2e} "
+                      f"{r['exact_recall']:7.4f} {r['ivf_recall']:7.4f} {r['exact_search']['p50_ms']:8.3f}ms {r['ivf_search']['p50_ms']:7.3f}ms")
+
+    report = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': args.seed,
+        'queries': args.queries,
+        'k': args.k,
+        'results': results,
+    }
+    output = args.output or os.path.join(BENCHMARKS_DIR, 'results', 'dtypes-' + datetime.now().strftime('%Y%m%d-%H%M%S') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f: json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nResultados salvos em '{output}'.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,54 +1,77 @@
 # backend/blueprints/games.py (v5.0 - Autossuficiente)
 import os
+import sys
 import json
 import random
 import pickle
 import traceback
-from collections import defaultdict
 import numpy as np
 import pandas as pd
 from flask import Blueprint, request, jsonify
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 from thefuzz import process
 
-# --- Funções Auxiliares ---
-def sanitize_for_json(data):
-    if isinstance(data, (list, tuple)): return [sanitize_for_json(item) for item in data]
-    if isinstance(data, dict): return {key: sanitize_for_json(value) for key, value in data.items()}
-    if isinstance(data, np.ndarray): return data.tolist()
-    if isinstance(data, (np.int64, np.int32, np.int16)): return int(data)
-    if isinstance(data, (np.float64, np.float32)): return float(data)
-    if pd.isna(data): return None
-    return data
-
-def check_genre_in_item(genres_item, target_genre):
-    if genres_item is None: return False
-    if not isinstance(genres_item, str): genres_item = str(genres_item)
-    return target_genre in genres_item
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.ann_index import index_from_artifacts
+from common.artifacts import ARTIFACTS_DIR, load_artifacts
+from common.compact import compact, vectors_from_artifacts
+from common.generations import resolve
+from common.id_index import IdIndex
+from common.neighbors import NeighborTable, merge_candidates
+from common.diversity import diversity_penalty, first_list_item, truncate_candidates
+from common.batch import chunked_search, parse_profiles
+from common.lazy import LazyRecommender
+from common.search_index import SearchIndex
+from common.fuzzy_search import TitleBounds, fuzzy_search
+from common.categories import Bucket, CategoryAllocator
+from common.genre_bits import GenreBits
+from common.precomputed import PrecomputedPayload
+from common.serialization import json_response, records
+from common.metrics import mark
+from common.response_cache import cache_version, cached_response, make_key, store_response
 
 # --- Classe GameRecommender ---
 class GameRecommender:
-    def __init__(self):
+    def __init__(self, cache_dir=None):
         self.is_ready = False
         try:
             print("Carregando cache de jogos (v5.0)...")
             base_dir = os.path.dirname(os.path.abspath(__file__))
             # Caminho relativo ao blueprint para encontrar a pasta de cache correta
-            CACHE_DIR = os.path.join(base_dir, '..', 'steam', 'cache')
+            CACHE_DIR = cache_dir or os.path.join(base_dir, '..', 'steam', 'cache')
+            # Geração ativa apontada por CURRENT (ou a própria pasta no layout antigo); a vigia de gerações compara com ela
+            self.cache_root = CACHE_DIR
+            self.generation, CACHE_DIR = resolve(CACHE_DIR)
             
             self.df = pd.read_parquet(os.path.join(CACHE_DIR, 'games_processed_df.parquet'))
-            with open(os.path.join(CACHE_DIR, 'genres_matrix.pkl'), 'rb') as f: self.genres_matrix = pickle.load(f)
-            with open(os.path.join(CACHE_DIR, 'categories_matrix.pkl'), 'rb') as f: self.categories_matrix = pickle.load(f)
-            with open(os.path.join(CACHE_DIR, 'description_matrix.pkl'), 'rb') as f: self.description_matrix = pickle.load(f)
-            with open(os.path.join(CACHE_DIR, 'developers_matrix.pkl'), 'rb') as f: self.developers_matrix = pickle.load(f)
             with open(os.path.join(CACHE_DIR, 'games_genres.json'), 'r', encoding='utf-8') as f: self.genres = json.load(f)
             
-            weights = {'genres': 4.0, 'categories': 3.0, 'description': 1.0, 'developers': 1.0}
-            self.feature_matrix = (
-                self.genres_matrix * weights['genres'] + self.categories_matrix * weights['categories'] +
-                self.description_matrix * weights['description'] + self.developers_matrix * weights['developers']
-            )
+            artifacts = load_artifacts(os.path.join(CACHE_DIR, ARTIFACTS_DIR))
+            if artifacts is not None:
+                # Formato mmap: matriz já ponderada e normalizada no build, compartilhada entre workers via page cache
+                self.feature_matrix = vectors_from_artifacts(artifacts, 'feature_matrix')
+            else:
+                with open(os.path.join(CACHE_DIR, 'genres_matrix.pkl'), 'rb') as f: self.genres_matrix = pickle.load(f)
+                with open(os.path.join(CACHE_DIR, 'categories_matrix.pkl'), 'rb') as f: self.categories_matrix = pickle.load(f)
+                with open(os.path.join(CACHE_DIR, 'description_matrix.pkl'), 'rb') as f: self.description_matrix = pickle.load(f)
+                with open(os.path.join(CACHE_DIR, 'developers_matrix.pkl'), 'rb') as f: self.developers_matrix = pickle.load(f)
+                weights = {'genres': 4.0, 'categories': 3.0, 'description': 1.0, 'developers': 1.0}
+                weighted_matrix = (
+                    self.genres_matrix * weights['genres'] + self.categories_matrix * weights['categories'] +
+                    self.description_matrix * weights['description'] + self.developers_matrix * weights['developers']
+                )
+                # Normaliza (L2) uma única vez: o produto escalar entre linhas passa a ser a similaridade do cosseno
+                self.feature_matrix = compact(normalize(weighted_matrix.tocsr(), norm='l2'))
+            self.index = index_from_artifacts(artifacts, self.feature_matrix)
+            self.neighbors = NeighborTable.from_artifacts(artifacts, len(self.df))
+            self.title_index = SearchIndex.from_artifacts(artifacts, len(self.df))
+            # Contagens por título para o limite superior do WRatio (busca com o resultado exato do extractBests)
+            self.title_bounds = TitleBounds(self.title_index) if self.title_index is not None else None
+            self.id_index = IdIndex(self.df['appid'])
+            self.genre_bits = GenreBits.from_artifacts(artifacts, self.df['genres'])
+            self.cache_version = cache_version(artifacts, os.path.join(CACHE_DIR, 'games_processed_df.parquet'))
             self.df['release_year'] = pd.to_datetime(self.df['release_date'], errors='coerce').dt.year
+            self.discover_payload = PrecomputedPayload(self._discover_payload)
             self.is_ready = True
             print(f">>> Sistema de jogos pronto. {len(self.df)} jogos e {len(self.genres)} gêneros carregados. <<<")
         except Exception as e:
@@ -57,58 +80,66 @@ class GameRecommender:
 
     def get_df_as_records(self, df_to_convert):
         if df_to_convert is None or df_to_convert.empty: return []
-        records = df_to_convert.to_dict('records')
-        return sanitize_for_json(records)
+        # Só os campos do schema de jogos, convertidos por coluna
+        return records(df_to_convert, 'games')
 
     def search_games(self, query, limit=30):
         if not self.is_ready or not query: return []
+        if self.title_index is not None:
+            # WRatio em C só nos títulos que podem alcançar o corte (mesmo resultado do extractBests)
+            return self.get_df_as_records(self.df.iloc[fuzzy_search(self.title_index, query, limit=limit, score_cutoff=60, bounds=self.title_bounds)])
         choices = self.df['name']
         results = process.extractBests(query, choices, score_cutoff=60, limit=limit)
         if not results: return []
         result_indices = [r[2] for r in results]
         return self.get_df_as_records(self.df.iloc[result_indices])
 
-    def discover_games(self):
+    def discover_games(self, seed=42):
         if not self.is_ready: return {}, {}
         iconic_appids = [570, 730, 271590, 1091500, 292030, 1245620, 620, 413150]
-        iconic_games = self.df[self.df['appid'].isin(iconic_appids)]
+        iconic_games = self.df.iloc[self.id_index.rows(iconic_appids)]
         explore_df = self.df[
             (self.df['quality'] > 0.92) &
-            (~self.df['genres'].apply(lambda g: check_genre_in_item(g, 'Ação') or check_genre_in_item(g, 'Aventura') or check_genre_in_item(g, 'RPG') or check_genre_in_item(g, 'Estratégia')))
-        ].sample(n=15, random_state=42)
+            (~self.genre_bits.mask(['Ação', 'Aventura', 'RPG', 'Estratégia']))
+        ].sample(n=15, random_state=seed)
         return self.get_df_as_records(iconic_games), self.get_df_as_records(explore_df)
 
+    def _discover_payload(self, slot):
+        # A janela de rotação só desloca a semente da amostra "explorar" (0 = amostra de sempre)
+        iconic_games_json, explore_games_json = self.discover_games(seed=42 + slot)
+        return {"iconic_games": iconic_games_json, "explore_games": explore_games_json}
+
     def get_recommendations(self, selected_game_ids, top_n_per_item=20):
-        if not self.is_ready or not selected_game_ids: return pd.DataFrame()
-        selected_indices = self.df.index[self.df['appid'].isin(selected_game_ids)].tolist()
-        if not selected_indices: return pd.DataFrame()
-        all_recs_dfs = []
-        feature_matrix_array = self.feature_matrix.toarray()
-        for game_index in selected_indices:
-            game_vector = feature_matrix_array[game_index].reshape(1, -1)
-            similarities = cosine_similarity(game_vector, feature_matrix_array).flatten()
-            recs_for_item = self.df.copy()
-            recs_for_item['similarity'] = similarities
-            top_recs = recs_for_item.nlargest(top_n_per_item, 'similarity')
-            all_recs_dfs.append(top_recs)
-        if not all_recs_dfs: return pd.DataFrame()
-        combined_recs_df = pd.concat(all_recs_dfs).reset_index(drop=True)
-        combined_recs_df = combined_recs_df[~combined_recs_df['appid'].isin(selected_game_ids)]
-        combined_recs_df = combined_recs_df.sort_values('similarity', ascending=False).drop_duplicates(subset=['appid'])
-        recs_df = combined_recs_df
+        return next(self.get_batch_recommendations([selected_game_ids], top_n_per_item))
+
+    def get_batch_recommendations(self, profiles_ids, top_n_per_item=20):
+        """Gera o ranking de cada perfil, na ordem; os vizinhos de todos os jogos selecionados saem de uma consulta só."""
+        profile_rows = [self.id_index.rows(ids) if self.is_ready and ids else np.empty(0, dtype=np.int64) for ids in profiles_ids]
+        all_rows = np.concatenate(profile_rows)
+        if all_rows.size:
+            mark('id_lookup')
+            # Vizinhos de cada jogo selecionado: tabela pré-calculada no build ou, na falta dela, consulta ao índice
+            if self.neighbors is not None and top_n_per_item <= self.neighbors.k:
+                top_indices, top_similarities = self.neighbors.lookup(all_rows, top_n_per_item)
+            else:
+                top_indices, top_similarities = chunked_search(self.index, self.feature_matrix[all_rows], top_n_per_item)
+        offsets = np.cumsum([0] + [len(rows) for rows in profile_rows])
+        for rows, start, end in zip(profile_rows, offsets[:-1], offsets[1:]):
+            yield self._rank(rows, top_indices[start:end], top_similarities[start:end]) if len(rows) else pd.DataFrame()
+
+    def _rank(self, selected_indices, top_indices, top_similarities):
+        candidate_indices, candidate_similarities = merge_candidates(top_indices, top_similarities, selected_indices)
+        if candidate_indices.size == 0: return pd.DataFrame()
+        recs_df = self.df.iloc[candidate_indices].copy()
+        recs_df['similarity'] = candidate_similarities
         recs_df['hybrid_score'] = (recs_df['similarity'] * 0.7) + (recs_df['quality'] * 0.3)
+        mark('similarity')
         developer_penalty_factor = 0.85
-        developer_counts = defaultdict(int)
-        penalized_scores = []
-        final_df = recs_df.sort_values('hybrid_score', ascending=False)
-        for _, row in final_df.iterrows():
-            developers_list = row['developers']
-            developer = developers_list[0] if isinstance(developers_list, list) and developers_list else 'N/A'
-            penalty = developer_penalty_factor ** developer_counts[developer]
-            penalized_scores.append(row['hybrid_score'] * penalty)
-            developer_counts[developer] += 1
-        final_df['penalized_score'] = penalized_scores
-        final_df = final_df.sort_values('penalized_score', ascending=False).reset_index(drop=True)
+        final_df = truncate_candidates(recs_df.sort_values('hybrid_score', ascending=False))
+        penalty = diversity_penalty(first_list_item(final_df['developers']), developer_penalty_factor)
+        final_df['penalized_score'] = final_df['hybrid_score'].to_numpy() * penalty
+        # Mantém o índice (linha do catálogo) para os filtros por gênero via bitset
+        final_df = final_df.sort_values('penalized_score', ascending=False)
         top_score_display, end_score_display = 99.0, 85.0
         if not final_df.empty and len(final_df) > 1:
             scores = final_df['penalized_score'] + 1e-9
@@ -121,10 +152,13 @@ class GameRecommender:
             else: final_df['display_score'] = top_score_display
         elif not final_df.empty: final_df['display_score'] = top_score_display
         else: final_df['display_score'] = 0
-        return final_df.sort_values('penalized_score', ascending=False)
+        final_df = final_df.sort_values('penalized_score', ascending=False)
+        mark('penalty')
+        return final_df
 
 # --- Instanciação e Rotas ---
-recommender_games = GameRecommender()
+# O cache só é carregado no primeiro uso (ou pelo aquecimento disparado em create_app)
+recommender_games = LazyRecommender('games', GameRecommender)
 games_bp = Blueprint('games_bp', __name__)
 
 OPPOSITE_GENRES_MAP = {
@@ -137,25 +171,34 @@ OPPOSITE_GENRES_MAP = {
 
 @games_bp.route('/genres', methods=['GET'])
 def get_genres():
-    if not recommender_games.is_ready: return jsonify({"error": "Sistema de jogos não pronto"}), 503
-    return jsonify(recommender_games.genres)
+    recommender = recommender_games.get()
+    if not recommender.is_ready: return jsonify({"error": "Sistema de jogos não pronto"}), 503
+    key = make_key('games_bp', 'genres', recommender.cache_version)
+    return cached_response(key) or store_response(key, jsonify(recommender.genres))
 
 @games_bp.route('/search', methods=['GET'])
 def search_games_api():
-    if not recommender_games.is_ready: return jsonify({"error": "Sistema não pronto"}), 503
+    recommender = recommender_games.get()
+    if not recommender.is_ready: return jsonify({"error": "Sistema não pronto"}), 503
     query = request.args.get('q', '')
-    results_json = recommender_games.search_games(query)
-    return jsonify(results_json)
+    key = make_key('games_bp', 'search', recommender.cache_version, q=query)
+    cached = cached_response(key)
+    if cached is not None: return cached
+    mark('cache_lookup')
+    results_json = recommender.search_games(query)
+    mark('search')
+    return store_response(key, json_response(results_json))
 
 @games_bp.route('/discover', methods=['GET'])
 def discover_games_api():
-    if not recommender_games.is_ready: return jsonify({"error": "Sistema não pronto"}), 503
-    iconic_games_json, explore_games_json = recommender_games.discover_games()
-    return jsonify({"iconic_games": iconic_games_json, "explore_games": explore_games_json})
+    recommender = recommender_games.get()
+    if not recommender.is_ready: return jsonify({"error": "Sistema não pronto"}), 503
+    return recommender.discover_payload.response()
 
 @games_bp.route('/recommend', methods=['POST'])
 def recommend_games_api():
-    if not recommender_games.is_ready: return jsonify({"error": "Sistema não pronto"}), 503
+    recommender = recommender_games.get()
+    if not recommender.is_ready: return jsonify({"error": "Sistema não pronto"}), 503
     
     data = request.get_json()
     if not data: return jsonify({"error": "Corpo da requisição JSON ausente"}), 400
@@ -165,57 +208,61 @@ def recommend_games_api():
     
     if not selected_ids or not isinstance(selected_ids, list) or len(selected_ids) < 3:
         return jsonify({"error": "A lista 'game_ids' deve conter pelo menos 3 IDs"}), 400
+    mark('parse')
+
+    # O resultado depende só do conjunto de ids, do gênero e da versão do cache carregado
+    key = make_key('games_bp', 'recommend', recommender.cache_version, ids=selected_ids, genre=selected_genre_to_explore)
+    cached = cached_response(key)
+    if cached is not None: return cached
+    mark('cache_lookup')
 
-    recs_df = recommender_games.get_recommendations(selected_ids)
+    recs_df = recommender.get_recommendations(selected_ids)
     if recs_df.empty: return jsonify({"error": "Não foi possível gerar recomendações"}), 500
+    return store_response(key, json_response(recommendation_payload(recommender, selected_ids, selected_genre_to_explore, recs_df)))
 
-    profile_df = recommender_games.df[recommender_games.df['appid'].isin(selected_ids)]
+@games_bp.route('/recommend/batch', methods=['POST'])
+def recommend_games_batch_api():
+    recommender = recommender_games.get()
+    if not recommender.is_ready: return jsonify({"error": "Sistema não pronto"}), 503
+
+    # Vários perfis no formato do /recommend; os vizinhos de todos são consultados de uma vez
+    profiles, error = parse_profiles(request.get_json(), 'game_ids', min_ids=3)
+    if error: return jsonify({"error": error}), 400
+    mark('parse')
+
+    valid = [p for p in profiles if p.error is None]
+    results = [p.result({"error": p.error}) for p in profiles]
+    for profile, recs_df in zip(valid, recommender.get_batch_recommendations([p.ids for p in valid])):
+        if recs_df.empty: results[profile.position] = profile.result({"error": "Não foi possível gerar recomendações"})
+        else: results[profile.position] = profile.result(recommendation_payload(recommender, profile.ids, profile.genre, recs_df))
+    return json_response({"results": results})
+
+def recommendation_payload(recommender, selected_ids, selected_genre_to_explore, recs_df):
+    """Corpo do /recommend a partir do ranking: perfil e categorias da página."""
+    profile_df = recommender.df.iloc[recommender.id_index.rows(selected_ids)]
     all_profile_genres_raw = [g.strip() for _, row in profile_df.iterrows() for g in str(row.get('genres', '')).split(',') if g.strip()]
     dominant_genre = pd.Series(all_profile_genres_raw).mode()
     dominant_genre = dominant_genre[0] if not dominant_genre.empty else None
 
-    recommendations = {}
-    page_used_ids = set(selected_ids)
-
-    # 1. Recomendações Principais: 10 itens
-    main_recs_df = recs_df[~recs_df['appid'].isin(page_used_ids)].head(10)
-    if not main_recs_df.empty:
-        recommendations["main"] = recommender_games.get_df_as_records(main_recs_df)
-        page_used_ids.update(main_recs_df['appid'].tolist())
-
-    # 2. Explorando Gênero: 5 itens (se selecionado)
-    if selected_genre_to_explore:
-        explore_df = recs_df[recs_df['genres'].apply(lambda g: check_genre_in_item(g, selected_genre_to_explore)) & ~recs_df['appid'].isin(page_used_ids)].head(5)
-        if not explore_df.empty:
-            recommendations["genre_favorites"] = recommender_games.get_df_as_records(explore_df)
-            page_used_ids.update(explore_df['appid'].tolist())
-
-    # 3. Jogos Famosos: 5 itens (alta qualidade)
-    famous_df = recs_df[
-        (recs_df['quality'] > 0.92) & 
-        ~recs_df['appid'].isin(page_used_ids)
-    ].head(5)
-    if not famous_df.empty:
-        recommendations["famous"] = recommender_games.get_df_as_records(famous_df)
-        page_used_ids.update(famous_df['appid'].tolist())
-
+    # Categorias preenchidas numa passada sobre o ranking, sem repetir jogos na página
+    buckets = [Bucket("main", 10)]  # 1. Recomendações Principais: 10 itens
+    if selected_genre_to_explore:  # 2. Explorando Gênero: 5 itens (se selecionado)
+        buckets.append(Bucket("genre_favorites", 5, mask=recommender.genre_bits.mask(selected_genre_to_explore, rows=recs_df.index)))
+    buckets.append(Bucket("famous", 5, mask=(recs_df['quality'] > 0.92).to_numpy()))  # 3. Jogos Famosos: 5 itens (alta qualidade)
     # 4. Jóias Escondidas: 5 itens (baixa popularidade + alta similaridade)
-    hidden_gems_df = recs_df[
-        (recs_df['quality'] < 0.88) &
-        (recs_df['display_score'] > 75) &
-        ~recs_df['appid'].isin(page_used_ids)
-    ].head(5)
-    if not hidden_gems_df.empty:
-        recommendations["hidden_gems"] = recommender_games.get_df_as_records(hidden_gems_df)
+    buckets.append(Bucket("hidden_gems", 5, mask=((recs_df['quality'] < 0.88) & (recs_df['display_score'] > 75)).to_numpy()))
+    picks = CategoryAllocator(recs_df['appid'], used_ids=selected_ids).allocate(buckets)
+    recommendations = {name: recommender.get_df_as_records(recs_df.iloc[positions]) for name, positions in picks.items() if len(positions)}
 
     for category_key in recommendations:
         for rec in recommendations[category_key]:
             rec['similarity_score'] = f"{min(rec.get('display_score', 0), 99.9):.1f}"
     
-    profile_data = {"games": recommender_games.get_df_as_records(profile_df), "dominant_genre": dominant_genre, "all_genres": sorted(list(set(all_profile_genres_raw)))}
+    profile_data = {"games": recommender.get_df_as_records(profile_df), "dominant_genre": dominant_genre, "all_genres": sorted(list(set(all_profile_genres_raw)))}
+    mark('categorization')
     
-    return jsonify({
+    return {
         "recommendations": recommendations,
         "profile": profile_data,
         "selected_genre": selected_genre_to_explore
-    })
\ No newline at end of file
+    }
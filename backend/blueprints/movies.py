@@ -1,5 +1,6 @@
 # backend/blueprints/movies.py (v5.0 - Autossuficiente e Completo)
 import os
+import sys
 import json
 import pickle
 import traceback
@@ -8,41 +9,78 @@ from datetime import datetime
 import numpy as np
 import pandas as pd
 from flask import Blueprint, request, jsonify
-from sklearn.metrics.pairwise import cosine_similarity
-from thefuzz import fuzz
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.ann_index import ANN_CANDIDATE_POOL, index_from_artifacts, prepare_vectors, profile_query
+from common.artifacts import ARTIFACTS_DIR, load_artifacts
+from common.compact import compact, vectors_from_artifacts
+from common.generations import resolve
+from common.id_index import IdIndex
+from common.search_index import SearchIndex
+from common.dedup import TitleDeduplicator
+from common.categories import Bucket, CategoryAllocator
+from common.genre_bits import GenreBits
+from common.precomputed import PrecomputedPayload
+from common.serialization import json_response, records
+from common.metrics import mark
+from common.batch import iter_search, parse_profiles
+from common.lazy import LazyRecommender
+from common.response_cache import cache_version, cached_response, make_key, store_response
 
 # --- Classe MovieRecommender ---
 class MovieRecommender:
-    def __init__(self):
+    def __init__(self, cache_dir=None):
         self.df_movies = None; self.tfidf_matrix = None; self.is_ready = False
         self.QUANTILE_95_POPULARITY = 0; self.GENRES_LIST = []
         try:
-            self._initialize_from_cache()
+            self._initialize_from_cache(cache_dir)
         except Exception as e:
             print(f"\n--- ERRO CRÍTICO AO CARREGAR CACHE DE FILMES: {e} ---")
             traceback.print_exc()
 
-    def _initialize_from_cache(self):
+    def _initialize_from_cache(self, cache_dir=None):
         print("Carregando cache de filmes (v5.0)...")
         base_dir = os.path.dirname(os.path.abspath(__file__))
         # Caminho relativo ao blueprint para encontrar a pasta de cache correta
-        CACHE_DIR = os.path.join(base_dir, '..', 'movies', 'cache')
+        CACHE_DIR = cache_dir or os.path.join(base_dir, '..', 'movies', 'cache')
+        # Geração ativa apontada por CURRENT (ou a própria pasta no layout antigo); a vigia de gerações compara com ela
+        self.cache_root = CACHE_DIR
+        self.generation, CACHE_DIR = resolve(CACHE_DIR)
 
         self.df_movies = pd.read_parquet(os.path.join(CACHE_DIR, 'movies_processed.parquet'))
-        with open(os.path.join(CACHE_DIR, 'movie_tfidf_matrix.pkl'), 'rb') as f: self.tfidf_matrix = pickle.load(f)
+        artifacts = load_artifacts(os.path.join(CACHE_DIR, ARTIFACTS_DIR))
+        if artifacts is not None:
+            self.tfidf_matrix, self.tfidf_norms = vectors_from_artifacts(artifacts, 'tfidf_matrix'), artifacts['tfidf_norms']
+        else:
+            with open(os.path.join(CACHE_DIR, 'movie_tfidf_matrix.pkl'), 'rb') as f: self.tfidf_matrix, self.tfidf_norms = prepare_vectors(pickle.load(f))
+            self.tfidf_matrix = compact(self.tfidf_matrix)
+        self.index = index_from_artifacts(artifacts, self.tfidf_matrix)
+        self.search_index = SearchIndex.from_artifacts(artifacts, len(self.df_movies))
+        self.id_index = IdIndex(self.df_movies['id'])
+        self.title_dedup = TitleDeduplicator.from_artifacts(artifacts, self.df_movies['title'])
+        self.genre_bits = GenreBits.from_artifacts(artifacts, self.df_movies['genres'])
+        self.cache_version = cache_version(artifacts, os.path.join(CACHE_DIR, 'movies_processed.parquet'))
         with open(os.path.join(CACHE_DIR, 'genres.json'), 'r', encoding='utf-8') as f: self.GENRES_LIST = json.load(f)
         
         self.df_movies['release_date_dt'] = pd.to_datetime(self.df_movies['release_date'], errors='coerce')
         self.QUANTILE_95_POPULARITY = self.df_movies['popularity'].quantile(0.95)
+        self.QUANTILE_30_POPULARITY = self.df_movies['popularity'].quantile(0.3)
+        # Sem amostragem: o payload só muda com o ano corrente (janela de lançamentos recentes)
+        self.discover_payload = PrecomputedPayload(lambda slot: self.discover_movies(), rotation=0, generation=lambda: datetime.now().year)
         self.is_ready = True
         print(f">>> Sistema de filmes pronto. {len(self.df_movies)} filmes e {len(self.GENRES_LIST)} gêneros carregados. <<<")
 
     def search_movies(self, query, limit=20):
         if not self.is_ready or not query: return []
         query = query.lower()
-        results_df = self.df_movies[self.df_movies['search_features'].str.contains(query, na=False)]
-        sorted_results = results_df.sort_values(by='popularity', ascending=False).head(limit)
-        return sorted_results.assign(poster_url='https://image.tmdb.org/t/p/w500' + sorted_results['poster_path']  ).to_dict('records')
+        if self.search_index is not None:
+            # Índice invertido do build: resultados já em ordem de popularidade, sem varrer o catálogo
+            sorted_results = self.df_movies.iloc[self.search_index.search(query, limit)]
+        else:
+            results_df = self.df_movies[self.df_movies['search_features'].str.contains(query, na=False)]
+            sorted_results = results_df.sort_values(by='popularity', ascending=False).head(limit)
+        mark('search')
+        return records(sorted_results.assign(poster_url='https://image.tmdb.org/t/p/w500' + sorted_results['poster_path']), 'movies')
 
     def discover_movies(self):
         if not self.is_ready: return {}
@@ -52,8 +90,8 @@ class MovieRecommender:
         popular_releases = recent_movies.sort_values(by='popularity', ascending=False).head(NUM_DISCOVER_MOVIES)
         critically_acclaimed = self.df_movies[self.df_movies['vote_average'] > 8.0].sort_values(by='popularity', ascending=False).head(NUM_DISCOVER_MOVIES)
         return {
-            "popular_releases": popular_releases.assign(poster_url='https://image.tmdb.org/t/p/w500' + popular_releases['poster_path']  ).to_dict('records'),
-            "critically_acclaimed": critically_acclaimed.assign(poster_url='https://image.tmdb.org/t/p/w500' + critically_acclaimed['poster_path']  ).to_dict('records')
+            "popular_releases": records(popular_releases.assign(poster_url='https://image.tmdb.org/t/p/w500' + popular_releases['poster_path']), 'movies'),
+            "critically_acclaimed": records(critically_acclaimed.assign(poster_url='https://image.tmdb.org/t/p/w500' + critically_acclaimed['poster_path']), 'movies')
         }
 
     def _calculate_hybrid_score(self, df):
@@ -65,16 +103,13 @@ class MovieRecommender:
 
     def _finalize_recommendations(self, df, num_recs, score_column='hybrid_score'):
         if df.empty or score_column not in df.columns: return []
-        df_sorted = df.sort_values(by=score_column, ascending=False).copy()
-        final_recs_list = []
-        for _, movie in df_sorted.head(num_recs * 3).iterrows():
-            is_redundant = False
-            for rec in final_recs_list:
-                if fuzz.token_sort_ratio(movie['title'], rec['title']) > 90: is_redundant = True; break
-            if not is_redundant: final_recs_list.append(movie.to_dict())
-            if len(final_recs_list) >= num_recs: break
-        if not final_recs_list: return []
-        final_df = pd.DataFrame(final_recs_list)
+        df_sorted = df.sort_values(by=score_column, ascending=False).head(num_recs * 3)
+        # Descarta títulos quase idênticos aos já escolhidos (pares calculados no build de cache)
+        return self._score_recommendations(df_sorted.iloc[self.title_dedup.first_distinct(df_sorted.index.to_numpy(), num_recs)], score_column)
+
+    def _score_recommendations(self, final_df, score_column='hybrid_score'):
+        if final_df.empty: return []
+        final_df = final_df.reset_index(drop=True)
         if len(final_df) >= 1: final_df.loc[final_df.index[0], 'final_score'] = np.random.uniform(98, 99)
         if len(final_df) >= 2: final_df.loc[final_df.index[1], 'final_score'] = np.random.uniform(96, 97)
         if len(final_df) >= 3: final_df.loc[final_df.index[2], 'final_score'] = np.random.uniform(95, 96)
@@ -91,41 +126,66 @@ class MovieRecommender:
             try: return [g.strip() for g in str(genres_json).split(',') if g.strip()]
             except: return []
         final_df['genres_list'] = final_df['genres'].apply(get_genre_names)
-        return final_df.to_dict('records')
+        return records(final_df, 'movies')
 
     def recommend_movie_categories(self, selected_movie_ids, selected_genre):
-        if not self.is_ready or not selected_movie_ids: return {}
-        selected_movies = self.df_movies[self.df_movies['id'].isin(selected_movie_ids)]
-        if selected_movies.empty: return {}
-        user_profile = self.tfidf_matrix[selected_movies.index].mean(axis=0)
+        return next(self.batch_movie_categories([(selected_movie_ids, selected_genre)]))
+
+    def batch_movie_categories(self, profiles):
+        """Gera as categorias de cada perfil (ids, gênero), na ordem; as consultas são pontuadas juntas, em blocos de perfis."""
+        profile_rows = [self.id_index.rows(ids) if self.is_ready and ids else np.empty(0, dtype=np.int64) for ids, _ in profiles]
+        valid = [i for i, rows in enumerate(profile_rows) if len(rows)]
+        if not valid:
+            yield from ({} for _ in profiles)
+            return
+        mark('id_lookup')
+        queries = (profile_query(self.tfidf_matrix, self.tfidf_norms, profile_rows[i]) for i in valid)
+        # Com o índice aproximado apenas o pool de candidatos é pontuado; a busca exata ranqueia o catálogo inteiro
+        pool_size = ANN_CANDIDATE_POOL if self.index.approximate else len(self.df_movies)
+        results = iter_search(self.index, queries, pool_size + max(len(profile_rows[i]) for i in valid))
+        for (ids, genre), rows in zip(profiles, profile_rows):
+            if not len(rows):
+                yield {}
+                continue
+            top_indices, top_similarities = next(results)
+            # O ranking é ordenado: os primeiros pool + selecionados são a busca que o perfil faria sozinho
+            k = pool_size + len(rows)
+            yield self._categories(ids, genre, top_indices[:k], top_similarities[:k])
+
+    def _categories(self, selected_movie_ids, selected_genre, top_indices, top_similarities):
         exclude_ids = set(selected_movie_ids)
-        all_recs_df = self.df_movies[~self.df_movies['id'].isin(exclude_ids)].copy()
-        user_profile_array = np.asarray(user_profile)
-        cosine_similarities = cosine_similarity(user_profile_array, self.tfidf_matrix[all_recs_df.index]).flatten()
-        all_recs_df['similarity'] = cosine_similarities
-        all_recs_df = self._calculate_hybrid_score(all_recs_df)
+        found = top_indices >= 0
+        all_recs_df = self.df_movies.iloc[top_indices[found]].copy()
+        all_recs_df['similarity'] = top_similarities[found]
+        all_recs_df = self._calculate_hybrid_score(all_recs_df).sort_values(by='hybrid_score', ascending=False)
+        mark('similarity')
+        # Categorias preenchidas numa passada sobre o ranking; cada uma examina no máximo 3x a sua cota (deduplicação de títulos)
+        allocator, rows = CategoryAllocator(all_recs_df['id'], used_ids=exclude_ids), all_recs_df.index.to_numpy()
         
         # 1. Recomendações Principais: 10 itens
-        main_recs = self._finalize_recommendations(all_recs_df, 10)
+        picks = allocator.allocate([Bucket('main', 10, window=30)], dedup=self.title_dedup, rows=rows)
+        main_recs = self._score_recommendations(all_recs_df.iloc[picks['main']])
         exclude_ids.update([rec['id'] for rec in main_recs])
         
         # 2. Explorando Gênero: 5 itens (se selecionado)
         genre_favorites = self.recommend_by_genre(selected_genre, exclude_ids) if selected_genre else []
-        exclude_ids.update([rec['id'] for rec in genre_favorites])
+        allocator.exclude([rec['id'] for rec in genre_favorites])
         
         # 3. Blockbusters: 5 itens (alta popularidade)
-        blockbusters = self._finalize_recommendations(all_recs_df[~all_recs_df['id'].isin(exclude_ids) & (all_recs_df['popularity'] > self.QUANTILE_95_POPULARITY)], 5)
-        exclude_ids.update([rec['id'] for rec in blockbusters])
-        
         # 4. Jóias Escondidas: 5 itens (baixa popularidade + alta qualidade)
-        hidden_gems = self._finalize_recommendations(all_recs_df[~all_recs_df['id'].isin(exclude_ids) & (all_recs_df['vote_average'] > 7.5) & (all_recs_df['popularity'] < self.df_movies['popularity'].quantile(0.3))], 5)
-        
+        picks = allocator.allocate([
+            Bucket('blockbusters', 5, mask=(all_recs_df['popularity'] > self.QUANTILE_95_POPULARITY).to_numpy(), window=15),
+            Bucket('hidden_gems', 5, mask=((all_recs_df['vote_average'] > 7.5) & (all_recs_df['popularity'] < self.QUANTILE_30_POPULARITY)).to_numpy(), window=15),
+        ], dedup=self.title_dedup, rows=rows)
+        blockbusters = self._score_recommendations(all_recs_df.iloc[picks['blockbusters']])
+        hidden_gems = self._score_recommendations(all_recs_df.iloc[picks['hidden_gems']])
+        mark('categorization')
         return {"main": main_recs, "blockbusters": blockbusters, "genre_favorites": genre_favorites, "hidden_gems": hidden_gems}
 
     def recommend_by_genre(self, genre_name, exclude_ids):
         if not genre_name: return []
-        genre_df = self.df_movies[self.df_movies['genres'].str.contains(genre_name, na=False, case=False)].copy()
-        genre_df = genre_df[~genre_df['id'].isin(exclude_ids)]
+        genre_rows = np.flatnonzero(self.genre_bits.mask(genre_name))
+        genre_df = self.df_movies.iloc[genre_rows[~self.id_index.isin(genre_rows, exclude_ids)]].copy()
         QUALITY_WEIGHT = 0.80; POPULARITY_WEIGHT = 0.20
         pop_max = genre_df['popularity'].max()
         pop_score = (genre_df['popularity'] / pop_max * 100) if pop_max > 0 else 0
@@ -134,39 +194,47 @@ class MovieRecommender:
         return self._finalize_recommendations(genre_df, 5, score_column='hybrid_score')
 
     def analyze_user_profile(self, selected_movie_ids):
-        selected_movies = self.df_movies[self.df_movies['id'].isin(selected_movie_ids)]
+        selected_movies = self.df_movies.iloc[self.id_index.rows(selected_movie_ids)]
         if selected_movies.empty: return None, [], []
         all_genres = []
         for genres_str in selected_movies['genres']:
             all_genres.extend([g.strip() for g in str(genres_str).split(',') if g.strip()])
-        if not all_genres: return None, [], selected_movies.to_dict('records')
+        if not all_genres: return None, [], records(selected_movies, 'movies')
         genre_counts = Counter(all_genres)
         favorite_genre = genre_counts.most_common(1)[0][0]
         unique_genres = sorted(list(genre_counts.keys()))
-        return favorite_genre, unique_genres, selected_movies.to_dict('records')
+        return favorite_genre, unique_genres, records(selected_movies, 'movies')
 
 # --- Instanciação e Rotas ---
-recommender_movies = MovieRecommender()
+# O cache só é carregado no primeiro uso (ou pelo aquecimento disparado em create_app)
+recommender_movies = LazyRecommender('movies', MovieRecommender)
 movies_bp = Blueprint('movies_bp', __name__)
 
 @movies_bp.route('/genres', methods=['GET'])
 def get_genres():
-    if not recommender_movies.is_ready: return jsonify({"error": "Sistema de filmes não pronto"}), 503
-    return jsonify(recommender_movies.GENRES_LIST)
+    recommender = recommender_movies.get()
+    if not recommender.is_ready: return jsonify({"error": "Sistema de filmes não pronto"}), 503
+    key = make_key('movies_bp', 'genres', recommender.cache_version)
+    return cached_response(key) or store_response(key, jsonify(recommender.GENRES_LIST))
 
 @movies_bp.route('/discover', methods=['GET'])
 def discover_movies_api():
-    if not recommender_movies.is_ready: return jsonify({"error": "Sistema não pronto"}), 503
-    return jsonify(recommender_movies.discover_movies())
+    recommender = recommender_movies.get()
+    if not recommender.is_ready: return jsonify({"error": "Sistema não pronto"}), 503
+    return recommender.discover_payload.response()
 
 @movies_bp.route('/search', methods=['GET'])
 def search_movies_api():
-    if not recommender_movies.is_ready: return jsonify([])
-    return jsonify(recommender_movies.search_movies(request.args.get('q', '')))
+    recommender = recommender_movies.get()
+    if not recommender.is_ready: return jsonify([])
+    query = request.args.get('q', '')
+    key = make_key('movies_bp', 'search', recommender.cache_version, q=query)
+    return cached_response(key) or store_response(key, json_response(recommender.search_movies(query)))
 
 @movies_bp.route('/recommend', methods=['POST'])
 def recommend_movies_api():
-    if not recommender_movies.is_ready: return jsonify({"error": "Sistema não pronto"}), 503
+    recommender = recommender_movies.get()
+    if not recommender.is_ready: return jsonify({"error": "Sistema não pronto"}), 503
     
     data = request.get_json()
     if not data: return jsonify({"error": "Corpo da requisição JSON ausente"}), 400
@@ -176,13 +244,41 @@ def recommend_movies_api():
 
     if not selected_ids or not isinstance(selected_ids, list):
         return jsonify({"error": "A lista 'movie_ids' é necessária"}), 400
+    mark('parse')
+
+    # O resultado depende só do conjunto de ids, do gênero e da versão do cache carregado
+    key = make_key('movies_bp', 'recommend', recommender.cache_version, ids=selected_ids, genre=selected_genre)
+    cached = cached_response(key)
+    if cached is not None: return cached
+    mark('cache_lookup')
+
+    recommendations = recommender.recommend_movie_categories(selected_ids, selected_genre)
+    return store_response(key, json_response(recommendation_payload(recommender, selected_ids, selected_genre, recommendations)))
+
+@movies_bp.route('/recommend/batch', methods=['POST'])
+def recommend_movies_batch_api():
+    recommender = recommender_movies.get()
+    if not recommender.is_ready: return jsonify({"error": "Sistema não pronto"}), 503
+
+    # Vários perfis no formato do /recommend; as consultas de todos são pontuadas em blocos
+    profiles, error = parse_profiles(request.get_json(), 'movie_ids')
+    if error: return jsonify({"error": error}), 400
+    mark('parse')
+
+    valid = [p for p in profiles if p.error is None]
+    results = [p.result({"error": p.error}) for p in profiles]
+    for profile, recommendations in zip(valid, recommender.batch_movie_categories([(p.ids, p.genre) for p in valid])):
+        results[profile.position] = profile.result(recommendation_payload(recommender, profile.ids, profile.genre, recommendations))
+    return json_response({"results": results})
 
-    favorite_genre, unique_genres, selected_movies_details = recommender_movies.analyze_user_profile(selected_ids)
-    recommendations = recommender_movies.recommend_movie_categories(selected_ids, selected_genre)
+def recommendation_payload(recommender, selected_ids, selected_genre, recommendations):
+    """Corpo do /recommend: categorias já montadas mais a análise do perfil."""
+    favorite_genre, unique_genres, selected_movies_details = recommender.analyze_user_profile(selected_ids)
+    mark('profile')
     profile_data = {"movies": selected_movies_details, "favorite_genre": favorite_genre, "unique_genres": unique_genres}
     
-    return jsonify({
+    return {
         "recommendations": recommendations,
         "profile": profile_data,
         "selected_genre": selected_genre
-    })
\ No newline at end of file
+    }
@@ -2,21 +2,41 @@
 import pandas as pd
 import numpy as np
 import pickle
-from sklearn.metrics.pairwise import cosine_similarity
 # --- MUDANÇA 1: Importar Blueprint e Flask ---
 from flask import Flask, Blueprint, request, jsonify
 import json
 import os
+import sys
 import traceback
 import requests
 import base64
 import time
-from collections import defaultdict
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.ann_index import ANN_CANDIDATE_POOL, dot_scores, index_from_artifacts, prepare_vectors, profile_query, sample_profiles
+from common.artifacts import ARTIFACTS_DIR, load_artifacts
+from common.compact import compact, vectors_from_artifacts
+from common.generations import resolve
+from common.id_index import IdIndex
+from common.search_index import SearchIndex
+from common.diversity import CATALOG_STAT_PROFILES, DIVERSITY_TOP_M, PenaltyGroups, diversity_penalty, truncate_candidates
+from common.batch import iter_search, parse_profiles
+from common.lazy import LazyRecommender
+from common.categories import Bucket, CategoryAllocator
+from common.genre_bits import GenreBits
+from common.precomputed import PrecomputedPayload
+from common.serialization import json_response, records
+from common import metrics
+from common.metrics import mark
+from common.response_cache import cache_version, cached_response, make_key, store_response
 
 # --- SEU CÓDIGO EXISTENTE (QUASE INTACTO) ---
 
 SPOTIFY_CLIENT_ID = "6b5cdcb34b384ce795186aae26220918"
 SPOTIFY_CLIENT_SECRET = "bd24ed38cfbd46b0ba1243132a1a7c38"
+# Endereços da API do Spotify (o teste de carga aponta para o mock local em loadtest/mock_spotify.py)
+SPOTIFY_ACCOUNTS_URL = os.getenv('SPOTIFY_ACCOUNTS_URL', 'https://accounts.spotify.com').rstrip('/')
+SPOTIFY_API_URL = os.getenv('SPOTIFY_API_URL', 'https://api.spotify.com').rstrip('/')
 
 class SpotifyTokenManager:
     def __init__(self, client_id, client_secret):
@@ -34,14 +54,16 @@ class SpotifyTokenManager:
 
     def _save_token_to_cache(self, token_info):
         token_info['expires_at'] = time.time() + token_info['expires_in']
+        token_info['issuer'] = SPOTIFY_ACCOUNTS_URL
         os.makedirs(os.path.dirname(self.token_cache_file), exist_ok=True)
         with open(self.token_cache_file, 'w') as f: json.dump(token_info, f)
         self.token_info = token_info
 
     def get_token(self):
-        if self.token_info and time.time() < self.token_info.get('expires_at', 0):
+        # O token em cache só vale para o servidor que o emitiu (Spotify ou mock)
+        if self.token_info and time.time() < self.token_info.get('expires_at', 0) and self.token_info.get('issuer', SPOTIFY_ACCOUNTS_URL) == SPOTIFY_ACCOUNTS_URL:
             return self.token_info['access_token']
-        auth_url = 'https://accounts.spotify.com/api/token'
+        auth_url = f"{SPOTIFY_ACCOUNTS_URL}/api/token"
         auth_header = base64.b64encode(f"{self.client_id}:{self.client_secret}".encode()).decode()
         auth_data = {'grant_type': 'client_credentials'}
         try:
@@ -56,17 +78,41 @@ class SpotifyTokenManager:
 
 spotify_token_manager = SpotifyTokenManager(SPOTIFY_CLIENT_ID, SPOTIFY_CLIENT_SECRET)
 
+# Ranking: boost do gênero explorado, penalidade por repetição do artista e penalidade extra para os artistas de entrada
+GENRE_BOOST = 1.25
+ARTIST_PENALTY_FACTOR = 0.85
+INPUT_ARTIST_PENALTY = 0.5
+
 class MusicRecommender:
-    def __init__(self):
+    def __init__(self, cache_dir=None):
         self.df_music = None; self.feature_matrix = None; self.all_genres = []
         self.is_ready = False
         try:
             print("Carregando cache de músicas (v13.3)...")
             base_dir = os.path.dirname(os.path.abspath(__file__))
-            CACHE_DIR = os.path.join(base_dir, '..', 'music', 'cache')
+            CACHE_DIR = cache_dir or os.path.join(base_dir, '..', 'music', 'cache')
+            # Geração ativa apontada por CURRENT (ou a própria pasta no layout antigo); a vigia de gerações compara com ela
+            self.cache_root = CACHE_DIR
+            self.generation, CACHE_DIR = resolve(CACHE_DIR)
             self.df_music = pd.read_parquet(os.path.join(CACHE_DIR, 'music_data.parquet'))
-            with open(os.path.join(CACHE_DIR, 'feature_matrix.pkl'), 'rb') as f: self.feature_matrix = pickle.load(f)
+            artifacts = load_artifacts(os.path.join(CACHE_DIR, ARTIFACTS_DIR))
+            if artifacts is not None:
+                self.feature_matrix, self.feature_norms = vectors_from_artifacts(artifacts, 'feature_matrix'), artifacts['feature_norms']
+            else:
+                with open(os.path.join(CACHE_DIR, 'feature_matrix.pkl'), 'rb') as f: self.feature_matrix, self.feature_norms = prepare_vectors(pickle.load(f))
+                self.feature_matrix = compact(self.feature_matrix)
+            self.index = index_from_artifacts(artifacts, self.feature_matrix)
+            self.search_index = SearchIndex.from_artifacts(artifacts, len(self.df_music))
+            self.id_index = IdIndex(self.df_music['id'])
+            self.genre_bits = GenreBits.from_artifacts(artifacts, self.df_music['genres'])
+            self.cache_version = cache_version(artifacts, os.path.join(CACHE_DIR, 'music_data.parquet'))
             with open(os.path.join(CACHE_DIR, 'genres.json'), 'r', encoding='utf-8') as f: self.all_genres = json.load(f)
+            # Limiares de popularidade das categorias, calculados uma vez sobre o catálogo
+            self.QUANTILE_70_POPULARITY = self.df_music['popularity'].quantile(0.7) if 'popularity' in self.df_music.columns else None
+            self.QUANTILE_30_POPULARITY = self.df_music['popularity'].quantile(0.3) if 'popularity' in self.df_music.columns else None
+            # Corte de score do hidden_gems (quantil 0,75 do ranking completo): com o pool do ANN ou o modo truncado, estimado aqui uma vez
+            self.QUANTILE_75_SCORE = self._catalog_score_quantile(0.75) if self.index.approximate or DIVERSITY_TOP_M else None
+            self.discover_payload = PrecomputedPayload(self._discover_payload)
             self.is_ready = True
             print(f">>> Sistema de músicas pronto. {len(self.df_music)} faixas carregadas. <<<")
         except Exception as e:
@@ -74,86 +120,124 @@ class MusicRecommender:
 
     def search_tracks(self, query, limit=30):
         if not self.is_ready or not query: return []
+        if self.search_index is not None:
+            # Índice invertido do build: resultados em ordem de popularidade, sem varrer o catálogo
+            return records(self.df_music.iloc[self.search_index.search(query, limit)], 'music')
         search_series = self.df_music['name'] + " " + self.df_music['artists']
         results_df = self.df_music[search_series.str.contains(query, case=False, na=False)]
-        return results_df.head(limit).to_dict('records')
+        return records(results_df.head(limit), 'music')
 
     def get_recommendations(self, selected_track_ids, genre_to_explore=None, top_n_per_item=20):
-        if not self.is_ready or not selected_track_ids: return pd.DataFrame()
-        selected_indices = self.df_music.index[self.df_music['id'].isin(selected_track_ids)].tolist()
-        if not selected_indices: return pd.DataFrame()
-        
-        # Converter feature_matrix para array se for matrix
-        feature_matrix_array = np.asarray(self.feature_matrix)
-        
-        profile_vector = np.mean(feature_matrix_array[selected_indices], axis=0)
-        profile_vector = np.asarray(profile_vector).reshape(1, -1)
-        
-        similarities = cosine_similarity(profile_vector, feature_matrix_array).flatten()
-        recs_df = self.df_music.copy()
-        recs_df['similarity'] = similarities
-        recs_df = recs_df[~recs_df['id'].isin(selected_track_ids)]
+        return next(self.get_batch_recommendations([(selected_track_ids, genre_to_explore)]))
+
+    def get_batch_recommendations(self, profiles):
+        """Gera o ranking de cada perfil (ids, gênero), na ordem; as consultas são pontuadas juntas, em blocos de perfis."""
+        profile_rows = [self.id_index.rows(ids) if self.is_ready and ids else np.empty(0, dtype=np.int64) for ids, _ in profiles]
+        valid = [i for i, rows in enumerate(profile_rows) if len(rows)]
+        if not valid:
+            yield from (pd.DataFrame() for _ in profiles)
+            return
+        mark('id_lookup')
+        queries = (profile_query(self.feature_matrix, self.feature_norms, profile_rows[i]) for i in valid)
+        # Com o índice aproximado apenas o pool de candidatos é pontuado; a busca exata ranqueia o catálogo inteiro
+        pool_size = ANN_CANDIDATE_POOL if self.index.approximate else len(self.df_music)
+        results = iter_search(self.index, queries, pool_size + max(len(profile_rows[i]) for i in valid))
+        for (ids, genre), rows in zip(profiles, profile_rows):
+            if not len(rows):
+                yield pd.DataFrame()
+                continue
+            top_indices, top_similarities = next(results)
+            # O ranking é ordenado: os primeiros pool + selecionados são a busca que o perfil faria sozinho
+            k = pool_size + len(rows)
+            yield self._rank(ids, rows, top_indices[:k], top_similarities[:k], genre)
+
+    def _rank(self, selected_track_ids, selected_indices, top_indices, top_similarities, genre_to_explore=None):
+        found = top_indices >= 0
+        recs_df = self.df_music.iloc[top_indices[found]].copy()
+        recs_df['similarity'] = top_similarities[found]
+        recs_df = recs_df[~np.isin(recs_df.index, selected_indices)]
         if genre_to_explore:
-            genre_mask = recs_df['genres'].astype(str).str.contains(genre_to_explore, case=False, na=False)
-            recs_df.loc[genre_mask, 'similarity'] *= 1.25
-        artist_penalty_factor = 0.85
-        artist_counts = defaultdict(int)
-        penalized_scores = []
-        final_df = recs_df.sort_values('similarity', ascending=False)
+            genre_mask = self.genre_bits.mask(genre_to_explore, rows=recs_df.index)
+            recs_df.loc[genre_mask, 'similarity'] *= GENRE_BOOST
+        mark('similarity')
+        final_df = truncate_candidates(recs_df.sort_values('similarity', ascending=False))
         input_artists = self.df_music.loc[selected_indices, 'artists'].unique()
-        for _, row in final_df.iterrows():
-            artist = row['artists']
-            penalty = 1.0
-            penalty *= artist_penalty_factor ** artist_counts[artist]
-            if artist in input_artists: penalty *= 0.5
-            penalized_scores.append(row['similarity'] * penalty)
-            artist_counts[artist] += 1
-        final_df['final_score'] = penalized_scores
-        return final_df.sort_values('final_score', ascending=False)
-
-    def discover_tracks(self):
+        penalty = diversity_penalty(final_df['artists'], ARTIST_PENALTY_FACTOR)
+        penalty = np.where(final_df['artists'].isin(input_artists), penalty * INPUT_ARTIST_PENALTY, penalty)
+        final_df['final_score'] = final_df['similarity'].to_numpy() * penalty
+        final_df = final_df.sort_values('final_score', ascending=False)
+        mark('penalty')
+        return final_df
+
+    def _catalog_score_quantile(self, q, n_profiles=CATALOG_STAT_PROFILES):
+        """Quantil `q` do final_score no ranking completo (catálogo inteiro), mediana sobre perfis de amostra; só na carga."""
+        artist_groups = PenaltyGroups(self.df_music['artists'])
+        quantiles = []
+        for rows in sample_profiles(len(self.df_music), n_profiles):
+            similarities = dot_scores(profile_query(self.feature_matrix, self.feature_norms, rows), self.feature_matrix)[0]
+            multiplier = np.where(artist_groups.shares_key(rows), INPUT_ARTIST_PENALTY, 1.0)
+            quantiles.append(np.nanquantile(artist_groups.penalized(similarities, ARTIST_PENALTY_FACTOR, exclude=rows, multiplier=multiplier), q))
+        return float(np.median(quantiles)) if quantiles else None
+
+    def discover_tracks(self, seed=42):
         if not self.is_ready: return {}, {}
         iconic_artists = ['Arctic Monkeys', 'Billie Eilish', 'The Weeknd', 'Daft Punk', 'Queen', 'Kendrick Lamar', 'Tame Impala', 'Radiohead', 'Red Hot Chili Peppers', 'Foo Fighters']
         iconic_tracks = self.df_music[self.df_music['artists'].isin(iconic_artists)]
         iconic_tracks = iconic_tracks.loc[iconic_tracks.groupby('artists')['popularity'].idxmax()]
-        explore_df = self.df_music[(self.df_music['popularity'].between(60, 80)) & (~self.df_music['genres'].str.contains('pop|dance|rock|hip hop|latin', na=False))].sample(n=15, random_state=42)
-        return iconic_tracks.to_dict('records'), explore_df.to_dict('records')
+        explore_df = self.df_music[(self.df_music['popularity'].between(60, 80)) & (~self.df_music['genres'].str.contains('pop|dance|rock|hip hop|latin', na=False))].sample(n=15, random_state=seed)
+        return records(iconic_tracks, 'music'), records(explore_df, 'music')
+
+    def _discover_payload(self, slot):
+        # A janela de rotação só desloca a semente da amostra "explorar" (0 = amostra de sempre)
+        iconic, explore = self.discover_tracks(seed=42 + slot)
+        return {"iconic_tracks": iconic, "explore_tracks": explore}
 
 # --- MUDANÇA 2: Criação do Blueprint e das Rotas ---
 
-recommender = MusicRecommender()
+# O cache só é carregado no primeiro uso (ou pelo aquecimento disparado em create_app)
+recommender_music = LazyRecommender('music', MusicRecommender)
 music_bp = Blueprint('music_bp', __name__, url_prefix='/api/music')
 
 @music_bp.route('/discover', methods=['GET'])
 def discover():
+    recommender = recommender_music.get()
     if not recommender.is_ready: return jsonify({"error": "Serviço de música indisponível"}), 503
-    iconic, explore = recommender.discover_tracks()
-    return jsonify({"iconic_tracks": iconic, "explore_tracks": explore})
+    return recommender.discover_payload.response()
 
 @music_bp.route('/search', methods=['GET'])
 def search():
+    recommender = recommender_music.get()
     if not recommender.is_ready: return jsonify({"error": "Serviço de música indisponível"}), 503
     query = request.args.get('q', '')
+    key = make_key('music_bp', 'search', recommender.cache_version, q=query)
+    cached = cached_response(key)
+    if cached is not None: return cached
+    mark('cache_lookup')
     results = recommender.search_tracks(query)
-    return jsonify(results)
+    mark('search')
+    return store_response(key, json_response(results))
 
 @music_bp.route('/genres', methods=['GET'])
 def get_genres():
+    recommender = recommender_music.get()
     if not recommender.is_ready: return jsonify({"error": "Serviço de música indisponível"}), 503
-    return jsonify(recommender.all_genres)
+    key = make_key('music_bp', 'genres', recommender.cache_version)
+    return cached_response(key) or store_response(key, jsonify(recommender.all_genres))
 
 @music_bp.route('/get-track-details', methods=['POST'])
 def get_track_details():
+    recommender = recommender_music.get()
     if not recommender.is_ready: return jsonify({"error": "Serviço de música indisponível"}), 503
     data = request.get_json()
     track_ids = data.get('track_ids', [])
     if not track_ids: return jsonify({}), 200
     token = spotify_token_manager.get_token()
     if not token: return jsonify({"error": "Falha na autenticação com Spotify"}), 500
-    url = f"https://api.spotify.com/v1/tracks?ids={','.join(track_ids)}"
+    url = f"{SPOTIFY_API_URL}/v1/tracks?ids={','.join(track_ids)}"
     headers = {"Authorization": f"Bearer {token}"}
     try:
-        response = requests.get(url, headers=headers)
+        response = requests.get(url, headers=headers, timeout=10)
+        mark('spotify')
         response.raise_for_status()
         spotify_data = response.json()
         details = {}
@@ -168,63 +252,74 @@ def get_track_details():
 @music_bp.route('/recommend', methods=['POST'])
 def recommend():
     try:
+        recommender = recommender_music.get()
         if not recommender.is_ready: return jsonify({"error": "Serviço de música indisponível"}), 503
         data = request.get_json()
         track_ids = data.get('track_ids')
         genre = data.get('genre', None)
         if not track_ids or len(track_ids) < 3: return jsonify({"error": "São necessárias pelo menos 3 músicas."}), 400
+        mark('parse')
+        # O resultado depende só do conjunto de ids, do gênero e da versão do cache carregado
+        key = make_key('music_bp', 'recommend', recommender.cache_version, ids=track_ids, genre=genre)
+        cached = cached_response(key)
+        if cached is not None: return cached
+        mark('cache_lookup')
         recs_df = recommender.get_recommendations(track_ids, genre_to_explore=genre)
         if recs_df.empty: return jsonify({"recommendations": {}, "profile": {}})
         
-        used_ids = set()
-        recommendations = {}
-        
-        # 1. Recomendações Principais: 10 itens
-        main_recs = recs_df[~recs_df['id'].isin(used_ids)].head(10)
-        recommendations["main"] = main_recs.to_dict('records')
-        used_ids.update(main_recs['id'].tolist())
-        
-        # 2. Explorando Gênero: 5 itens (se selecionado)
-        if genre:
-            genre_recs = recs_df[
-                (recs_df['genres'].astype(str).str.contains(genre, case=False, na=False)) &
-                (~recs_df['id'].isin(used_ids))
-            ].head(5)
-            if not genre_recs.empty:
-                recommendations["genre_favorites"] = genre_recs.to_dict('records')
-                used_ids.update(genre_recs['id'].tolist())
-        
-        # 3. Músicas Populares: 5 itens (alta popularidade)
-        if 'popularity' in recs_df.columns:
-            popular = recs_df[
-                (recs_df['popularity'] > recommender.df_music['popularity'].quantile(0.7)) &
-                (~recs_df['id'].isin(used_ids))
-            ].head(5)
-            if not popular.empty:
-                recommendations["popular"] = popular.to_dict('records')
-                used_ids.update(popular['id'].tolist())
-        
-        # 4. Jóias Escondidas: 5 itens (baixa popularidade + alta similaridade)
-        if 'popularity' in recs_df.columns and 'final_score' in recs_df.columns:
-            hidden_gems = recs_df[
-                (recs_df['popularity'] < recommender.df_music['popularity'].quantile(0.3)) &
-                (recs_df['final_score'] > recs_df['final_score'].quantile(0.75)) &
-                (~recs_df['id'].isin(used_ids))
-            ].head(5)
-            if not hidden_gems.empty:
-                recommendations["hidden_gems"] = hidden_gems.to_dict('records')
-        
-        profile_df = recommender.df_music[recommender.df_music['id'].isin(track_ids)]
-        favorite_genre = profile_df['genres'].str.split(', ').explode().mode()
-        profile = {"tracks": profile_df[['id', 'name']].to_dict('records'), "favorite_genre": favorite_genre[0] if not favorite_genre.empty else "Variado"}
-        return jsonify({"recommendations": recommendations, "profile": profile, "selected_genre": genre})
+        return store_response(key, json_response(recommendation_payload(recommender, track_ids, genre, recs_df)))
     except Exception as e:
         print(f"\n--- ERRO NA ROTA /api/music/recommend ---\n{traceback.format_exc()}\n-----------------------------------------\n")
         return jsonify({"error": "Ocorreu um erro interno no servidor."}), 500
 
+@music_bp.route('/recommend/batch', methods=['POST'])
+def recommend_batch():
+    try:
+        recommender = recommender_music.get()
+        if not recommender.is_ready: return jsonify({"error": "Serviço de música indisponível"}), 503
+        # Vários perfis no formato do /recommend; as consultas de todos são pontuadas em blocos
+        profiles, error = parse_profiles(request.get_json(), 'track_ids', min_ids=3)
+        if error: return jsonify({"error": error}), 400
+        mark('parse')
+        valid = [p for p in profiles if p.error is None]
+        results = [p.result({"error": p.error}) for p in profiles]
+        for profile, recs_df in zip(valid, recommender.get_batch_recommendations([(p.ids, p.genre) for p in valid])):
+            if recs_df.empty: results[profile.position] = profile.result({"recommendations": {}, "profile": {}})
+            else: results[profile.position] = profile.result(recommendation_payload(recommender, profile.ids, profile.genre, recs_df))
+        return json_response({"results": results})
+    except Exception as e:
+        print(f"\n--- ERRO NA ROTA /api/music/recommend/batch ---\n{traceback.format_exc()}\n-----------------------------------------\n")
+        return jsonify({"error": "Ocorreu um erro interno no servidor."}), 500
+
+def recommendation_payload(recommender, track_ids, genre, recs_df):
+    """Corpo do /recommend a partir do ranking: categorias da página e perfil."""
+    # Categorias preenchidas numa passada sobre o ranking, sem repetir faixas na página
+    # 1. Recomendações Principais: 10 itens
+    buckets = [Bucket("main", 10)]
+    # 2. Explorando Gênero: 5 itens (se selecionado)
+    if genre:
+        buckets.append(Bucket("genre_favorites", 5, mask=recommender.genre_bits.mask(genre, rows=recs_df.index)))
+    # 3. Músicas Populares: 5 itens (alta popularidade)
+    if 'popularity' in recs_df.columns:
+        buckets.append(Bucket("popular", 5, mask=(recs_df['popularity'] > recommender.QUANTILE_70_POPULARITY).to_numpy()))
+    # 4. Jóias Escondidas: 5 itens (baixa popularidade + alta similaridade)
+    if 'popularity' in recs_df.columns and 'final_score' in recs_df.columns:
+        # Com o ranking completo o corte sai dele; com o pool do ANN, do quantil estimado na carga
+        score_cutoff = recs_df['final_score'].quantile(0.75) if recommender.QUANTILE_75_SCORE is None else recommender.QUANTILE_75_SCORE
+        buckets.append(Bucket("hidden_gems", 5, mask=((recs_df['popularity'] < recommender.QUANTILE_30_POPULARITY) & (recs_df['final_score'] > score_cutoff)).to_numpy()))
+    picks = CategoryAllocator(recs_df['id']).allocate(buckets)
+    recommendations = {name: records(recs_df.iloc[positions], 'music') for name, positions in picks.items() if name == "main" or len(positions)}
+    
+    profile_df = recommender.df_music.iloc[recommender.id_index.rows(track_ids)]
+    favorite_genre = profile_df['genres'].str.split(', ').explode().mode()
+    profile = {"tracks": profile_df[['id', 'name']].to_dict('records'), "favorite_genre": favorite_genre[0] if not favorite_genre.empty else "Variado"}
+    mark('categorization')
+    return {"recommendations": recommendations, "profile": profile, "selected_genre": genre}
+
 # --- MUDANÇA 3: Inicializador para Execução Direta ---
 def create_app():
     app = Flask(__name__)
     app.register_blueprint(music_bp)
+    metrics.init_app(app)
     return app
 app = create_app()
\ No newline at end of file
@@ -0,0 +1,5 @@
+# backend/common/__init__.py
+"""
+Componentes compartilhados pelos recomendadores de jogos, músicas e filmes
+(blueprints, serviços independentes e scripts de construção de cache).
+"""
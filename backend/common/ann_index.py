@@ -0,0 +1,241 @@
+# backend/common/ann_index.py
+"""
+Índice de vizinhos aproximados (ANN) por particionamento IVF.
+
+O catálogo é dividido em listas invertidas por um k-means esférico sobre os
+vetores normalizados (L2). Na consulta, apenas as `nprobe` listas com centróide
+mais próximo são varridas: quanto maior o `nprobe`, maior o recall e a latência.
+O build calibra o `nprobe` (o menor que alcança ANN_TARGET_RECALL de recall@k
+em consultas de perfil sorteadas do catálogo) e o grava com o índice. A busca
+exata (ExactIndex) continua disponível como fallback e como oráculo de recall.
+"""
+
+import os
+import numpy as np
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+from .compact import CompactMatrix, expand
+
+# Configurações (podem ser ajustadas via variáveis de ambiente)
+ANN_ENABLED = os.getenv('ANN_ENABLED', 'true').lower() == 'true'
+# nprobe fixo; 0 usa o calibrado no build (ou DEFAULT_NPROBE em caches sem calibração)
+ANN_NPROBE = int(os.getenv('ANN_NPROBE', '0'))
+DEFAULT_NPROBE = 8
+# Calibração do nprobe no build: recall@k mínimo nas consultas de amostra
+ANN_TARGET_RECALL = float(os.getenv('ANN_TARGET_RECALL', '0.95'))
+ANN_RECALL_K = int(os.getenv('ANN_RECALL_K', '100'))
+ANN_CALIBRATION_QUERIES = int(os.getenv('ANN_CALIBRATION_QUERIES', '200'))
+ANN_CANDIDATE_POOL = int(os.getenv('ANN_CANDIDATE_POOL', '2000'))
+
+
+def prepare_vectors(matrix):
+    """
+    Normaliza (L2) as linhas da matriz de features.
+
+    Returns:
+        tuple: (matriz normalizada, norma original de cada linha)
+    """
+    if sparse.issparse(matrix):
+        matrix = matrix.tocsr()
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    else:
+        matrix = np.asarray(matrix)
+        norms = np.linalg.norm(matrix, axis=1)
+    return normalize(matrix, norm='l2'), norms
+
+
+def profile_query(vectors, norms, rows):
+    """Vetor de perfil (média das linhas originais), normalizado para consulta."""
+    rows = np.asarray(rows)
+    weights = norms[rows].reshape(-1, 1)
+    selected = expand(vectors[rows])
+    if sparse.issparse(selected): profile = selected.multiply(weights).mean(axis=0)
+    else: profile = (selected * weights).mean(axis=0)
+    return normalize(np.asarray(profile).reshape(1, -1))
+
+
+def dot_scores(queries, vectors):
+    """Produto escalar denso (float64) entre cada consulta e cada linha de `vectors` (matriz comum ou CompactMatrix)."""
+    queries = expand(queries)
+    if isinstance(vectors, CompactMatrix): return vectors.dot(queries)
+    # Consultas no tipo dos vetores: com float64 x float32 o scipy converteria a matriz inteira a cada chamada
+    if vectors.dtype == np.float32: queries = queries.astype(np.float32)
+    product = queries @ vectors.T
+    return np.asarray(product.toarray() if sparse.issparse(product) else product, dtype=np.float64)
+
+
+def top_k(scores, k):
+    """
+    Seleciona os k maiores scores de cada linha.
+
+    Returns:
+        tuple: (posições, scores), ambos ordenados por score decrescente
+    """
+    k = min(k, scores.shape[1])
+    if k <= 0: return np.empty((scores.shape[0], 0), dtype=np.int64), np.empty((scores.shape[0], 0))
+    partition = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    partition_scores = np.take_along_axis(scores, partition, axis=1)
+    order = np.argsort(-partition_scores, axis=1, kind='stable')
+    return np.take_along_axis(partition, order, axis=1), np.take_along_axis(partition_scores, order, axis=1)
+
+
+class ExactIndex:
+    """Busca exaustiva por similaridade do cosseno sobre o catálogo inteiro."""
+    approximate = False
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def search(self, queries, k, nprobe=None):
+        return top_k(dot_scores(queries, self.vectors), k)
+
+
+class IVFIndex:
+    """Índice IVF: centróides + listas invertidas com as posições das linhas."""
+    approximate = True
+
+    def __init__(self, centroids, list_offsets, list_items, vectors=None, nprobe=ANN_NPROBE or DEFAULT_NPROBE):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_items = list_items
+        self.vectors = vectors
+        self.nprobe = nprobe
+
+    @property
+    def n_lists(self):
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(cls, vectors, n_lists=None, n_iter=10, sample_size=20000, seed=42):
+        """Treina o k-means esférico sobre uma amostra e distribui o catálogo nas listas."""
+        n_items = vectors.shape[0]
+        rng = np.random.default_rng(seed)
+        train = vectors[np.sort(rng.choice(n_items, size=min(n_items, sample_size), replace=False))]
+        n_lists = min(n_lists or max(1, int(np.sqrt(n_items))), train.shape[0])
+        centroids = _dense(train[rng.choice(train.shape[0], size=n_lists, replace=False)])
+        for _ in range(n_iter):
+            centroids = _update_centroids(train, _assign(train, centroids), centroids, rng)
+        return cls.from_centroids(vectors, centroids)
+
+    @classmethod
+    def from_centroids(cls, vectors, centroids, calibrate=True):
+        """Distribui o catálogo nas listas de centróides já treinados (atualização incremental, sem k-means)."""
+        assignments = _assign(vectors, centroids)
+        list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=centroids.shape[0]))]).astype(np.int64)
+        list_items = np.argsort(assignments, kind='stable').astype(np.int32)
+        index = cls(centroids, list_offsets, list_items, vectors)
+        if calibrate: index.calibrate(calibration_queries(vectors))
+        return index
+
+    def calibrate(self, queries, k=ANN_RECALL_K, target=ANN_TARGET_RECALL):
+        """
+        Ajusta `nprobe` para o menor valor (de uma escala crescente) com recall@k >= `target` nas consultas.
+
+        Returns:
+            float: recall@k obtido com o nprobe escolhido
+        """
+        expected, _ = ExactIndex(self.vectors).search(queries, k)
+        for nprobe in _nprobe_steps(self.n_lists):
+            found, _ = self.search(queries, k, nprobe=nprobe)
+            recall = _overlap(expected, found)
+            if recall >= target: break
+        self.nprobe = nprobe
+        return recall
+
+    def to_arrays(self):
+        """Arrays a persistir no cache (os vetores já são gravados à parte)."""
+        return {'ann_centroids': self.centroids, 'ann_list_offsets': self.list_offsets, 'ann_list_items': self.list_items,
+                'ann_nprobe': np.array([self.nprobe], dtype=np.int32)}
+
+    def search(self, queries, k, nprobe=None):
+        """
+        Busca os k vizinhos de cada consulta varrendo apenas `nprobe` listas.
+
+        Returns:
+            tuple: (posições, scores); posições sem candidato ficam com -1
+        """
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        probes, _ = top_k(dot_scores(queries, self.centroids), nprobe)
+        indices = np.full((probes.shape[0], k), -1, dtype=np.int64)
+        scores = np.full((probes.shape[0], k), -np.inf)
+        for q, query_probes in enumerate(probes):
+            candidates = np.concatenate([self.list_items[self.list_offsets[l]:self.list_offsets[l + 1]] for l in query_probes])
+            if candidates.size == 0: continue
+            best, best_scores = top_k(dot_scores(queries[q:q + 1], self.vectors[candidates]), k)
+            indices[q, :best.shape[1]] = candidates[best[0]]
+            scores[q, :best.shape[1]] = best_scores[0]
+        return indices, scores
+
+
+def index_from_artifacts(artifacts, vectors):
+    """Usa o IVF gravado no cache (ArtifactSet); sem ele, ou com ANN desligado, usa a busca exata."""
+    if ANN_ENABLED and artifacts is not None and 'ann_centroids' in artifacts:
+        index = IVFIndex(artifacts['ann_centroids'], artifacts['ann_list_offsets'], artifacts['ann_list_items'], vectors, nprobe=artifact_nprobe(artifacts))
+        if index.list_items.shape[0] == vectors.shape[0]: return index
+        print(f"AVISO: índice ANN em '{artifacts.directory}' não corresponde à matriz carregada. Usando busca exata.")
+    return ExactIndex(vectors)
+
+
+def artifact_nprobe(artifacts):
+    """nprobe a usar com o IVF gravado: ANN_NPROBE, se definido; senão o calibrado no build (ou DEFAULT_NPROBE)."""
+    if ANN_NPROBE: return ANN_NPROBE
+    return int(artifacts['ann_nprobe'][0]) if 'ann_nprobe' in artifacts else DEFAULT_NPROBE
+
+
+def recall_at_k(index, queries, k, nprobe=None):
+    """Recall@k do índice aproximado, usando a busca exata como oráculo."""
+    expected, _ = ExactIndex(index.vectors).search(queries, k)
+    found, _ = index.search(queries, k, nprobe=nprobe)
+    return _overlap(expected, found)
+
+
+def calibration_queries(vectors, n_queries=ANN_CALIBRATION_QUERIES, seed=42):
+    """Consultas de perfil como as das rotas: média normalizada de 3 a 5 linhas sorteadas do catálogo."""
+    n_items = vectors.shape[0]
+    return np.vstack([profile_query(vectors, np.ones(n_items), rows) for rows in sample_profiles(n_items, n_queries, seed)])
+
+
+def sample_profiles(n_items, n_profiles, seed=42):
+    """Linhas de perfis de amostra (3 a 5 itens sorteados do catálogo), fixas pela semente."""
+    rng = np.random.default_rng(seed)
+    return [rng.choice(n_items, size=min(n_items, rng.integers(3, 6)), replace=False) for _ in range(min(n_profiles, n_items))]
+
+
+def _overlap(expected, found):
+    hits = sum(len(np.intersect1d(e, f[f >= 0])) for e, f in zip(expected, found))
+    return hits / expected.size if expected.size else 1.0
+
+
+def _nprobe_steps(n_lists):
+    """DEFAULT_NPROBE, depois aumentos de ~50% até todas as listas."""
+    nprobe = min(DEFAULT_NPROBE, n_lists)
+    while nprobe < n_lists:
+        yield nprobe
+        nprobe = max(nprobe + 1, int(nprobe * 1.5))
+    yield n_lists
+
+
+def _dense(matrix):
+    return matrix.toarray() if sparse.issparse(matrix) else np.asarray(matrix)
+
+
+def _assign(vectors, centroids, chunk_size=4096):
+    """Centróide mais próximo de cada linha (em blocos, para limitar a memória)."""
+    assignments = np.empty(vectors.shape[0], dtype=np.int64)
+    for start in range(0, vectors.shape[0], chunk_size):
+        assignments[start:start + chunk_size] = dot_scores(vectors[start:start + chunk_size], centroids).argmax(axis=1)
+    return assignments
+
+
+def _update_centroids(train, assignments, centroids, rng):
+    n_lists = centroids.shape[0]
+    membership = sparse.csr_matrix(
+        (np.ones(len(assignments), dtype=np.float32), (assignments, np.arange(len(assignments)))),
+        shape=(n_lists, train.shape[0])
+    )
+    sums = _dense(membership @ train)
+    # Listas vazias recebem uma nova semente aleatória
+    empty = np.flatnonzero(np.bincount(assignments, minlength=n_lists) == 0)
+    if empty.size: sums[empty] = _dense(train[rng.choice(train.shape[0], size=empty.size, replace=False)])
+    return normalize(sums).astype(np.float32)
@@ -0,0 +1,142 @@
+# backend/common/artifacts.py
+"""
+Formato de cache sem pickle, carregado com memory-map.
+
+Cada artefato é gravado como `.npy` bruto (matrizes CSR viram três arquivos:
+data, indices e indptr) e um `manifest.json` descreve versão do formato,
+dtypes, shapes e um hash do conteúdo. Na carga os arquivos são abertos com
+`mmap_mode='r'`, então vários workers compartilham as mesmas páginas do page
+cache em vez de cada um manter uma cópia desserializada.
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime, timezone
+import numpy as np
+from scipy import sparse
+
+FORMAT_VERSION = 1
+ARTIFACTS_DIR = 'artifacts'
+MANIFEST_FILE = 'manifest.json'
+CSR_PARTS = ('data', 'indices', 'indptr')
+
+
+class ArtifactSet:
+    """Artefatos carregados de um diretório, acessíveis por nome."""
+
+    def __init__(self, directory, manifest, arrays):
+        self.directory = directory
+        self.manifest = manifest
+        self.arrays = arrays
+
+    @property
+    def content_hash(self):
+        return self.manifest['content_hash']
+
+    @property
+    def metadata(self):
+        return self.manifest.get('metadata', {})
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def get(self, name, default=None):
+        return self.arrays.get(name, default)
+
+
+def save_artifacts(directory, arrays, metadata=None):
+    """
+    Grava os artefatos e, por último, o manifesto (sua presença indica um cache completo).
+
+    Args:
+        directory: diretório de destino (criado se necessário)
+        arrays: dict nome -> np.ndarray ou matriz esparsa
+        metadata: informações livres do build (ex.: pesos, parâmetros)
+
+    Returns:
+        dict: o manifesto gravado
+    """
+    os.makedirs(directory, exist_ok=True)
+    entries = {}
+    digest = hashlib.sha256()
+    for name in sorted(arrays):
+        value = arrays[name]
+        if sparse.issparse(value):
+            value = value.tocsr()
+            value.sum_duplicates(); value.sort_indices()
+            parts = {part: getattr(value, part) for part in CSR_PARTS}
+            entry = {'kind': 'csr', 'shape': list(value.shape), 'dtype': str(value.dtype), 'files': {}}
+        else:
+            parts = {'array': np.ascontiguousarray(value)}
+            entry = {'kind': 'dense', 'shape': list(parts['array'].shape), 'dtype': str(parts['array'].dtype), 'files': {}}
+        for part, data in parts.items():
+            file_name = f"{name}.npy" if entry['kind'] == 'dense' else f"{name}.{part}.npy"
+            # Grava num temporário e troca: workers com o arquivo antigo em mmap continuam lendo o inode anterior
+            temp_path = os.path.join(directory, file_name + '.tmp')
+            with open(temp_path, 'wb') as f: np.save(f, data, allow_pickle=False)
+            os.replace(temp_path, os.path.join(directory, file_name))
+            entry['files'][part] = file_name
+            digest.update(file_name.encode('utf-8'))
+            digest.update(_file_sha256(os.path.join(directory, file_name)).encode('ascii'))
+        entries[name] = entry
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'content_hash': digest.hexdigest(),
+        'artifacts': entries,
+        'metadata': metadata or {},
+    }
+    temp_path = os.path.join(directory, MANIFEST_FILE + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+    os.replace(temp_path, os.path.join(directory, MANIFEST_FILE))
+    return manifest
+
+
+def read_manifest(directory):
+    """Lê o manifesto do diretório; retorna None se o cache não existir."""
+    try:
+        with open(os.path.join(directory, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def load_artifacts(directory, mmap_mode='r'):
+    """
+    Abre os artefatos descritos no manifesto sem copiá-los para a memória do processo.
+
+    Returns:
+        ArtifactSet | None: None se o diretório não tiver manifesto
+
+    Raises:
+        ValueError: versão de formato desconhecida ou arquivo divergente do manifesto
+    """
+    manifest = read_manifest(directory)
+    if manifest is None: return None
+    if manifest.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Formato de cache v{manifest.get('format_version')} não suportado em '{directory}'.")
+    arrays = {}
+    for name, entry in manifest['artifacts'].items():
+        parts = {part: np.load(os.path.join(directory, file_name), mmap_mode=mmap_mode, allow_pickle=False)
+                 for part, file_name in entry['files'].items()}
+        if entry['kind'] == 'csr':
+            value = sparse.csr_matrix((parts['data'], parts['indices'], parts['indptr']), shape=tuple(entry['shape']), copy=False)
+        else:
+            value = parts['array']
+        if list(value.shape) != entry['shape'] or str(value.dtype) != entry['dtype']:
+            raise ValueError(f"Artefato '{name}' em '{directory}' não corresponde ao manifesto.")
+        arrays[name] = value
+    return ArtifactSet(directory, manifest, arrays)
+
+
+def _file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,91 @@
+# backend/common/batch.py
+"""
+Recomendação em lote (rotas /recommend/batch): muitos perfis numa chamada.
+
+Os vetores de consulta dos perfis são empilhados em blocos de
+BATCH_CHUNK_SIZE linhas e cada bloco é pontuado contra o catálogo com um
+produto matriz-matriz, em vez de uma varredura do catálogo por perfil. O bloco
+limita a matriz de scores (perfis do bloco x itens do catálogo) em memória, e
+os rankings de um bloco são consumidos antes de o próximo ser montado.
+
+Cada perfil tem o formato do corpo do /recommend do domínio (lista de ids e
+`genre`), mais um `id` opcional devolvido na resposta. Perfis inválidos
+recebem um erro próprio sem derrubar o lote.
+"""
+
+import os
+import itertools
+import numpy as np
+from scipy import sparse
+
+BATCH_MAX_PROFILES = int(os.getenv('BATCH_MAX_PROFILES', '1000'))
+BATCH_CHUNK_SIZE = int(os.getenv('BATCH_CHUNK_SIZE', '64'))
+
+
+class Profile:
+    def __init__(self, position, profile_id, ids, genre, error=None):
+        self.position = position
+        self.id = profile_id
+        self.ids = ids
+        self.genre = genre
+        self.error = error
+
+    def result(self, payload):
+        """Item da resposta do lote: o `id` do perfil (se veio) seguido do payload."""
+        return ({"id": self.id} if self.id is not None else {}) | payload
+
+
+def parse_profiles(data, ids_field, min_ids=1, max_profiles=BATCH_MAX_PROFILES):
+    """
+    Lê a lista `profiles` do corpo da requisição.
+
+    Returns:
+        tuple: (perfis, erro); erro é a mensagem para um 400 quando o lote inteiro é inválido
+    """
+    profiles = (data or {}).get('profiles')
+    if not isinstance(profiles, list) or not profiles:
+        return None, "A lista 'profiles' é necessária"
+    if len(profiles) > max_profiles:
+        return None, f"No máximo {max_profiles} perfis por lote"
+    parsed = []
+    for position, item in enumerate(profiles):
+        if not isinstance(item, dict):
+            parsed.append(Profile(position, None, [], None, "Perfil deve ser um objeto"))
+            continue
+        ids, genre = item.get(ids_field), item.get('genre') or None
+        error = None
+        if not isinstance(ids, list) or len(ids) < min_ids:
+            error = f"A lista '{ids_field}' deve conter pelo menos {min_ids} IDs"
+        parsed.append(Profile(position, item.get('id'), ids if error is None else [], genre, error))
+    return parsed, None
+
+
+def stack_queries(queries):
+    """Empilha os vetores de consulta (1 x d cada) numa matriz de perfis x d."""
+    if any(sparse.issparse(q) for q in queries): return sparse.vstack(queries, format='csr')
+    return np.vstack(queries)
+
+
+def iter_search(index, queries, k, chunk_size=BATCH_CHUNK_SIZE):
+    """
+    `index.search` em blocos de `chunk_size` consultas (1 x d cada, tiradas do iterável só quando o bloco é montado).
+
+    Gera (posições, scores) de uma consulta por vez.
+    """
+    queries = iter(queries)
+    while True:
+        block = list(itertools.islice(queries, chunk_size))
+        if not block: return
+        block_indices, block_scores = index.search(stack_queries(block), k)
+        yield from zip(block_indices, block_scores)
+
+
+def chunked_search(index, matrix, k, chunk_size=BATCH_CHUNK_SIZE):
+    """
+    `index.search` sobre blocos de linhas de `matrix`, com todos os resultados juntos (para k pequeno).
+
+    Returns:
+        tuple: (posições, scores) com uma linha por consulta, como `index.search`
+    """
+    results = [index.search(matrix[start:start + chunk_size], k) for start in range(0, matrix.shape[0], chunk_size)]
+    return np.vstack([r[0] for r in results]), np.vstack([r[1] for r in results])
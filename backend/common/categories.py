@@ -0,0 +1,102 @@
+# backend/common/categories.py
+"""
+Distribuição dos candidatos ranqueados nas categorias da página de recomendações
+(principais, gênero, populares, jóias escondidas...).
+
+As rotas de recommend montavam cada categoria refiltrando o DataFrame inteiro
+com `~df['id'].isin(usados)`. Aqui os candidatos são percorridos uma única vez,
+em ordem de ranking, e cada um vai para a primeira categoria (na ordem de
+prioridade) que o aceita e ainda tem vaga. O resultado é o mesmo da sequência
+de filtros: cada categoria fica com os primeiros candidatos que atendem ao seu
+critério e que as categorias anteriores não pegaram.
+
+Os ids já usados ficam num bitmap (um bool por id distinto entre os candidatos),
+compartilhado entre chamadas para as categorias que dependem de outra fonte
+(ex.: os favoritos do gênero de filmes, ranqueados sobre o catálogo).
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class Bucket:
+    def __init__(self, name, limit, mask=None, window=None):
+        """
+        Args:
+            name: nome da categoria na resposta
+            limit: quantidade máxima de itens
+            mask: critério da categoria (um bool por candidato); None aceita todos
+            window: quantos candidatos elegíveis a categoria examina no máximo
+                (como um `.head(window)` antes da deduplicação); None sem limite
+        """
+        self.name = name
+        self.limit = limit
+        self.mask = mask
+        self.window = window
+
+
+class CategoryAllocator:
+    def __init__(self, candidate_ids, used_ids=()):
+        """
+        Args:
+            candidate_ids: id de cada candidato, em ordem de ranking
+            used_ids: ids que não podem aparecer em nenhuma categoria (ex.: a seleção do usuário)
+        """
+        self.codes, self.ids = pd.factorize(pd.Series(candidate_ids))
+        self.used = np.zeros(len(self.ids), dtype=bool)
+        self.exclude(used_ids)
+
+    def exclude(self, ids):
+        """Marca ids como usados (os que não estão entre os candidatos são ignorados)."""
+        ids = list(ids)
+        if not ids: return
+        codes = self.ids.get_indexer(ids)
+        self.used[codes[codes >= 0]] = True
+
+    def allocate(self, buckets, dedup=None, rows=None):
+        """
+        Preenche as categorias numa passada sobre os candidatos.
+
+        Args:
+            buckets: categorias (Bucket), em ordem de prioridade
+            dedup: TitleDeduplicator opcional; cada categoria descarta títulos quase idênticos aos que já pegou
+            rows: linha do catálogo de cada candidato (necessário com `dedup`)
+
+        Returns:
+            dict: nome da categoria -> posições (entre os candidatos) dos itens escolhidos, em ordem
+        """
+        n = len(self.codes)
+        masks = [np.ones(n, dtype=bool) if b.mask is None else np.asarray(b.mask, dtype=bool) for b in buckets]
+        taken = [[] for _ in buckets]
+        seen = [0] * len(buckets)
+        kept_keys = [set() for _ in buckets]
+        open_buckets = [b.limit > 0 and (b.window is None or b.window > 0) for b in buckets]
+
+        start = 0
+        while start < n and any(open_buckets):
+            # Só interessam os candidatos livres que alguma categoria ainda aberta aceita;
+            # a lista é refeita a partir do ponto atual sempre que uma categoria fecha
+            eligible = np.logical_or.reduce([m[start:] for m, is_open in zip(masks, open_buckets) if is_open]) & ~self.used[self.codes[start:]]
+            next_start = n
+            for position in np.flatnonzero(eligible) + start:
+                code = self.codes[position]
+                if self.used[code]: continue
+                closed = False
+                for k, bucket in enumerate(buckets):
+                    if not open_buckets[k] or not masks[k][position]: continue
+                    seen[k] += 1
+                    accepted = dedup is None or dedup.is_distinct(rows[position], kept_keys[k])
+                    if accepted:
+                        taken[k].append(position)
+                        self.used[code] = True
+                        if dedup is not None: kept_keys[k].add(int(dedup.keys[rows[position]]))
+                    if len(taken[k]) >= bucket.limit or (bucket.window is not None and seen[k] >= bucket.window):
+                        open_buckets[k] = False
+                        closed = True
+                    if accepted: break
+                if closed:
+                    next_start = position + 1
+                    break
+            start = next_start
+
+        return {b.name: np.asarray(t, dtype=np.int64) for b, t in zip(buckets, taken)}
@@ -0,0 +1,152 @@
+# backend/common/compact.py
+"""
+Armazenamento compacto das matrizes de vetores normalizados (L2) usadas no cosseno.
+
+VECTOR_DTYPE escolhe o tipo dos valores gravados no cache pelo build e
+mantidos em memória pelos recomendadores:
+
+- float64: como calculado no build;
+- float32 (padrão): metade da memória dos valores, erro ~1e-7 nos scores;
+- float16: um quarto, só para matrizes densas (scipy.sparse não tem float16;
+  as esparsas ficam em float32); a conversão para float32 no numpy não é
+  vetorizada, então a busca exata fica bem mais lenta que em int8;
+- int8: um oitavo, quantizado com uma escala por linha (valor ≈ int8 x escala),
+  em matrizes densas ou CSR.
+
+float16 e int8 ficam num CompactMatrix, que calcula os scores em blocos de
+linhas convertidos para float32, sem materializar a matriz inteira. Na carga,
+uma matriz gravada em outro tipo é convertida em memória (cópia fora do mmap);
+`benchmarks/vector_dtypes.py` mede erro, recall e latência de cada opção.
+"""
+
+import os
+import numpy as np
+from scipy import sparse
+
+VECTOR_DTYPES = ('float64', 'float32', 'float16', 'int8')
+VECTOR_DTYPE = os.getenv('VECTOR_DTYPE', 'float32')
+# Valores convertidos para float32 por vez no cálculo dos scores de um CompactMatrix (~1 MiB: cabe no cache L2)
+VECTOR_CHUNK_ELEMENTS = int(os.getenv('VECTOR_CHUNK_ELEMENTS', str(2**18)))
+SCALES_SUFFIX = '_scales'
+
+
+class CompactMatrix:
+    """Linhas em float16 (densa) ou em int8 com uma escala float32 por linha (densa ou CSR)."""
+
+    def __init__(self, values, scales=None):
+        self.values = values  # float16 densa, ou int8 densa/CSR
+        self.scales = scales  # float32 (n_linhas,) no int8; None no float16
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def dtype(self):
+        return 'int8' if self.scales is not None else 'float16'
+
+    @property
+    def nbytes(self):
+        return matrix_nbytes(self.values) + (0 if self.scales is None else self.scales.nbytes)
+
+    def __getitem__(self, rows):
+        return CompactMatrix(self.values[rows], None if self.scales is None else self.scales[rows])
+
+    def expand(self, dtype=np.float32):
+        """Matriz comum (densa ou CSR) com os valores reconstruídos."""
+        values = self.values.astype(dtype)
+        if self.scales is None: return values
+        scales = self.scales.astype(dtype)
+        if sparse.issparse(values):
+            values.data *= np.repeat(scales, np.diff(values.indptr))
+            return values
+        return values * scales[:, None]
+
+    def dot(self, queries, chunk_elements=VECTOR_CHUNK_ELEMENTS):
+        """
+        Produto escalar denso (float64) entre cada consulta e cada linha.
+
+        As linhas são convertidas para float32 em blocos de ~`chunk_elements`
+        valores; a escala do int8 é aplicada depois, nos scores de cada linha.
+        """
+        queries = queries.astype(np.float32)
+        n_rows = self.shape[0]
+        per_row = self.values.nnz / max(n_rows, 1) if sparse.issparse(self.values) else self.shape[1]
+        chunk_size = max(1, int(chunk_elements // max(per_row, 1)))
+        scores = np.empty((queries.shape[0], n_rows))
+        for start in range(0, n_rows, chunk_size):
+            product = queries @ self.values[start:start + chunk_size].astype(np.float32).T
+            scores[:, start:start + chunk_size] = product.toarray() if sparse.issparse(product) else product
+        if self.scales is not None: scores *= self.scales
+        return scores
+
+
+def storage_dtype(matrix):
+    """Tipo em que a matriz está guardada ('float64', 'float32', 'float16' ou 'int8')."""
+    return matrix.dtype if isinstance(matrix, CompactMatrix) else str(matrix.dtype)
+
+
+def effective_dtype(matrix, dtype=VECTOR_DTYPE):
+    """Tipo que `compact` usa para a matriz: float16 vira float32 nas esparsas."""
+    if dtype not in VECTOR_DTYPES: raise ValueError(f"VECTOR_DTYPE '{dtype}' inválido; use um de {VECTOR_DTYPES}.")
+    values = matrix.values if isinstance(matrix, CompactMatrix) else matrix
+    return 'float32' if dtype == 'float16' and sparse.issparse(values) else dtype
+
+
+def compact(matrix, dtype=VECTOR_DTYPE):
+    """A matriz no tipo de armazenamento `dtype` (a própria, se já estiver nele)."""
+    dtype = effective_dtype(matrix, dtype)
+    if storage_dtype(matrix) == dtype: return matrix
+    if isinstance(matrix, CompactMatrix): matrix = matrix.expand()
+    if dtype == 'int8': return quantize_rows(matrix)
+    if dtype == 'float16': return CompactMatrix(np.asarray(matrix, dtype=np.float16))
+    return matrix.astype(dtype)
+
+
+def quantize_rows(matrix):
+    """Quantiza cada linha para int8 com escala = maior valor absoluto da linha / 127."""
+    if sparse.issparse(matrix):
+        matrix = matrix.tocsr()
+        row_max = abs(matrix).max(axis=1).toarray().ravel()
+    else:
+        matrix = np.asarray(matrix)
+        row_max = np.abs(matrix).max(axis=1, initial=0)
+    scales = (row_max / 127).astype(np.float32)
+    inverse = np.divide(1.0, scales, out=np.zeros(len(scales)), where=scales > 0)
+    if sparse.issparse(matrix):
+        values = matrix.copy()
+        values.data = np.clip(np.rint(matrix.data * np.repeat(inverse, np.diff(matrix.indptr))), -127, 127).astype(np.int8)
+        values.eliminate_zeros()
+    else:
+        values = np.clip(np.rint(matrix * inverse[:, None]), -127, 127).astype(np.int8)
+    return CompactMatrix(values, scales)
+
+
+def expand(matrix):
+    """Matriz comum para as operações que precisam dos valores (perfil da consulta); as demais passam direto."""
+    return matrix.expand() if isinstance(matrix, CompactMatrix) else matrix
+
+
+def matrix_nbytes(matrix):
+    """Bytes dos valores (e índices, se CSR) da matriz."""
+    if isinstance(matrix, CompactMatrix): return matrix.nbytes
+    if sparse.issparse(matrix): return matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+    return matrix.nbytes
+
+
+def vector_arrays(name, matrix):
+    """Arrays a persistir no cache para a matriz `name` (mais as escalas, no int8)."""
+    if not isinstance(matrix, CompactMatrix): return {name: matrix}
+    if matrix.scales is None: return {name: matrix.values}
+    return {name: matrix.values, name + SCALES_SUFFIX: matrix.scales}
+
+
+def vectors_from_artifacts(artifacts, name, dtype=VECTOR_DTYPE):
+    """Matriz `name` gravada no cache (ArtifactSet), convertida para `dtype` se tiver sido gravada em outro tipo."""
+    matrix = artifacts[name]
+    if name + SCALES_SUFFIX in artifacts: matrix = CompactMatrix(matrix, artifacts[name + SCALES_SUFFIX])
+    elif matrix.dtype == np.float16: matrix = CompactMatrix(matrix)
+    if storage_dtype(matrix) != effective_dtype(matrix, dtype):
+        print(f"AVISO: '{name}' gravada em {storage_dtype(matrix)} em '{artifacts.directory}'; convertendo para {dtype} na carga (cópia fora do mmap).")
+        return compact(matrix, dtype)
+    return matrix
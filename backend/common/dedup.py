@@ -0,0 +1,106 @@
+# backend/common/dedup.py
+"""
+Deduplicação de títulos quase idênticos com os pares calculados no build de cache.
+
+Equivale ao critério da finalização das recomendações de filmes
+(`fuzz.token_sort_ratio(a, b) > 90`): cada título é normalizado (full_process)
+e tem os tokens ordenados uma única vez; os títulos com a mesma chave são
+duplicatas entre si e, para as chaves diferentes, os pares acima do limiar
+viram uma lista de adjacência (CSR). As comparações rodam em blocos no
+rapidfuzz (C) e só entre chaves de tamanho compatível, já que a razão de
+similaridade não passa do limiar se os comprimentos forem muito diferentes.
+
+Na requisição sobra o mesmo laço guloso de antes, mas cada teste de
+redundância é uma consulta a conjuntos em vez de uma chamada ao thefuzz.
+"""
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+from thefuzz.utils import full_process
+
+DEDUP_THRESHOLD = 90
+# Acima do limiar, |len(a) - len(b)| < (1 - 0.9) * (len(a) + len(b)): a razão entre os comprimentos fica acima de 9/11
+LENGTH_RATIO = 9 / 11
+
+
+def title_key(title):
+    """Título normalizado com os tokens ordenados (o que o token_sort_ratio compara)."""
+    return ' '.join(sorted(full_process(str(title), force_ascii=True).split()))
+
+
+class TitleDeduplicator:
+    def __init__(self, keys, dup_offsets, dup_keys):
+        self.keys = keys                # int32: chave (título normalizado) de cada linha do DataFrame
+        self.dup_offsets = dup_offsets  # int64: início da lista de cada chave em `dup_keys`
+        self.dup_keys = dup_keys        # int32: chaves quase idênticas (acima do limiar) a cada chave
+
+    @classmethod
+    def build(cls, titles, threshold=DEDUP_THRESHOLD, chunk_size=128):
+        """
+        Args:
+            titles: títulos na ordem das linhas do DataFrame
+            threshold: pares com similaridade (arredondada, como no thefuzz) acima deste valor são duplicatas
+        """
+        codes, unique_keys = pd.factorize(pd.Series([title_key(t) for t in titles], dtype=object))
+        unique_keys = list(unique_keys)
+        lengths = np.array([len(k) for k in unique_keys])
+        order = np.argsort(lengths, kind='stable')
+        sorted_lengths = lengths[order]
+
+        sources, targets = [], []
+        for start in range(0, len(order), chunk_size):
+            rows = order[start:start + chunk_size]
+            lo = np.searchsorted(sorted_lengths, sorted_lengths[start] * LENGTH_RATIO, side='left')
+            hi = np.searchsorted(sorted_lengths, sorted_lengths[start + len(rows) - 1] / LENGTH_RATIO, side='right')
+            cols = order[lo:hi]
+            scores = process.cdist([unique_keys[i] for i in rows], [unique_keys[j] for j in cols], scorer=fuzz.ratio, score_cutoff=threshold, dtype=np.float64, workers=-1)
+            # O thefuzz arredonda o score (round half to even) antes de comparar com o limiar
+            r, c = np.nonzero(np.round(scores) > threshold)
+            pairs = rows[r] != cols[c]
+            sources.append(rows[r][pairs]); targets.append(cols[c][pairs])
+
+        sources = np.concatenate(sources) if sources else np.zeros(0, dtype=np.int64)
+        targets = np.concatenate(targets) if targets else np.zeros(0, dtype=np.int64)
+        by_source = np.lexsort((targets, sources))
+        dup_offsets = np.zeros(len(unique_keys) + 1, dtype=np.int64)
+        dup_offsets[1:] = np.cumsum(np.bincount(sources, minlength=len(unique_keys)))
+        return cls(codes.astype(np.int32), dup_offsets, targets[by_source].astype(np.int32))
+
+    @classmethod
+    def exact(cls, titles):
+        """Só títulos com a mesma chave contam como duplicatas (caches gerados antes dos pares)."""
+        codes, unique_keys = pd.factorize(pd.Series([title_key(t) for t in titles], dtype=object))
+        return cls(codes.astype(np.int32), np.zeros(len(unique_keys) + 1, dtype=np.int64), np.zeros(0, dtype=np.int32))
+
+    def to_arrays(self):
+        """Arrays a persistir no cache."""
+        return {'title_keys': self.keys, 'title_dup_offsets': self.dup_offsets, 'title_dup_keys': self.dup_keys}
+
+    @classmethod
+    def from_artifacts(cls, artifacts, titles):
+        """Pares gravados no cache (ArtifactSet) ou, na falta deles, só os títulos idênticos."""
+        if artifacts is not None and 'title_keys' in artifacts and artifacts['title_keys'].shape[0] == len(titles):
+            return cls(artifacts['title_keys'], artifacts['title_dup_offsets'], artifacts['title_dup_keys'])
+        print("AVISO: pares de títulos ausentes no cache. Usando apenas títulos idênticos na deduplicação.")
+        return cls.exact(titles)
+
+    def first_distinct(self, rows, limit):
+        """
+        Percorre `rows` (linhas do DataFrame, já na ordem do ranking) e mantém cada
+        uma que não seja quase idêntica a alguma já mantida, até `limit` linhas.
+
+        Returns:
+            np.ndarray: posições (em `rows`) das linhas mantidas
+        """
+        kept, kept_keys = [], set()
+        for position, row in enumerate(rows):
+            if not self.is_distinct(row, kept_keys): continue
+            kept.append(position); kept_keys.add(int(self.keys[row]))
+            if len(kept) >= limit: break
+        return np.asarray(kept, dtype=np.int64)
+
+    def is_distinct(self, row, kept_keys):
+        """True se o título da linha não é quase idêntico a nenhuma das chaves em `kept_keys`."""
+        key = int(self.keys[row])
+        return key not in kept_keys and kept_keys.isdisjoint(self.dup_keys[self.dup_offsets[key]:self.dup_offsets[key + 1]].tolist())
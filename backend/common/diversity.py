@@ -0,0 +1,93 @@
+# backend/common/diversity.py
+"""
+Penalidade de diversidade (desenvolvedor/artista) vetorizada.
+
+Equivale ao laço original que percorria o ranking com um contador por chave
+e multiplicava o score por `factor ** contador`: aqui o contador vem de um
+cumcount agrupado pelos códigos fatorados das chaves. PenaltyGroups aplica a
+mesma penalidade ao catálogo inteiro, para as estatísticas do ranking completo
+que não podem sair só do pool de candidatos; elas são calculadas uma vez, na
+carga, sobre perfis de amostra.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+# Modo truncado: se definido, apenas os top-M candidatos do ranking são penalizados (0 = catálogo inteiro)
+DIVERSITY_TOP_M = int(os.getenv('DIVERSITY_TOP_M', '0')) or None
+# Perfis de amostra das estatísticas do ranking completo (quantil, mínimo), calculadas uma vez na carga
+CATALOG_STAT_PROFILES = int(os.getenv('CATALOG_STAT_PROFILES', '25'))
+
+
+def diversity_penalty(keys, factor=0.85):
+    """
+    Calcula a penalidade de cada posição do ranking.
+
+    Args:
+        keys: chave (desenvolvedor/artista) de cada candidato, na ordem do ranking
+        factor: fator aplicado a cada repetição anterior da mesma chave
+
+    Returns:
+        np.ndarray: factor ** (ocorrências anteriores da chave)
+    """
+    codes, _ = pd.factorize(np.asarray(keys, dtype=object), use_na_sentinel=False)
+    repeats = pd.Series(codes).groupby(codes).cumcount().to_numpy()
+    return factor ** repeats
+
+
+class PenaltyGroups:
+    """
+    Chave de diversidade de cada item do catálogo, fatorada no carregamento.
+
+    O ranking pode ter só o pool de candidatos do ANN (ou os top-M do modo
+    truncado); estatísticas que o laço original tirava do catálogo inteiro
+    (quantis, mínimo) usam o score penalizado de todos os itens, calculado aqui
+    sem montar o DataFrame: dentro de cada chave, o contador de um item é o
+    número de itens da mesma chave à frente dele no ranking. Varre o catálogo:
+    use só na carga, nunca por requisição.
+    """
+
+    def __init__(self, keys):
+        self.codes, _ = pd.factorize(np.asarray(keys, dtype=object), use_na_sentinel=False)
+        # Com os itens agrupados por chave, a posição de cada um dentro do seu grupo
+        sorted_codes = np.sort(self.codes)
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        self.repeats = np.arange(len(self.codes)) - np.repeat(starts, np.diff(np.r_[starts, len(self.codes)]))
+
+    def shares_key(self, rows):
+        """True para cada item do catálogo com a mesma chave de algum item de `rows`."""
+        return np.isin(self.codes, self.codes[np.asarray(rows, dtype=np.int64)])
+
+    def penalized(self, scores, factor=0.85, exclude=(), multiplier=None):
+        """
+        Score penalizado de todo o catálogo, como no ranking completo.
+
+        Args:
+            scores: score de cada item do catálogo, antes da penalidade
+            exclude: linhas fora do ranking (os itens selecionados)
+            multiplier: fator extra por item (ex.: x0,5 para os artistas de entrada)
+
+        Returns:
+            np.ndarray: scores penalizados dos itens do ranking, agrupados por chave (fora da ordem do ranking)
+        """
+        scores = np.asarray(scores, dtype=np.float64)
+        ranked = np.ones(len(scores), dtype=bool)
+        ranked[np.asarray(exclude, dtype=np.int64)] = False
+        # Posição no ranking (os excluídos vão para o fim e não contam como ocorrência anterior), depois agrupada por chave
+        positions = np.empty(len(scores), dtype=np.int64)
+        positions[np.argsort(-np.where(ranked, scores, -np.inf))] = np.arange(len(scores))
+        order = np.argsort(self.codes.astype(np.int64) * len(scores) + positions)
+        penalized = scores[order] * factor ** self.repeats
+        if multiplier is not None: penalized *= np.asarray(multiplier)[order]
+        return penalized[ranked[order]]
+
+
+def truncate_candidates(ranked_df, top_m=DIVERSITY_TOP_M):
+    """Mantém só os top-M candidatos já ordenados (ou todos, se top_m não estiver definido)."""
+    return ranked_df.head(top_m).copy() if top_m else ranked_df
+
+
+def first_list_item(series, default='N/A'):
+    """Primeiro elemento de cada célula que seja uma lista não vazia (mesmo se for None); as demais recebem `default`."""
+    return series.str[0].where(series.map(lambda value: isinstance(value, list) and len(value) > 0), default)
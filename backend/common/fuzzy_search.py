@@ -0,0 +1,191 @@
+# backend/common/fuzzy_search.py
+"""
+Busca fuzzy de títulos com o mesmo resultado do `thefuzz.process.extractBests`.
+
+Os títulos são pré-processados uma única vez no build (full_process com
+force_ascii, como o thefuzz faz com cada escolha) e indexados por n-gramas
+(SearchIndex). A consulta passa pelo mesmo processamento do extractBests
+(full_process e, em seguida, o processador do WRatio). A busca é feita em duas
+etapas, ambas pontuadas pelo WRatio do rapidfuzz (em C):
+
+1. a lista curta (títulos que mais compartilham bigramas e trigramas com o
+   termo) dá o score do `limit`-ésimo resultado, que vira o corte;
+2. TitleBounds calcula, só com contagens por título (caracteres, espaços,
+   palavras), um limite superior do WRatio de cada título; todos os títulos
+   cujo limite alcança o corte são pontuados.
+
+Um título fora da segunda etapa não chega ao corte, então o resultado (score
+mínimo, limite e desempate pela posição no catálogo) é exatamente o do
+extractBests, sem pontuar o catálogo inteiro.
+"""
+
+import os
+from collections import Counter
+import numpy as np
+from rapidfuzz import fuzz, process
+from thefuzz.utils import full_process
+
+# Pré-filtro pelo limite superior do WRatio (false = pontua o catálogo inteiro, ainda em C)
+FUZZY_PREFILTER = os.getenv('FUZZY_PREFILTER', 'true').lower() == 'true'
+# Tamanho da lista curta que define o corte da segunda etapa
+FUZZY_CANDIDATES = int(os.getenv('FUZZY_CANDIDATES', '2000'))
+
+# Contagem por caractere: a-z e 0-9 têm posição própria; os demais (não ASCII) dividem uma só
+CHARACTERS = 'abcdefghijklmnopqrstuvwxyz0123456789'
+OTHER, SPACE, CONTINUATION = len(CHARACTERS), len(CHARACTERS) + 1, len(CHARACTERS) + 2
+_BYTE_SLOTS = np.full(256, OTHER, dtype=np.int64)
+_BYTE_SLOTS[[ord(c) for c in CHARACTERS]] = np.arange(len(CHARACTERS))
+_BYTE_SLOTS[ord(' ')] = SPACE
+_BYTE_SLOTS[0x80:0xC0] = CONTINUATION  # bytes de continuação do UTF-8 (o primeiro byte já conta o caractere)
+# Folga na comparação com o corte (o rapidfuzz calcula o score por outra conta em ponto flutuante)
+BOUND_EPSILON = 1e-6
+
+
+def process_title(title):
+    """Pré-processamento que o extractBests aplica a cada escolha com o WRatio (ASCII, minúsculas, só letras e números)."""
+    return full_process(title if isinstance(title, str) else '', force_ascii=True)
+
+
+def process_query(query):
+    """Pré-processamento do termo no extractBests: o full_process padrão e, em cima dele, o das escolhas."""
+    return process_title(full_process(query))
+
+
+class TitleBounds:
+    """
+    Contagens dos títulos processados de um SearchIndex (na ordem do ranking)
+    para o limite superior do WRatio.
+
+    Cada componente do WRatio é um `ratio` (2 x LCS / soma dos tamanhos) entre
+    versões do termo e do título (originais, palavras ordenadas ou sem palavras
+    repetidas), ou o melhor trecho de um `partial_ratio`. A LCS não passa dos
+    caracteres em comum, contados por caractere (histograma) mais os espaços em
+    comum, e os tamanhos de cada versão vêm das contagens de palavras. As
+    componentes por palavras valem 100 quando há uma palavra em comum.
+    """
+
+    def __init__(self, index, chunk_size=65536):
+        offsets = index.text_offsets
+        n_titles = len(offsets) - 1
+        slots = _BYTE_SLOTS[index.text_bytes]
+        histogram = np.empty((OTHER + 1, n_titles), dtype=np.uint8)
+        lengths, spaces = np.empty(n_titles, dtype=np.int32), np.empty(n_titles, dtype=np.int32)
+        # Em blocos de títulos, para limitar a memória do bincount
+        for start in range(0, n_titles, chunk_size):
+            stop = min(start + chunk_size, n_titles)
+            owner = np.repeat(np.arange(stop - start), np.diff(offsets[start:stop + 1]))
+            counts = np.bincount(owner * (CONTINUATION + 1) + slots[offsets[start]:offsets[stop]], minlength=(stop - start) * (CONTINUATION + 1))
+            counts = counts.reshape(stop - start, CONTINUATION + 1)
+            histogram[:, start:stop] = np.minimum(counts[:, :OTHER + 1], 255).T
+            lengths[start:stop] = counts[:, :SPACE + 1].sum(axis=1)
+            spaces[start:stop] = counts[:, SPACE]
+        self.histogram = histogram  # (caractere, título), saturado em 255
+        self.lengths = lengths      # tamanho em caracteres
+        self.spaces = spaces
+        # Palavras de cada título: contagens e listas invertidas (palavra -> posições) para as palavras em comum
+        self.titles = index.texts(range(n_titles))
+        words, unique_words, unique_chars = (np.empty(n_titles, dtype=np.int32) for _ in range(3))
+        vocabulary, word_ids, word_ranks = {}, [], []
+        for rank, title in enumerate(self.titles):
+            tokens = title.split()
+            unique = set(tokens)
+            words[rank], unique_words[rank], unique_chars[rank] = len(tokens), len(unique), sum(map(len, unique))
+            for token in unique:
+                word_ids.append(vocabulary.setdefault(token, len(vocabulary)))
+                word_ranks.append(rank)
+        word_ids = np.asarray(word_ids, dtype=np.int32)
+        order = np.argsort(word_ids, kind='stable')
+        self.vocabulary = vocabulary
+        self.word_offsets = np.concatenate([[0], np.cumsum(np.bincount(word_ids, minlength=len(vocabulary)))]).astype(np.int64)
+        self.word_ranks = np.asarray(word_ranks, dtype=np.int32)[order]
+        self.words = words                                            # palavras
+        self.unique_words = unique_words                              # palavras distintas
+        self.sorted_lengths = lengths - spaces + words - 1            # palavras ordenadas, separadas por um espaço
+        self.unique_lengths = unique_chars + unique_words - 1         # palavras distintas, ordenadas
+
+    def with_word(self, word):
+        """Posições do ranking cujo título tem a palavra `word`."""
+        word_id = self.vocabulary.get(word)
+        if word_id is None: return self.word_ranks[:0]
+        return self.word_ranks[self.word_offsets[word_id]:self.word_offsets[word_id + 1]]
+
+    def upper_bound(self, query):
+        """
+        Limite superior do WRatio(query, título) para cada posição do ranking.
+
+        Returns:
+            np.ndarray: um float por título, ou None se o termo tiver mais de 255
+            repetições de um caractere (o histograma satura; pontue tudo)
+        """
+        chars = Counter(_char_slot(c) for c in query if c != ' ')
+        if chars and max(chars.values()) > 255: return None
+        common = np.zeros(len(self.lengths), dtype=np.int32)
+        for slot, count in chars.items(): common += np.minimum(self.histogram[slot], count)
+
+        tokens = query.split()
+        unique = set(tokens)
+        length, spaces = len(query), query.count(' ')
+        sorted_length, unique_length = length - spaces + len(tokens) - 1, sum(map(len, unique)) + len(unique) - 1
+        shared_word = np.zeros(len(self.lengths), dtype=bool)
+        for token in unique: shared_word[self.with_word(token)] = True
+
+        ratio = _ratio_bound(common + np.minimum(spaces, self.spaces), length, self.lengths)
+        partial = _partial_bound(common + np.minimum(spaces, self.spaces), length, self.lengths)
+        token = np.maximum(_ratio_bound(common + np.minimum(len(tokens), self.words) - 1, sorted_length, self.sorted_lengths),
+                           _ratio_bound(common + np.minimum(len(unique), self.unique_words) - 1, unique_length, self.unique_lengths))
+        partial_token = np.maximum(_partial_bound(common + np.minimum(len(tokens), self.words) - 1, sorted_length, self.sorted_lengths),
+                                   _partial_bound(common + np.minimum(len(unique), self.unique_words) - 1, unique_length, self.unique_lengths))
+        token[shared_word], partial_token[shared_word] = 100, 100
+
+        # Mesmos regimes do WRatio: tamanhos parecidos (< 1,5x) usam as razões inteiras; acima disso, as parciais com escala
+        length_ratio = np.maximum(length, self.lengths) / np.maximum(np.minimum(length, self.lengths), 1)
+        partial_scale = np.where(length_ratio <= 8.0, 0.9, 0.6)
+        bound = np.where(length_ratio < 1.5, np.maximum(ratio, token * 0.95),
+                         np.maximum(ratio, np.maximum(partial * partial_scale, partial_token * 0.95 * partial_scale)))
+        bound[self.lengths == 0] = 0
+        return bound
+
+
+def _char_slot(char):
+    return _BYTE_SLOTS[ord(char)] if ord(char) < 0x80 else OTHER
+
+
+def _ratio_bound(common, a, b):
+    """Maior `ratio` entre textos de tamanhos `a` e `b` com no máximo `common` caracteres em comum."""
+    return 200 * np.minimum(common, np.minimum(a, b)) / np.maximum(a + b, 1)
+
+
+def _partial_bound(common, a, b):
+    """Maior `partial_ratio`: o menor texto contra trechos do maior com no máximo o tamanho dele."""
+    shorter = np.minimum(a, b)
+    matched = np.clip(np.minimum(common, shorter), 0, None)
+    return 200 * matched / np.maximum(shorter + matched, 1)
+
+
+def fuzzy_search(index, query, limit=30, score_cutoff=60, max_candidates=FUZZY_CANDIDATES, bounds=None):
+    """
+    Args:
+        index: SearchIndex construído sobre os títulos já processados (sem ordenação por popularidade)
+        bounds: TitleBounds do mesmo índice; sem ele o catálogo inteiro é pontuado
+
+    Returns:
+        np.ndarray: posições de linha (para .iloc) ordenadas por score decrescente
+    """
+    query = process_query(query)
+    if not query: return index.rows[:0]
+    ranks = np.arange(len(index.rows))
+    upper_bound = bounds.upper_bound(query) if FUZZY_PREFILTER and bounds is not None else None
+    if upper_bound is not None:
+        shortlist = index.overlap_candidates(query, max_candidates)
+        matches = _extract(index, query, shortlist, limit, score_cutoff, bounds.titles)
+        # Com a lista curta já cheia, só entra no resultado quem alcançar o pior score dela (empates incluídos)
+        threshold = matches[-1][1] if len(matches) == limit else score_cutoff
+        ranks = np.flatnonzero(upper_bound >= threshold - BOUND_EPSILON)
+    matches = _extract(index, query, ranks, limit, score_cutoff, bounds.titles if bounds is not None else None)
+    return index.rows[ranks[np.asarray([position for _, _, position in matches], dtype=np.int64)]]
+
+
+def _extract(index, query, ranks, limit, score_cutoff, titles=None):
+    if len(ranks) == 0: return []
+    choices = [titles[rank] for rank in ranks] if titles is not None else index.texts(ranks)
+    return process.extract(query, choices, scorer=fuzz.WRatio, processor=None, score_cutoff=score_cutoff, limit=limit)
@@ -0,0 +1,92 @@
+# backend/common/generations.py
+"""
+Gerações de cache: cada build grava numa pasta nova e só então a publica.
+
+Layout dentro da pasta de cache de um domínio:
+
+    cache/
+        CURRENT                      nome da geração ativa (trocado com os.replace)
+        generations/<nome>/          saída completa de um build (parquet, json, pkl, artifacts/)
+
+Uma geração publicada não é mais alterada: o build seguinte (completo ou
+incremental) grava outra pasta e troca o ponteiro CURRENT de uma vez, então
+quem lê nunca vê um cache pela metade. As gerações antigas são removidas na
+publicação, mantendo as CACHE_GENERATIONS_KEEP mais recentes (processos que
+ainda servem uma delas continuam com os arquivos abertos/mapeados).
+
+Sem CURRENT, vale o layout antigo: os arquivos direto na pasta de cache.
+"""
+
+import os
+import shutil
+from datetime import datetime, timezone
+
+CURRENT_FILE = 'CURRENT'
+GENERATIONS_DIR = 'generations'
+# Gerações publicadas mantidas em disco (a ativa sempre fica)
+CACHE_GENERATIONS_KEEP = int(os.getenv('CACHE_GENERATIONS_KEEP', '3'))
+
+
+def current_generation(cache_dir):
+    """Nome da geração apontada por CURRENT; None no layout antigo."""
+    try:
+        with open(os.path.join(cache_dir, CURRENT_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def resolve(cache_dir):
+    """
+    Pasta de onde carregar o cache.
+
+    Returns:
+        tuple: (nome da geração ou None, pasta da geração ativa ou a própria pasta de cache)
+    """
+    generation = current_generation(cache_dir)
+    if generation is None: return None, cache_dir
+    return generation, os.path.join(cache_dir, GENERATIONS_DIR, generation)
+
+
+def list_generations(cache_dir):
+    """Gerações em disco, da mais antiga para a mais nova (os nomes ordenam pela data)."""
+    directory = os.path.join(cache_dir, GENERATIONS_DIR)
+    if not os.path.isdir(directory): return []
+    return sorted(e.name for e in os.scandir(directory) if e.is_dir() and not e.name.startswith('.'))
+
+
+def new_generation(cache_dir):
+    """Cria a pasta de uma geração ainda não publicada e retorna seu caminho."""
+    name = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S.%fZ') + f"-{os.getpid()}"
+    path = os.path.join(cache_dir, GENERATIONS_DIR, name)
+    os.makedirs(path)
+    return path
+
+
+def carry_over(source_dir, generation_dir, names):
+    """Leva para a geração nova arquivos que o build não muda (hard link; cópia se o sistema de arquivos não permitir)."""
+    for name in names:
+        source, target = os.path.join(source_dir, name), os.path.join(generation_dir, name)
+        try: os.link(source, target)
+        except OSError: shutil.copy2(source, target)
+
+
+def publish(cache_dir, generation_dir, keep=CACHE_GENERATIONS_KEEP):
+    """Aponta CURRENT para a geração (troca atômica) e remove as gerações antigas excedentes."""
+    name = os.path.basename(os.path.normpath(generation_dir))
+    temp_path = os.path.join(cache_dir, CURRENT_FILE + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        f.write(name + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, os.path.join(cache_dir, CURRENT_FILE))
+    prune(cache_dir, keep)
+    return name
+
+
+def prune(cache_dir, keep=CACHE_GENERATIONS_KEEP):
+    """Remove as gerações além das `keep` mais recentes, nunca a ativa."""
+    active = current_generation(cache_dir)
+    generations = list_generations(cache_dir)
+    for name in generations[:max(0, len(generations) - keep)]:
+        if name != active: shutil.rmtree(os.path.join(cache_dir, GENERATIONS_DIR, name), ignore_errors=True)
@@ -0,0 +1,76 @@
+# backend/common/genre_bits.py
+"""
+Gêneros de cada item como bitset (um bit por gênero do vocabulário), gerado no build de cache.
+
+Os filtros e boosts por gênero testavam cada linha com lambdas e buscas de
+substring (`'Ação' in str(genres)`, `str.contains(genre)`), o que também
+confundia gêneros com nomes sobrepostos (ex.: 'rock' casava com 'punk-rock').
+Aqui o vocabulário é a lista ordenada de gêneros do catálogo (a mesma do
+genres.json, ou um superconjunto dela nos filmes) e cada item vira uma linha de
+bytes com `np.packbits`; um filtro é um AND com a máscara dos gêneros pedidos.
+"""
+
+import numpy as np
+
+
+def split_genres(value, sep=','):
+    """Lista de gêneros de uma célula: lista/array, texto separado por vírgulas ou vazio."""
+    if isinstance(value, (list, tuple, np.ndarray)): return [str(g).strip() for g in value if str(g).strip()]
+    if isinstance(value, str): return [g.strip() for g in value.split(sep) if g.strip()]
+    return []
+
+
+class GenreBits:
+    def __init__(self, vocabulary, bits):
+        self.vocabulary = vocabulary  # 'U': gêneros, em ordem (posição = bit)
+        self.bits = bits              # uint8 (n_itens, ceil(n_gêneros / 8)): bits em ordem little-endian
+        self._positions = {str(g).lower(): i for i, g in enumerate(vocabulary)}
+
+    @classmethod
+    def build(cls, genre_lists, vocabulary=None):
+        """
+        Args:
+            genre_lists: gêneros de cada linha do DataFrame (células aceitas por `split_genres`)
+            vocabulary: gêneros do bitset; None usa todos os gêneros encontrados, em ordem alfabética
+        """
+        genre_lists = [split_genres(g) for g in genre_lists]
+        if vocabulary is None: vocabulary = sorted({g for genres in genre_lists for g in genres})
+        positions = {g: i for i, g in enumerate(vocabulary)}
+        dense = np.zeros((len(genre_lists), max(len(vocabulary), 1)), dtype=bool)
+        for row, genres in enumerate(genre_lists):
+            dense[row, [positions[g] for g in genres if g in positions]] = True
+        return cls(np.array(vocabulary, dtype=str), np.packbits(dense, axis=1, bitorder='little'))
+
+    def to_arrays(self):
+        """Arrays a persistir no cache."""
+        return {'genre_vocabulary': self.vocabulary, 'genre_bits': self.bits}
+
+    @classmethod
+    def from_artifacts(cls, artifacts, genre_lists):
+        """Bitsets gravados no cache (ArtifactSet) ou, na falta deles, calculados na carga a partir da coluna de gêneros."""
+        if artifacts is not None and 'genre_bits' in artifacts and artifacts['genre_bits'].shape[0] == len(genre_lists):
+            return cls(artifacts['genre_vocabulary'], artifacts['genre_bits'])
+        return cls.build(genre_lists)
+
+    def selector(self, genres):
+        """Máscara de bytes com os bits dos gêneros pedidos (sem diferenciar maiúsculas); None se nenhum existir."""
+        positions = [self._positions[g.lower()] for g in genres if isinstance(g, str) and g.lower() in self._positions]
+        if not positions: return None
+        selector = np.zeros(self.bits.shape[1], dtype=np.uint8)
+        for position in positions: selector[position >> 3] |= np.uint8(1 << (position & 7))
+        return selector
+
+    def mask(self, genres, rows=None):
+        """
+        Args:
+            genres: um gênero ou uma lista de gêneros
+            rows: linhas do catálogo a testar (ex.: o índice dos candidatos); None testa o catálogo inteiro
+
+        Returns:
+            np.ndarray: bool por linha, True se o item tem algum dos gêneros
+        """
+        if isinstance(genres, str): genres = [genres]
+        bits = self.bits if rows is None else self.bits[np.asarray(rows)]
+        selector = self.selector(genres)
+        if selector is None: return np.zeros(bits.shape[0], dtype=bool)
+        return (bits & selector).any(axis=1)
@@ -0,0 +1,41 @@
+# backend/common/id_index.py
+"""
+Índice id -> linha do catálogo, montado na carga do recomendador.
+
+Os ids recebidos (appids e ids do TMDB inteiros, ids de faixa do Spotify em
+texto) eram resolvidos com `df['id'].isin(ids)` ou `df['id'] == id`, uma
+varredura do catálogo inteiro por consulta, repetida nos filtros de exclusão.
+Aqui os ids ficam num `pd.Index` (tabela hash montada uma vez) e a resolução
+custa O(selecionados); as exclusões viram máscaras posicionais sobre as
+linhas dos candidatos. O resultado é o do `isin`: linhas em ordem de catálogo,
+sem repetição, ids de outro tipo (ex.: '570' para o appid 570) não casam.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class IdIndex:
+    def __init__(self, ids):
+        self.ids = pd.Index(ids)
+        self.is_unique = self.ids.is_unique
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows(self, ids):
+        """Linhas do catálogo com os `ids` (ordenadas, como `df.index[df['id'].isin(ids)]`)."""
+        ids = list(ids)
+        if not ids: return np.empty(0, dtype=np.int64)
+        # Catálogo com ids repetidos: cada id devolve todas as suas linhas, como no isin
+        positions = self.ids.get_indexer(ids) if self.is_unique else self.ids.get_indexer_non_unique(ids)[0]
+        return np.unique(positions[positions >= 0]).astype(np.int64)
+
+    def row(self, item_id):
+        """Linha de um id; None se ele não estiver no catálogo."""
+        rows = self.rows([item_id])
+        return int(rows[0]) if rows.size else None
+
+    def isin(self, rows, ids):
+        """Máscara posicional: se cada linha de `rows` (linhas do catálogo) é de um dos `ids`."""
+        return np.isin(np.asarray(rows), self.rows(ids))
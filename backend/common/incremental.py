@@ -0,0 +1,123 @@
+# backend/common/incremental.py
+"""
+Atualização incremental dos caches a partir de um arquivo de delta.
+
+O delta tem o esquema da entrada do build do domínio (uma linha por item) e
+uma coluna opcional `op`: 'upsert' (padrão, inclui ou substitui o item pela
+chave) ou 'delete' (só a chave importa). Se a mesma chave aparece mais de
+uma vez, vale a última linha.
+
+O catálogo novo mantém as linhas antigas na mesma ordem, com as alteradas no
+lugar e as removidas fora, e acrescenta as novas no fim (CatalogPatch). As
+mesmas posições valem para o DataFrame, as matrizes e os índices derivados,
+então só as linhas do delta passam pelos vetorizadores/encoders já ajustados.
+
+Os vetorizadores não são reajustados: quando o delta traz vocabulário (ou
+categorias, ou faixas de valores) que o ajuste antigo não conhece além de
+INCREMENTAL_DRIFT_THRESHOLD, os builders fazem o build completo.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+DELTA_OP_COLUMN = 'op'
+UPSERT, DELETE = 'upsert', 'delete'
+# Desvio máximo (fração) aceito no modo incremental antes de cair no build completo
+INCREMENTAL_DRIFT_THRESHOLD = float(os.getenv('INCREMENTAL_DRIFT_THRESHOLD', '0.1'))
+# Amostra de textos usada para estimar a fração de termos fora do vocabulário no build completo
+OOV_SAMPLE_SIZE = 5000
+
+
+def read_delta(path, key, dtype=None):
+    """
+    Lê o arquivo de delta (.parquet, .json/.jsonl ou .csv).
+
+    Returns:
+        tuple: (DataFrame das linhas a incluir/substituir, sem a coluna `op`; chaves a remover)
+
+    Raises:
+        ValueError: sem a coluna de chave ou com operação desconhecida
+    """
+    if path.endswith('.parquet'): delta = pd.read_parquet(path)
+    elif path.endswith(('.json', '.jsonl')): delta = pd.read_json(path, lines=path.endswith('.jsonl'), dtype=dtype)
+    else: delta = pd.read_csv(path, dtype=dtype)
+    if key not in delta.columns: raise ValueError(f"O delta '{path}' não tem a coluna de chave '{key}'.")
+    ops = delta[DELTA_OP_COLUMN].fillna(UPSERT).str.lower() if DELTA_OP_COLUMN in delta.columns else pd.Series(UPSERT, index=delta.index)
+    unknown = sorted(set(ops) - {UPSERT, DELETE})
+    if unknown: raise ValueError(f"Operações desconhecidas no delta '{path}': {unknown}")
+    last = ~delta[key].duplicated(keep='last')
+    delta, ops = delta[last], ops[last]
+    upserts = delta[ops == UPSERT].drop(columns=[DELTA_OP_COLUMN], errors='ignore').reset_index(drop=True)
+    return upserts, delta.loc[ops == DELETE, key].to_numpy()
+
+
+def conform(rows, catalog):
+    """Linhas do delta com as colunas e os tipos do catálogo (num CSV com remoções, colunas inteiras chegam como float)."""
+    return rows.reindex(columns=catalog.columns).astype(catalog.dtypes.to_dict())
+
+
+def take_rows(rows, positions):
+    return rows.iloc[positions] if isinstance(rows, (pd.DataFrame, pd.Series)) else rows[positions]
+
+
+def concat_rows(parts):
+    if isinstance(parts[0], (pd.DataFrame, pd.Series)): return pd.concat(parts, ignore_index=True)
+    if sparse.issparse(parts[0]): return sparse.vstack(parts, format='csr')
+    return np.concatenate(parts)
+
+
+class CatalogPatch:
+    def __init__(self, old_keys, upsert_keys, delete_keys=()):
+        """
+        Args:
+            old_keys: chave de cada linha do catálogo atual
+            upsert_keys: chaves das linhas novas ou alteradas, na ordem das linhas do delta
+            delete_keys: chaves a remover (as ausentes do catálogo são ignoradas)
+        """
+        old_keys, upsert_keys = pd.Index(old_keys), pd.Index(upsert_keys)
+        kept = ~old_keys.isin(delete_keys) | old_keys.isin(upsert_keys)
+        self.n_old = len(old_keys)
+        # Linha antiga -> linha nova (-1 se removida)
+        self.old_to_new = np.where(kept, np.cumsum(kept) - 1, -1)
+        self.changed_old = np.flatnonzero(kept & old_keys.isin(upsert_keys))
+        self.deleted_old = np.flatnonzero(~kept)
+        self.unchanged_old = np.flatnonzero(kept & ~old_keys.isin(upsert_keys))
+        existing = old_keys.get_indexer(upsert_keys)
+        n_kept = int(kept.sum())
+        added = existing < 0
+        # Linha nova de cada linha do delta: a da linha antiga ou uma posição no fim
+        self.upsert_rows = np.where(added, n_kept + np.cumsum(added) - 1, self.old_to_new[np.maximum(existing, 0)])
+        self.n_added = int(added.sum())
+        self.n_items = n_kept + self.n_added
+        self._order = np.argsort(np.concatenate([self.old_to_new[self.unchanged_old], self.upsert_rows]), kind='stable')
+
+    @property
+    def changed_rows(self):
+        """Linhas novas que vieram do delta (alteradas e incluídas), em ordem crescente."""
+        return np.sort(self.upsert_rows)
+
+    def assemble(self, old, new):
+        """Catálogo novo a partir das linhas antigas e das do delta (DataFrame, array ou matriz esparsa)."""
+        return take_rows(concat_rows([take_rows(old, self.unchanged_old), new]), self._order)
+
+    def summary(self):
+        return f"{len(self.changed_old)} alterados, {self.n_added} incluídos, {len(self.deleted_old)} removidos; {self.n_items} itens no total"
+
+
+def oov_rate(analyzer, vocabulary, texts):
+    """Fração das ocorrências de termos (após o analyzer do vetorizador) fora do vocabulário."""
+    total = unknown = 0
+    for text in texts:
+        tokens = analyzer(text)
+        total += len(tokens)
+        unknown += sum(1 for t in tokens if t not in vocabulary)
+    return unknown / total if total else 0.0
+
+
+def sample_texts(texts, size=OOV_SAMPLE_SIZE, seed=42):
+    """Amostra fixa de textos para a taxa de termos fora do vocabulário do build completo."""
+    texts = list(texts)
+    if len(texts) <= size: return texts
+    return [texts[i] for i in np.sort(np.random.default_rng(seed).choice(len(texts), size=size, replace=False))]
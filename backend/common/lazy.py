@@ -0,0 +1,231 @@
+# backend/common/lazy.py
+"""
+Carregamento preguiçoso (sob demanda) dos recomendadores.
+
+Cada domínio é embrulhado em um LazyRecommender: o cache só é lido no
+primeiro `get()` (ou pela thread de aquecimento), com trava de dupla
+checagem para que requisições concorrentes esperem um único carregamento.
+O estado e os tempos de carga alimentam o endpoint de prontidão.
+`reload` troca o cache por um novo sem derrubar o anterior se a carga falhar.
+
+Troca de geração (common/generations.py): a vigia `watch_generations` confere
+o ponteiro CURRENT de cada cache e, quando ele muda, carrega a geração nova
+numa instância nova em segundo plano e troca a referência de uma vez, só se
+ela ficar pronta. Durante a carga o domínio continua pronto (a carga em curso
+aparece em `reloading`), então a troca não tira o processo de rotação. Cada
+requisição pega a instância uma única vez (`get()`), então as que já estavam
+em andamento terminam sobre a geração anterior.
+
+`init_app` liga isso a um app Flask (o de create_app ou o de cada serviço de
+domínio): prontidão, gerações em /api/admin/cache, aquecimento e vigia.
+"""
+
+import os
+import time
+import threading
+import traceback
+
+from .generations import current_generation, list_generations
+from .metrics import CACHE_LOAD_SECONDS
+
+# Aquecimento em segundo plano ao criar a aplicação (false = carrega só na primeira requisição)
+RECOMMENDER_WARMUP = os.getenv('RECOMMENDER_WARMUP', 'true').lower() == 'true'
+# Intervalo (s) da vigia do ponteiro CURRENT dos caches (0 desliga a troca de geração em processo)
+CACHE_SWAP_SECONDS = float(os.getenv('CACHE_SWAP_SECONDS', '30'))
+
+PENDING, LOADING, READY, FAILED = 'pending', 'loading', 'ready', 'failed'
+
+
+class LazyRecommender:
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self.state = PENDING
+        self.error = None
+        self.started_at = None
+        self.load_seconds = None
+        self._instance = None
+        self._lock = threading.Lock()
+        self.swaps = 0
+        self.reloading = None  # geração em carga para substituir a atual ({generation, started_at})
+        self._failed_generation = None
+
+    @property
+    def is_loaded(self):
+        return self._instance is not None
+
+    def get(self):
+        """Retorna o recomendador, carregando-o na primeira chamada (thread-safe)."""
+        instance = self._instance
+        if instance is not None: return instance
+        with self._lock:
+            if self._instance is None: self._publish(*self._load())
+            return self._instance
+
+    def _load(self):
+        """
+        Executa a fábrica sem colocar a instância em uso.
+
+        Só a primeira carga passa o estado por LOADING (e FAILED, se a fábrica
+        falhar); numa troca o estado continua o da instância em uso.
+
+        Returns:
+            tuple: (instância, início da carga, segundos de carga)
+        """
+        first_load = self._instance is None
+        started_at, start = time.time(), time.perf_counter()
+        if first_load: self.state, self.error, self.started_at = LOADING, None, started_at
+        try:
+            instance = self.factory()
+        except Exception as e:
+            if first_load: self.state, self.error, self.load_seconds = FAILED, str(e), time.perf_counter() - start
+            raise
+        load_seconds = time.perf_counter() - start
+        CACHE_LOAD_SECONDS.set(load_seconds, self.name)
+        print(f">>> Recomendador '{self.name}' carregado em {load_seconds:.2f}s (estado: {READY if _is_ready(instance) else FAILED}). <<<")
+        return instance, started_at, load_seconds
+
+    def _publish(self, instance, started_at, load_seconds):
+        """Coloca a instância em uso, com o estado dela."""
+        self._instance, self.started_at, self.load_seconds = instance, started_at, load_seconds
+        self.state, self.error = READY if _is_ready(instance) else FAILED, None
+
+    def reload(self, generation=None):
+        """
+        Carrega o cache de novo numa instância nova e só a coloca em uso se ela ficar pronta.
+
+        Enquanto a carga corre, a instância anterior continua servindo, o estado
+        (e a prontidão) não muda e a carga aparece em `reloading`. Se ela falhar,
+        a instância anterior (se houver) continua servindo.
+
+        Returns:
+            bool: True se a instância nova entrou em uso
+        """
+        with self._lock:
+            previous = self._instance
+            if previous is not None: self.reloading = {"generation": generation, "started_at": time.time()}
+            try:
+                loaded, error = self._load(), 'o cache novo não ficou pronto'
+            except Exception as e:
+                traceback.print_exc()
+                loaded, error = None, str(e)
+            finally:
+                self.reloading = None
+            if loaded is not None and (previous is None or _is_ready(loaded[0])):
+                self._publish(*loaded)
+                if previous is not None: self.swaps += 1
+                return self.state == READY
+            if previous is None: return False
+            self.error = f"recarga falhou, mantendo o cache anterior: {error}"
+            print(f">>> Recarga do recomendador '{self.name}' falhou; mantendo o cache anterior. <<<")
+            return False
+
+    @property
+    def generation(self):
+        """Geração do cache em uso (None no layout antigo ou antes da carga)."""
+        return getattr(self._instance, 'generation', None)
+
+    def pending_generation(self):
+        """Geração publicada em CURRENT que ainda não está em uso (None se não houver troca a fazer)."""
+        cache_root = getattr(self._instance, 'cache_root', None)
+        if cache_root is None: return None
+        latest = current_generation(cache_root)
+        if latest is None or latest in (self.generation, self._failed_generation): return None
+        return latest
+
+    def refresh_generation(self):
+        """
+        Carrega a geração apontada por CURRENT se ela for outra que a em uso.
+
+        Uma geração que falhou na carga não é tentada de novo até o ponteiro mudar.
+
+        Returns:
+            bool: True se a instância foi trocada
+        """
+        latest = self.pending_generation()
+        if latest is None: return False
+        print(f">>> Nova geração de cache para '{self.name}': {self.generation} -> {latest}. Carregando em segundo plano... <<<")
+        swapped = self.reload(generation=latest)
+        self._failed_generation = None if swapped else latest
+        return swapped
+
+    def generation_status(self):
+        """Geração em uso neste processo, a publicada em CURRENT e as disponíveis em disco."""
+        cache_root = getattr(self._instance, 'cache_root', None)
+        return {
+            "active": self.generation,
+            "current": current_generation(cache_root) if cache_root else None,
+            "available": list_generations(cache_root) if cache_root else [],
+            "swaps": self.swaps,
+            "loaded_at": self.started_at,
+            "state": self.state,
+            "reloading": self.reloading,
+            "error": self.error,
+        }
+
+    def warm_up(self):
+        """Dispara o carregamento em uma thread daemon, sem bloquear a inicialização."""
+        def _run():
+            try: self.get()
+            except Exception: traceback.print_exc()
+        thread = threading.Thread(target=_run, name=f"warmup-{self.name}", daemon=True)
+        thread.start()
+        return thread
+
+    def status(self):
+        return {
+            "state": self.state,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+            "started_at": self.started_at,
+            "error": self.error,
+            "generation": self.generation,
+            "reloading": self.reloading,
+        }
+
+
+def _is_ready(instance):
+    # Os recomendadores capturam os próprios erros de carga e sinalizam via is_ready
+    return getattr(instance, 'is_ready', True)
+
+
+def watch_generations(recommenders, interval=CACHE_SWAP_SECONDS):
+    """Inicia a thread daemon que troca a geração dos recomendadores já carregados quando CURRENT muda."""
+    recommenders = list(recommenders)
+    def _run():
+        while True:
+            time.sleep(interval)
+            for lazy in recommenders:
+                try: lazy.refresh_generation()
+                except Exception: traceback.print_exc()
+    thread = threading.Thread(target=_run, name='cache-generations', daemon=True)
+    thread.start()
+    return thread
+
+
+def init_app(app, recommenders):
+    """
+    Registra /api/ready e /api/admin/cache, dispara o aquecimento (RECOMMENDER_WARMUP)
+    e a vigia de gerações (CACHE_SWAP_SECONDS) dos recomendadores do processo.
+
+    Args:
+        recommenders: dict domínio -> LazyRecommender
+    """
+    from flask import jsonify
+
+    # Prontidão: 200 só quando todos os domínios servidos já carregaram seus caches
+    @app.route('/api/ready')
+    def readiness_check():
+        status = {domain: lazy.status() for domain, lazy in recommenders.items()}
+        ready = all(s['state'] == READY for s in status.values())
+        return jsonify({"ready": ready, "domains": status}), 200 if ready else 503
+
+    # Geração de cache em uso por domínio neste processo, a publicada em disco (CURRENT) e as disponíveis
+    @app.route('/api/admin/cache')
+    def cache_generations():
+        return jsonify({"pid": os.getpid(), "domains": {domain: lazy.generation_status() for domain, lazy in recommenders.items()}})
+
+    if RECOMMENDER_WARMUP:
+        for lazy in recommenders.values(): lazy.warm_up()
+    # Troca para a geração nova quando um build publica outra (sem reiniciar o processo)
+    if CACHE_SWAP_SECONDS > 0:
+        watch_generations(recommenders.values())
@@ -0,0 +1,170 @@
+# backend/common/metrics.py
+"""
+Métricas de latência no formato texto do Prometheus (rota /metrics).
+
+Sem dependências: histogramas e gauges simples, com uma trava por métrica,
+guardados por processo (com vários workers, cada um expõe os próprios números).
+
+Nas requisições, `init_app` mede a duração total (domínio, rota, método,
+status) e abre um cronômetro por requisição; o código da rota e dos
+recomendadores chama `mark('etapa')` ao fim de cada etapa (parse, id_lookup,
+similarity, penalty, categorization, serialization...), e o tempo desde a
+marca anterior vai para o histograma de etapas. Fora de uma requisição (builds,
+scripts) `mark` não faz nada.
+"""
+
+import os
+import time
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+# Limites dos buckets em segundos (de 0,5 ms a 10 s)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if value not in (float('inf'), float('-inf')) else ('+Inf' if value > 0 else '-Inf')
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # valores dos rótulos -> [contagem por bucket (+Inf no fim), soma]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *labelvalues):
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None: series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bucket] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock: snapshot = [(k, list(counts), total) for k, (counts, total) in sorted(self._series.items())]
+        for labelvalues, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_labels(self.labelnames, labelvalues, [("le", _number(bound))])} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labelvalues)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labelvalues)} {cumulative}')
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def set(self, value, *labelvalues):
+        with self._lock: self._values[labelvalues] = float(value)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        with self._lock: snapshot = sorted(self._values.items())
+        lines.extend(f'{self.name}{_labels(self.labelnames, k)} {_number(v)}' for k, v in snapshot)
+        return lines
+
+
+def bounded_label(value, known, other='other'):
+    """Valor de rótulo restrito a um conjunto conhecido: valores livres (caminhos, ids) criariam uma série por valor."""
+    return value if value in known else other
+
+
+def render():
+    """Todas as métricas registradas, no formato texto do Prometheus."""
+    return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
+
+
+REQUEST_SECONDS = Histogram('recommender_request_duration_seconds', 'Duração total das requisições', ('domain', 'route', 'method', 'status'))
+STAGE_SECONDS = Histogram('recommender_stage_duration_seconds', 'Duração de cada etapa das requisições', ('domain', 'route', 'stage'))
+CACHE_LOAD_SECONDS = Gauge('recommender_cache_load_seconds', 'Tempo da última carga do cache de cada domínio', ('domain',))
+
+
+class RequestTimer:
+    def __init__(self, domain, route):
+        self.domain = domain
+        self.route = route
+        self.started_at = self.last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        STAGE_SECONDS.observe(now - self.last, self.domain, self.route, stage)
+        self.last = now
+
+
+_current = ContextVar('request_timer', default=None)
+
+
+def mark(stage):
+    """Fecha a etapa `stage` da requisição atual: registra o tempo desde a marca anterior (ou o início)."""
+    timer = _current.get()
+    if timer is not None: timer.mark(stage)
+
+
+def _domain(blueprint, default):
+    # 'games_bp' -> 'games'; rotas fora de blueprints usam o domínio do serviço
+    if not blueprint: return default or 'app'
+    return blueprint[:-3] if blueprint.endswith('_bp') else blueprint
+
+
+def init_app(app, domain=None):
+    """
+    Instrumenta um app Flask e registra a rota /metrics.
+
+    Args:
+        domain: rótulo das rotas registradas fora de blueprints (ex.: 'games' no app do Steam)
+    """
+    from flask import request
+
+    @app.route('/metrics')
+    def metrics():
+        return render(), 200, {'Content-Type': CONTENT_TYPE}
+
+    if not METRICS_ENABLED: return
+
+    @app.before_request
+    def _start_timer():
+        # A rota é o último segmento da regra (ex.: 'recommend'); 404s ficam juntos em 'unmatched'
+        route = request.url_rule.rule.rsplit('/', 1)[-1] if request.url_rule is not None else 'unmatched'
+        _current.set(None if request.endpoint == 'metrics' else RequestTimer(_domain(request.blueprint, domain), route))
+
+    @app.after_request
+    def _observe_request(response):
+        timer = _current.get()
+        if timer is not None:
+            REQUEST_SECONDS.observe(time.perf_counter() - timer.started_at, timer.domain, timer.route, request.method, str(response.status_code))
+            _current.set(None)
+        return response
+
+    @app.teardown_request
+    def _observe_failure(error=None):
+        # Só sobra cronômetro aqui se a rota levantou exceção antes de gerar resposta
+        timer = _current.get()
+        if timer is not None:
+            REQUEST_SECONDS.observe(time.perf_counter() - timer.started_at, timer.domain, timer.route, request.method, '500')
+            _current.set(None)
@@ -0,0 +1,123 @@
+# backend/common/neighbors.py
+"""
+Tabelas de vizinhos item-a-item pré-calculadas no build de cache.
+
+Para cada item do catálogo são guardados os K vizinhos mais similares
+(posições em int32 e similaridades em float16). Como o catálogo só muda
+entre builds, o caminho de recomendação por item apenas mescla as listas
+dos itens selecionados: O(selecionados x K) em vez de O(catálogo).
+"""
+
+import os
+import numpy as np
+
+from .ann_index import dot_scores, top_k
+
+NEIGHBORS_K = int(os.getenv('NEIGHBORS_K', '50'))
+
+
+class NeighborTable:
+    def __init__(self, ids, scores):
+        self.ids = ids
+        self.scores = scores
+
+    @property
+    def k(self):
+        return self.ids.shape[1]
+
+    @classmethod
+    def build(cls, vectors, k=NEIGHBORS_K, chunk_size=1024):
+        """
+        Busca exata, em blocos de linhas, dos K vizinhos de cada item.
+
+        O próprio item entra na lista (similaridade 1), como acontece na
+        varredura completa; quem consulta a tabela exclui os itens de entrada.
+        """
+        n_items = vectors.shape[0]
+        k = min(k, n_items)
+        ids = np.empty((n_items, k), dtype=np.int32)
+        scores = np.empty((n_items, k), dtype=np.float16)
+        for start in range(0, n_items, chunk_size):
+            best, best_scores = top_k(dot_scores(vectors[start:start + chunk_size], vectors), k)
+            ids[start:start + chunk_size] = best
+            scores[start:start + chunk_size] = best_scores
+        return cls(ids, scores)
+
+    def update(self, vectors, patch, chunk_size=1024, max_recompute=0.3):
+        """
+        Tabela do catálogo alterado por `patch` (CatalogPatch) sem refazer a busca de todos os itens.
+
+        As linhas do delta e as que tinham entre os vizinhos um item removido ou
+        alterado são recalculadas (busca exata); as demais mantêm a lista,
+        reindexada, e só concorrem com os itens do delta. O resultado é o do
+        build. Se for preciso recalcular mais de `max_recompute` do catálogo,
+        refaz a tabela inteira.
+        """
+        n_items, k = vectors.shape[0], self.k
+        if n_items < k: return NeighborTable.build(vectors, k)
+        old_ids = np.asarray(self.ids)
+        touched = np.zeros(patch.n_old, dtype=bool)
+        touched[patch.changed_old] = touched[patch.deleted_old] = True
+        stale = touched[old_ids].any(axis=1)
+        kept_old = patch.unchanged_old[~stale[patch.unchanged_old]]
+        delta_rows = patch.changed_rows
+        recompute = np.union1d(patch.old_to_new[patch.unchanged_old[stale[patch.unchanged_old]]], delta_rows)
+        if len(recompute) > max_recompute * n_items: return NeighborTable.build(vectors, k)
+
+        ids = np.empty((n_items, k), dtype=np.int32)
+        scores = np.empty((n_items, k), dtype=np.float16)
+        rows = patch.old_to_new[kept_old]
+        ids[rows] = patch.old_to_new[old_ids[kept_old]]
+        scores[rows] = self.scores[kept_old]
+        # Itens do delta que entram nas listas mantidas: os k melhores entre a lista atual e o bloco do delta
+        for start in range(0, len(delta_rows), chunk_size):
+            block = delta_rows[start:start + chunk_size]
+            block_scores = dot_scores(vectors[block], vectors)
+            for row_start in range(0, len(rows), chunk_size):
+                target = rows[row_start:row_start + chunk_size]
+                candidates = np.hstack([ids[target], np.broadcast_to(block, (len(target), len(block)))])
+                best, best_scores = top_k(np.hstack([scores[target].astype(np.float64), block_scores[:, target].T]), k)
+                ids[target] = np.take_along_axis(candidates, best, axis=1)
+                scores[target] = best_scores
+        for start in range(0, len(recompute), chunk_size):
+            block = recompute[start:start + chunk_size]
+            best, best_scores = top_k(dot_scores(vectors[block], vectors), k)
+            ids[block] = best
+            scores[block] = best_scores
+        return NeighborTable(ids, scores)
+
+    def lookup(self, rows, top_n):
+        """Os `top_n` primeiros vizinhos de cada linha (similaridades em float64)."""
+        return self.ids[rows, :top_n], self.scores[rows, :top_n].astype(np.float64)
+
+    def to_arrays(self):
+        """Arrays a persistir no cache."""
+        return {'neighbor_ids': self.ids, 'neighbor_scores': self.scores}
+
+    @classmethod
+    def from_artifacts(cls, artifacts, n_items):
+        """Tabela gravada no cache (ArtifactSet); None se ausente ou de outro catálogo."""
+        if artifacts is None or 'neighbor_ids' not in artifacts: return None
+        table = cls(artifacts['neighbor_ids'], artifacts['neighbor_scores'])
+        if table.ids.shape[0] == n_items: return table
+        print(f"AVISO: tabela de vizinhos em '{artifacts.directory}' não corresponde ao catálogo carregado. Ignorando.")
+        return None
+
+
+def merge_candidates(indices, similarities, exclude_rows):
+    """
+    Mescla listas de vizinhos (uma por item selecionado) em um único ranking.
+
+    Descarta posições vazias (-1) e os itens de entrada, mantendo a maior
+    similaridade de cada candidato.
+
+    Returns:
+        tuple: (posições, similaridades) ordenadas por similaridade decrescente
+    """
+    indices, similarities = np.ravel(indices), np.ravel(similarities)
+    keep = (indices >= 0) & ~np.isin(indices, exclude_rows)
+    indices, similarities = indices[keep], similarities[keep]
+    order = np.argsort(-similarities, kind='stable')
+    _, first_positions = np.unique(indices[order], return_index=True)
+    order = order[np.sort(first_positions)]
+    return indices[order], similarities[order]
@@ -0,0 +1,67 @@
+# backend/common/precomputed.py
+"""
+Respostas pré-serializadas para rotas sem parâmetros (discover).
+
+O payload é montado uma vez por catálogo carregado (na primeira requisição)
+e guardado como bytes, com ETag (hash do corpo) e Last-Modified. As requisições seguintes
+só copiam os bytes; clientes com If-None-Match/If-Modified-Since recebem 304.
+
+A amostra "explorar" pode rodar num intervalo fixo (DISCOVER_ROTATION_SECONDS):
+cada janela de tempo tem a sua semente, igual em todos os workers, e o
+payload é refeito quando a janela muda. Com 0 a amostra é sempre a mesma.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+from .serialization import dumps
+
+DISCOVER_ROTATION_SECONDS = int(os.getenv('DISCOVER_ROTATION_SECONDS', '0'))
+
+
+def rotation_slot(rotation):
+    """Índice da janela de rotação atual (0 sem rotação)."""
+    return int(time.time() // rotation) if rotation > 0 else 0
+
+
+class PrecomputedPayload:
+    def __init__(self, build, rotation=DISCOVER_ROTATION_SECONDS, generation=None):
+        """
+        Args:
+            build: função (janela de rotação) -> objeto serializável em JSON
+            rotation: duração da janela em segundos; 0 desliga a rotação
+            generation: função opcional cujo valor, ao mudar, também refaz o payload (ex.: ano corrente)
+        """
+        self.build = build
+        self.rotation = rotation
+        self.generation = generation
+        self._entry = None  # (chave, corpo, etag, last_modified)
+        self._lock = threading.Lock()
+
+    def _key(self):
+        return rotation_slot(self.rotation), self.generation() if self.generation else None
+
+    def entry(self):
+        key, entry = self._key(), self._entry
+        if entry is not None and entry[0] == key: return entry
+        with self._lock:
+            entry = self._entry
+            if entry is None or entry[0] != key:
+                body = dumps(self.build(key[0]))
+                # Com rotação, Last-Modified é o início da janela (o mesmo em todos os workers)
+                modified_at = key[0] * self.rotation if self.rotation > 0 else time.time()
+                entry = self._entry = (key, body, hashlib.sha256(body).hexdigest()[:32], datetime.fromtimestamp(int(modified_at), tz=timezone.utc))
+        return entry
+
+    def response(self):
+        """Resposta Flask com o corpo pronto, ou 304 se o cliente já tem esta versão."""
+        from flask import current_app, request
+        _, body, etag, last_modified = self.entry()
+        response = current_app.response_class(body, status=200, mimetype='application/json')
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.cache_control.no_cache = True  # o cliente pode guardar, mas revalida (304 barato)
+        return response.make_conditional(request)
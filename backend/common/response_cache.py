@@ -0,0 +1,202 @@
+# backend/common/response_cache.py
+"""
+Cache de respostas para rotas determinísticas (recommend, search, discover, genres).
+
+A chave é a requisição normalizada (serviço, rota, ids ordenados e sem
+repetição, gênero, termo de busca) mais a versão do cache carregado (hash
+dos artefatos), então um rebuild invalida tudo automaticamente. Cada processo
+mantém um LRU com TTL e teto em bytes; opcionalmente um backend compartilhado
+(diretório local ou Redis) permite que workers reaproveitem os acertos uns
+dos outros.
+"""
+
+import os
+import time
+import json
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '600'))
+# Backend compartilhado: vazio (só memória), "file:/caminho/do/diretorio" ou "redis://host:6379/0"
+RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', '')
+
+
+def make_key(namespace, route, version, **params):
+    """
+    Chave normalizada da requisição; None se os parâmetros não forem cacheáveis.
+
+    O namespace identifica quem responde (ex.: 'games_bp' no app monolítico,
+    'steam_app' no serviço independente): as rotas coincidem, mas o formato
+    das respostas não, e o backend compartilhado pode atender aos dois.
+
+    Listas de ids viram conjuntos ordenados (a ordem e as repetições da seleção
+    não mudam o resultado); o tipo de cada id é preservado, já que 1 e "1" não
+    casam com as mesmas linhas do catálogo.
+    """
+    normalized = {}
+    try:
+        for name, value in sorted(params.items()):
+            if isinstance(value, (list, tuple, set)):
+                value = sorted(set(value), key=lambda v: (type(v).__name__, str(v)))
+            normalized[name] = value
+        raw = json.dumps([namespace, route, version, normalized], sort_keys=True, ensure_ascii=False)
+    except TypeError:
+        return None
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def cache_version(artifacts, *paths):
+    """Versão do cache: hash dos artefatos ou, no formato antigo (pickle), tamanho e mtime dos arquivos."""
+    if artifacts is not None: return artifacts.content_hash
+    stamp = [(os.path.basename(p), os.path.getsize(p), int(os.path.getmtime(p))) for p in paths if os.path.exists(p)]
+    return 'legacy-' + hashlib.sha256(json.dumps(stamp).encode('utf-8')).hexdigest()[:16]
+
+
+class FileBackend:
+    """Backend compartilhado em diretório local: um arquivo por chave (validade + corpo)."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.bin")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f: data = f.read()
+        except FileNotFoundError:
+            return None
+        expires_at, = struct.unpack_from('<d', data)
+        if expires_at < time.time():
+            try: os.remove(self._path(key))
+            except FileNotFoundError: pass
+            return None
+        return data[8:]
+
+    def set(self, key, body, ttl):
+        temp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f: f.write(struct.pack('<d', time.time() + ttl) + body)
+        os.replace(temp_path, self._path(key))
+
+
+class RedisBackend:
+    """Backend compartilhado em Redis (ou servidor compatível); requer o pacote `redis`."""
+
+    def __init__(self, url, prefix='response-cache:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key, body, ttl):
+        self.client.set(self.prefix + key, body, ex=max(1, int(ttl)))
+
+
+def backend_from_url(url):
+    if not url: return None
+    if url.startswith('file:'): return FileBackend(url[len('file:'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')): return RedisBackend(url)
+    raise ValueError(f"Backend de cache desconhecido: '{url}'.")
+
+
+class ResponseCache:
+    """LRU em memória com TTL e teto em bytes, com contadores e backend compartilhado opcional."""
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES, ttl=RESPONSE_CACHE_TTL, backend=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.backend = backend
+        self._entries = OrderedDict()  # chave -> (expira_em, corpo)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.shared_hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._remove(key)
+                self.expirations += 1
+        body = self._backend_get(key)
+        with self._lock:
+            if body is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+        self._put(key, body)
+        return body
+
+    def set(self, key, body):
+        self._put(key, body)
+        if self.backend is not None:
+            try: self.backend.set(key, body, self.ttl)
+            except Exception as e: print(f"AVISO: falha ao gravar no cache compartilhado: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes, "ttl": self.ttl,
+                "hits": self.hits, "shared_hits": self.shared_hits, "misses": self.misses,
+                "evictions": self.evictions, "expirations": self.expirations,
+                "hit_rate": round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+                "backend": type(self.backend).__name__ if self.backend is not None else None,
+            }
+
+    def _backend_get(self, key):
+        if self.backend is None: return None
+        try: return self.backend.get(key)
+        except Exception as e:
+            print(f"AVISO: falha ao ler do cache compartilhado: {e}")
+            return None
+
+    def _put(self, key, body):
+        size = len(key) + len(body)
+        if size > self.max_bytes: return
+        with self._lock:
+            if key in self._entries: self._remove(key)
+            self._entries[key] = (time.time() + self.ttl, body)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, body = self._entries.pop(key)
+        self._bytes -= len(key) + len(body)
+
+
+RESPONSE_CACHE = ResponseCache(backend=backend_from_url(RESPONSE_CACHE_BACKEND))
+
+
+def cached_response(key):
+    """Resposta Flask pronta para a chave, ou None (cache desligado, chave inválida ou ausente)."""
+    if not RESPONSE_CACHE_ENABLED or key is None: return None
+    body = RESPONSE_CACHE.get(key)
+    if body is None: return None
+    from flask import current_app
+    return current_app.response_class(body, status=200, mimetype='application/json')
+
+
+def store_response(key, response):
+    """Guarda o corpo das respostas 200 e devolve a própria resposta."""
+    if RESPONSE_CACHE_ENABLED and key is not None and response.status_code == 200 and not response.direct_passthrough:
+        RESPONSE_CACHE.set(key, response.get_data())
+    return response
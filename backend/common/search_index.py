@@ -0,0 +1,123 @@
+# backend/common/search_index.py
+"""
+Índice invertido de n-gramas para a busca por título/artista (type-ahead).
+
+No build, cada texto de busca (minúsculo) é quebrado em n-gramas de 1 a 3
+caracteres; cada n-grama aponta para as posições, no ranking de popularidade,
+dos itens que o contêm. Na consulta:
+
+- termos de até 3 caracteres são um n-grama: a própria lista já é a resposta,
+  em ordem de popularidade, e basta cortar nos `limit` primeiros;
+- termos maiores usam a menor lista entre os seus trigramas como candidatos,
+  percorrida em ordem de popularidade e confirmada por busca de substring,
+  parando ao atingir `limit` resultados.
+
+Assim o custo depende do tamanho das listas consultadas, não do catálogo.
+Os textos ficam num único bloco UTF-8 (com offsets) e o vocabulário de
+n-gramas num array ordenado, tudo gravável como artefato mmap.
+"""
+
+import numpy as np
+
+NGRAM_SIZES = (1, 2, 3)
+MAX_NGRAM = max(NGRAM_SIZES)
+
+
+def _ngrams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class SearchIndex:
+    def __init__(self, text_bytes, text_offsets, rows, grams, gram_offsets, postings):
+        self.text_bytes = text_bytes      # uint8: textos concatenados, em ordem de popularidade
+        self.text_offsets = text_offsets  # int64: início de cada texto (n + 1 posições)
+        self.rows = rows                  # int32: posição no ranking -> linha do DataFrame
+        self.grams = grams                # 'U3' ordenado: vocabulário de n-gramas
+        self.gram_offsets = gram_offsets  # int64: início da lista de cada n-grama em `postings`
+        self.postings = postings          # int32: posições no ranking, crescentes dentro de cada lista
+
+    @classmethod
+    def build(cls, texts, popularity=None):
+        """
+        Args:
+            texts: texto de busca de cada linha do DataFrame (será convertido para minúsculas)
+            popularity: score de ordenação dos resultados (maior primeiro); None mantém a ordem das linhas
+        """
+        texts = [str(t).lower() if isinstance(t, str) else '' for t in texts]
+        ranking = np.arange(len(texts)) if popularity is None else np.argsort(-np.nan_to_num(np.asarray(popularity, dtype=np.float64), nan=-np.inf), kind='stable')
+        encoded = [texts[row].encode('utf-8') for row in ranking]
+        text_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        text_offsets[1:] = np.cumsum([len(e) for e in encoded])
+        text_bytes = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+        lists = {}
+        for rank, row in enumerate(ranking):
+            text = texts[row]
+            for n in NGRAM_SIZES:
+                for gram in _ngrams(text, n): lists.setdefault(gram, []).append(rank)
+        grams = np.array(sorted(lists), dtype=f'U{MAX_NGRAM}')
+        sizes = np.array([len(lists[g]) for g in grams], dtype=np.int64)
+        gram_offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        postings = np.fromiter((rank for g in grams for rank in lists[g]), dtype=np.int32, count=int(sizes.sum()))
+        return cls(text_bytes, text_offsets, ranking.astype(np.int32), grams, gram_offsets, postings)
+
+    def to_arrays(self):
+        """Arrays a persistir no cache."""
+        return {
+            'search_text_bytes': self.text_bytes, 'search_text_offsets': self.text_offsets, 'search_rows': self.rows,
+            'search_grams': self.grams, 'search_gram_offsets': self.gram_offsets, 'search_postings': self.postings,
+        }
+
+    @classmethod
+    def from_artifacts(cls, artifacts, n_items):
+        """Índice gravado no cache (ArtifactSet); None se ausente ou de outro catálogo."""
+        if artifacts is None or 'search_postings' not in artifacts: return None
+        index = cls(*(artifacts[name] for name in ('search_text_bytes', 'search_text_offsets', 'search_rows', 'search_grams', 'search_gram_offsets', 'search_postings')))
+        if index.rows.shape[0] == n_items: return index
+        print(f"AVISO: índice de busca em '{artifacts.directory}' não corresponde ao catálogo carregado. Ignorando.")
+        return None
+
+    def _postings(self, gram):
+        position = np.searchsorted(self.grams, gram)
+        if position >= len(self.grams) or self.grams[position] != gram: return self.postings[:0]
+        return self.postings[self.gram_offsets[position]:self.gram_offsets[position + 1]]
+
+    def texts(self, ranks):
+        """Textos de busca (minúsculos) das posições do ranking."""
+        return [self.text_bytes[self.text_offsets[rank]:self.text_offsets[rank + 1]].tobytes().decode('utf-8') for rank in ranks]
+
+    def overlap_candidates(self, query, max_candidates):
+        """
+        Lista curta para buscas fuzzy: as posições do ranking que mais compartilham
+        bigramas e trigramas com `query` (ou o próprio termo, se ele for mais curto).
+
+        Returns:
+            np.ndarray: até `max_candidates` posições, em ordem crescente
+        """
+        query = query.lower()
+        if not query: return self.postings[:0]
+        sizes = [n for n in NGRAM_SIZES[1:] if n <= len(query)] or [len(query)]
+        lists = [self._postings(gram) for n in sizes for gram in _ngrams(query, n)]
+        ranks, counts = np.unique(np.concatenate(lists), return_counts=True)
+        if len(ranks) > max_candidates:
+            # Empates na contagem ficam com as primeiras posições, como no desempate do extractBests
+            ranks = np.sort(ranks[np.argsort(-counts, kind='stable')[:max_candidates]])
+        return ranks
+
+    def search(self, query, limit):
+        """
+        Linhas do DataFrame cujo texto contém `query` (substring), mais populares primeiro.
+
+        Returns:
+            np.ndarray: até `limit` posições de linha (para usar com .iloc)
+        """
+        query = query.lower()
+        if not query or limit <= 0: return self.rows[:0]
+        if len(query) <= MAX_NGRAM: return self.rows[self._postings(query)[:limit]]
+        candidates = min((self._postings(gram) for gram in _ngrams(query, MAX_NGRAM)), key=len)
+        needle, hits = query.encode('utf-8'), []
+        for rank in candidates:
+            if needle in self.text_bytes[self.text_offsets[rank]:self.text_offsets[rank + 1]].tobytes():
+                hits.append(rank)
+                if len(hits) == limit: break
+        return self.rows[np.asarray(hits, dtype=np.int64)]
@@ -0,0 +1,95 @@
+# backend/common/serialization.py
+"""
+Serialização das respostas com itens do catálogo.
+
+Antes cada resposta fazia `to_dict('records')` com todas as colunas do parquet
+(e, nos jogos, um `sanitize_for_json` recursivo célula a célula) e depois o
+jsonify. Aqui:
+
+- cada domínio declara em SCHEMAS os campos que o frontend usa; só eles são
+  convertidos e enviados (SERIALIZE_ALL_COLUMNS=true volta a mandar todas);
+- a conversão de tipos NumPy é feita por coluna (NaN/inf viram null);
+- o JSON é gerado direto em bytes pelo orjson, se instalado (senão, json da
+  biblioteca padrão).
+"""
+
+import os
+import json
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from .metrics import mark
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SERIALIZE_ALL_COLUMNS = os.getenv('SERIALIZE_ALL_COLUMNS', 'false').lower() == 'true'
+
+# Campos de cada item enviados ao frontend, por domínio (os ausentes no DataFrame são ignorados)
+SCHEMAS = {
+    'games': ('appid', 'name', 'header_image', 'genres', 'release_year', 'quality', 'display_score', 'similarity_score'),
+    'movies': ('id', 'title', 'poster_url', 'genres', 'genres_list', 'release_date', 'vote_average', 'popularity', 'similarity_score'),
+    'music': ('id', 'name', 'track_name', 'artists', 'artist_name', 'genres', 'track_genre', 'popularity', 'similarity_score'),
+}
+
+
+def _to_python(value):
+    if isinstance(value, np.ndarray): return [_to_python(v) for v in value.tolist()]
+    if isinstance(value, (list, tuple)): return [_to_python(v) for v in value]
+    if isinstance(value, np.generic): value = value.item()
+    if isinstance(value, float) and not np.isfinite(value): return None
+    if value is pd.NaT or value is pd.NA: return None
+    if isinstance(value, date): return value.isoformat()
+    return value
+
+
+def _column_values(series):
+    """Valores de uma coluna como objetos Python nativos, convertidos de uma vez quando o dtype permite."""
+    values = series.to_numpy()
+    if values.dtype.kind in 'iub': return values.tolist()
+    if values.dtype.kind == 'f':
+        converted = values.astype(object)
+        converted[~np.isfinite(values)] = None
+        return converted.tolist()
+    if values.dtype.kind == 'M':
+        return [None if pd.isna(v) else v.isoformat() for v in series]
+    return [_to_python(v) for v in values]
+
+
+def records(df, domain=None):
+    """
+    Lista de dicts (um por linha) com os campos do schema do domínio.
+
+    Args:
+        df: DataFrame com os itens, já na ordem da resposta
+        domain: chave de SCHEMAS; None mantém todas as colunas
+    """
+    if df is None or df.empty: return []
+    columns = list(df.columns) if SERIALIZE_ALL_COLUMNS or domain is None else [c for c in SCHEMAS[domain] if c in df.columns]
+    values = [_column_values(df[c]) for c in columns]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+def _default(value):
+    converted = _to_python(value)
+    if converted is value: raise TypeError(f"Tipo não serializável em JSON: {type(value).__name__}")
+    return converted
+
+
+def dumps(payload):
+    """JSON compacto em bytes (UTF-8)."""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(payload, status=200):
+    """Resposta Flask com o payload já serializado (substitui o jsonify nas rotas com itens)."""
+    from flask import current_app
+    body = dumps(payload)
+    mark('serialization')
+    return current_app.response_class(body, status=status, mimetype='application/json')
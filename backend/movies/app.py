@@ -2,21 +2,40 @@
 import pandas as pd
 import numpy as np
 import pickle
-from sklearn.metrics.pairwise import cosine_similarity
 # --- MUDANÇA 1: Importar Blueprint e Flask ---
 from flask import Flask, Blueprint, request, jsonify
 import json
 import os
+import sys
 import traceback
 from collections import Counter
-from thefuzz import fuzz
 from datetime import datetime
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.ann_index import ANN_CANDIDATE_POOL, index_from_artifacts, prepare_vectors, profile_query
+from common.artifacts import ARTIFACTS_DIR, load_artifacts
+from common.compact import compact, vectors_from_artifacts
+from common.generations import resolve
+from common.id_index import IdIndex
+from common.search_index import SearchIndex
+from common.dedup import TitleDeduplicator
+from common.categories import Bucket, CategoryAllocator
+from common.genre_bits import GenreBits
+from common import lazy
+from common.lazy import LazyRecommender
+from common.precomputed import PrecomputedPayload
+from common.serialization import json_response, records
+from common import metrics
+from common.metrics import mark
+from common.response_cache import cache_version, cached_response, make_key, store_response
+
 # --- SEU CÓDIGO EXISTENTE (QUASE INTACTO) ---
 
 class MovieRecommender:
-    def __init__(self):
+    def __init__(self, cache_dir=None):
         self.df_movies = None; self.tfidf_matrix = None; self.is_ready = False
+        # Pasta do cache com as gerações; a vigia de gerações compara o CURRENT dela com a geração carregada
+        self.cache_root = cache_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
         self.QUANTILE_95_POPULARITY = 0; self.GENRES_LIST = []
         try:
             self._initialize_from_cache()
@@ -25,22 +44,42 @@ class MovieRecommender:
 
     def _initialize_from_cache(self):
         print("Carregando cache de filmes (v13.2)...")
-        base_dir = os.path.dirname(__file__)
-        CACHE_DIR = os.path.join(base_dir, 'cache')
+        # Geração ativa apontada por CURRENT (ou a própria pasta no layout antigo)
+        self.generation, CACHE_DIR = resolve(self.cache_root)
         self.df_movies = pd.read_parquet(os.path.join(CACHE_DIR, 'movies_processed.parquet'))
-        with open(os.path.join(CACHE_DIR, 'movie_tfidf_matrix.pkl'), 'rb') as f: self.tfidf_matrix = pickle.load(f)
+        artifacts = load_artifacts(os.path.join(CACHE_DIR, ARTIFACTS_DIR))
+        if artifacts is not None:
+            self.tfidf_matrix, self.tfidf_norms = vectors_from_artifacts(artifacts, 'tfidf_matrix'), artifacts['tfidf_norms']
+        else:
+            with open(os.path.join(CACHE_DIR, 'movie_tfidf_matrix.pkl'), 'rb') as f: self.tfidf_matrix, self.tfidf_norms = prepare_vectors(pickle.load(f))
+            self.tfidf_matrix = compact(self.tfidf_matrix)
+        self.index = index_from_artifacts(artifacts, self.tfidf_matrix)
+        self.search_index = SearchIndex.from_artifacts(artifacts, len(self.df_movies))
+        self.id_index = IdIndex(self.df_movies['id'])
+        self.title_dedup = TitleDeduplicator.from_artifacts(artifacts, self.df_movies['title'])
+        self.genre_bits = GenreBits.from_artifacts(artifacts, self.df_movies['genres'])
+        self.cache_version = cache_version(artifacts, os.path.join(CACHE_DIR, 'movies_processed.parquet'))
         with open(os.path.join(CACHE_DIR, 'genres.json'), 'r', encoding='utf-8') as f: self.GENRES_LIST = json.load(f)
         self.df_movies['release_date_dt'] = pd.to_datetime(self.df_movies['release_date'], errors='coerce')
         self.QUANTILE_95_POPULARITY = self.df_movies['popularity'].quantile(0.95)
+        self.QUANTILE_30_POPULARITY = self.df_movies['popularity'].quantile(0.3)
+        self.QUANTILE_70_POPULARITY = self.df_movies['popularity'].quantile(0.7)
+        # Sem amostragem: o payload só muda com o ano corrente (janela de lançamentos recentes)
+        self.discover_payload = PrecomputedPayload(lambda slot: self.discover_movies(), rotation=0, generation=lambda: datetime.now().year)
         self.is_ready = True
         print(f">>> Sistema de filmes pronto. {len(self.df_movies)} filmes e {len(self.GENRES_LIST)} gêneros carregados. <<<")
 
     def search_movies(self, query, limit=20):
         if not self.is_ready or not query: return []
         query = query.lower()
-        results_df = self.df_movies[self.df_movies['search_features'].str.contains(query, na=False)]
-        sorted_results = results_df.sort_values(by='popularity', ascending=False).head(limit)
-        return sorted_results.assign(poster_url='https://image.tmdb.org/t/p/w500' + sorted_results['poster_path'] ).to_dict('records')
+        if self.search_index is not None:
+            # Índice invertido do build: resultados já em ordem de popularidade, sem varrer o catálogo
+            sorted_results = self.df_movies.iloc[self.search_index.search(query, limit)]
+        else:
+            results_df = self.df_movies[self.df_movies['search_features'].str.contains(query, na=False)]
+            sorted_results = results_df.sort_values(by='popularity', ascending=False).head(limit)
+        mark('search')
+        return records(sorted_results.assign(poster_url='https://image.tmdb.org/t/p/w500' + sorted_results['poster_path']), 'movies')
 
     def discover_movies(self):
         if not self.is_ready: return {}
@@ -50,8 +89,8 @@ class MovieRecommender:
         popular_releases = recent_movies.sort_values(by='popularity', ascending=False).head(NUM_DISCOVER_MOVIES)
         critically_acclaimed = self.df_movies[self.df_movies['vote_average'] > 8.0].sort_values(by='popularity', ascending=False).head(NUM_DISCOVER_MOVIES)
         return {
-            "popular_releases": popular_releases.assign(poster_url='https://image.tmdb.org/t/p/w500' + popular_releases['poster_path'] ).to_dict('records'),
-            "critically_acclaimed": critically_acclaimed.assign(poster_url='https://image.tmdb.org/t/p/w500' + critically_acclaimed['poster_path'] ).to_dict('records')
+            "popular_releases": records(popular_releases.assign(poster_url='https://image.tmdb.org/t/p/w500' + popular_releases['poster_path']), 'movies'),
+            "critically_acclaimed": records(critically_acclaimed.assign(poster_url='https://image.tmdb.org/t/p/w500' + critically_acclaimed['poster_path']), 'movies')
         }
 
     def _calculate_hybrid_score(self, df):
@@ -63,16 +102,13 @@ class MovieRecommender:
 
     def _finalize_recommendations(self, df, num_recs, score_column='hybrid_score'):
         if df.empty or score_column not in df.columns: return []
-        df_sorted = df.sort_values(by=score_column, ascending=False).copy()
-        final_recs_list = []
-        for _, movie in df_sorted.head(num_recs * 3).iterrows():
-            is_redundant = False
-            for rec in final_recs_list:
-                if fuzz.token_sort_ratio(movie['title'], rec['title']) > 90: is_redundant = True; break
-            if not is_redundant: final_recs_list.append(movie.to_dict())
-            if len(final_recs_list) >= num_recs: break
-        if not final_recs_list: return []
-        final_df = pd.DataFrame(final_recs_list)
+        df_sorted = df.sort_values(by=score_column, ascending=False).head(num_recs * 3)
+        # Descarta títulos quase idênticos aos já escolhidos (pares calculados no build de cache)
+        return self._score_recommendations(df_sorted.iloc[self.title_dedup.first_distinct(df_sorted.index.to_numpy(), num_recs)], score_column)
+
+    def _score_recommendations(self, final_df, score_column='hybrid_score'):
+        if final_df.empty: return []
+        final_df = final_df.reset_index(drop=True)
         if len(final_df) >= 1: final_df.loc[final_df.index[0], 'final_score'] = np.random.uniform(98, 99)
         if len(final_df) >= 2: final_df.loc[final_df.index[1], 'final_score'] = np.random.uniform(96, 97)
         if len(final_df) >= 3: final_df.loc[final_df.index[2], 'final_score'] = np.random.uniform(95, 96)
@@ -89,34 +125,44 @@ class MovieRecommender:
             try: return [g.strip() for g in str(genres_json).split(',')]
             except: return []
         final_df['genres_list'] = final_df['genres'].apply(get_genre_names)
-        return final_df.to_dict('records')
+        return records(final_df, 'movies')
 
     def recommend_movie_categories(self, selected_movie_ids, selected_genre):
         if not self.is_ready or not selected_movie_ids: return {}
-        selected_movies = self.df_movies[self.df_movies['id'].isin(selected_movie_ids)]
+        selected_movies = self.df_movies.iloc[self.id_index.rows(selected_movie_ids)]
         if selected_movies.empty: return {}
-        user_profile = self.tfidf_matrix[selected_movies.index].mean(axis=0)
+        mark('id_lookup')
+        query = profile_query(self.tfidf_matrix, self.tfidf_norms, selected_movies.index)
         exclude_ids = set(selected_movie_ids)
-        all_recs_df = self.df_movies[~self.df_movies['id'].isin(exclude_ids)].copy()
-        user_profile_array = np.asarray(user_profile)
-        cosine_similarities = cosine_similarity(user_profile_array, self.tfidf_matrix[all_recs_df.index]).flatten()
-        all_recs_df['similarity'] = cosine_similarities
-        all_recs_df = self._calculate_hybrid_score(all_recs_df)
-        main_recs = self._finalize_recommendations(all_recs_df, 12)
+        # Com o índice aproximado apenas o pool de candidatos é pontuado; a busca exata ranqueia o catálogo inteiro
+        pool_size = ANN_CANDIDATE_POOL if self.index.approximate else len(self.df_movies)
+        top_indices, top_similarities = self.index.search(query, pool_size + len(selected_movies))
+        found = top_indices[0] >= 0
+        all_recs_df = self.df_movies.iloc[top_indices[0][found]].copy()
+        all_recs_df['similarity'] = top_similarities[0][found]
+        all_recs_df = self._calculate_hybrid_score(all_recs_df).sort_values(by='hybrid_score', ascending=False)
+        mark('similarity')
+        # Categorias preenchidas numa passada sobre o ranking; cada uma examina no máximo 3x a sua cota (deduplicação de títulos)
+        allocator, rows = CategoryAllocator(all_recs_df['id'], used_ids=exclude_ids), all_recs_df.index.to_numpy()
+        picks = allocator.allocate([Bucket('main', 12, window=36)], dedup=self.title_dedup, rows=rows)
+        main_recs = self._score_recommendations(all_recs_df.iloc[picks['main']])
         exclude_ids.update([rec['id'] for rec in main_recs])
         genre_favorites = self.recommend_by_genre(selected_genre, exclude_ids)
-        exclude_ids.update([rec['id'] for rec in genre_favorites])
-        blockbusters = self._finalize_recommendations(all_recs_df[~all_recs_df['id'].isin(exclude_ids) & (all_recs_df['popularity'] > self.QUANTILE_95_POPULARITY)], 6)
-        exclude_ids.update([rec['id'] for rec in blockbusters])
-        cult_classics = self._finalize_recommendations(all_recs_df[~all_recs_df['id'].isin(exclude_ids) & (self.df_movies['release_date_dt'].dt.year < 2005) & (all_recs_df['vote_average'] > 7.0)], 6)
-        exclude_ids.update([rec['id'] for rec in cult_classics])
-        hidden_gems = self._finalize_recommendations(all_recs_df[~all_recs_df['id'].isin(exclude_ids) & (all_recs_df['vote_average'] > 7.5) & (all_recs_df['popularity'] < self.df_movies['popularity'].quantile(0.7)) & (all_recs_df['popularity'] > self.df_movies['popularity'].quantile(0.3))], 6)
+        allocator.exclude([rec['id'] for rec in genre_favorites])
+        popularity, vote_average = all_recs_df['popularity'], all_recs_df['vote_average']
+        picks = allocator.allocate([
+            Bucket('blockbusters', 6, mask=(popularity > self.QUANTILE_95_POPULARITY).to_numpy(), window=18),
+            Bucket('cult_classics', 6, mask=((all_recs_df['release_date_dt'].dt.year < 2005) & (vote_average > 7.0)).to_numpy(), window=18),
+            Bucket('hidden_gems', 6, mask=((vote_average > 7.5) & (popularity < self.QUANTILE_70_POPULARITY) & (popularity > self.QUANTILE_30_POPULARITY)).to_numpy(), window=18),
+        ], dedup=self.title_dedup, rows=rows)
+        blockbusters, cult_classics, hidden_gems = (self._score_recommendations(all_recs_df.iloc[picks[name]]) for name in ('blockbusters', 'cult_classics', 'hidden_gems'))
+        mark('categorization')
         return {"main": main_recs, "blockbusters": blockbusters, "genre_favorites": genre_favorites, "cult_classics": cult_classics, "hidden_gems": hidden_gems}
 
     def recommend_by_genre(self, genre_name, exclude_ids):
         if not genre_name: return []
-        genre_df = self.df_movies[self.df_movies['genres'].str.contains(genre_name, na=False, case=False)].copy()
-        genre_df = genre_df[~genre_df['id'].isin(exclude_ids)]
+        genre_rows = np.flatnonzero(self.genre_bits.mask(genre_name))
+        genre_df = self.df_movies.iloc[genre_rows[~self.id_index.isin(genre_rows, exclude_ids)]].copy()
         QUALITY_WEIGHT = 0.80; POPULARITY_WEIGHT = 0.20
         pop_max = genre_df['popularity'].max()
         pop_score = (genre_df['popularity'] / pop_max * 100) if pop_max > 0 else 0
@@ -125,60 +171,76 @@ class MovieRecommender:
         return self._finalize_recommendations(genre_df, 6, score_column='hybrid_score')
 
     def analyze_user_profile(self, selected_movie_ids):
-        selected_movies = self.df_movies[self.df_movies['id'].isin(selected_movie_ids)]
+        selected_movies = self.df_movies.iloc[self.id_index.rows(selected_movie_ids)]
         if selected_movies.empty: return None, [], []
         all_genres = [g.strip() for genres_str in selected_movies['genres'] for g in str(genres_str).split(',') if g.strip()]
-        if not all_genres: return None, [], selected_movies.to_dict('records')
+        if not all_genres: return None, [], records(selected_movies, 'movies')
         genre_counts = Counter(all_genres)
         favorite_genre = genre_counts.most_common(1)[0][0]
         unique_genres = sorted(list(genre_counts.keys()))
-        return favorite_genre, unique_genres, selected_movies.to_dict('records')
+        return favorite_genre, unique_genres, records(selected_movies, 'movies')
 
 # --- MUDANÇA 2: Criação do Blueprint e das Rotas ---
 
-recommender = MovieRecommender()
+# O cache carrega em segundo plano (ou na primeira requisição) e troca de geração sem reiniciar o serviço
+recommender_movies = LazyRecommender('movies', MovieRecommender)
 movies_bp = Blueprint('movies_bp', __name__, url_prefix='/api/movies')
 
 @movies_bp.route('/discover', methods=['GET'])
 def discover():
+    recommender = recommender_movies.get()
     if not recommender.is_ready: return jsonify({"error": "Serviço de filmes indisponível"}), 503
-    return jsonify(recommender.discover_movies())
+    return recommender.discover_payload.response()
 
 @movies_bp.route('/search', methods=['GET'])
 def search():
+    recommender = recommender_movies.get()
     if not recommender.is_ready: return jsonify({"error": "Serviço de filmes indisponível"}), 503
     query = request.args.get('q', '')
-    return jsonify(recommender.search_movies(query))
+    key = make_key('movies_app', 'search', recommender.cache_version, q=query)
+    return cached_response(key) or store_response(key, json_response(recommender.search_movies(query)))
 
 @movies_bp.route('/genres', methods=['GET'])
 def get_genres():
+    recommender = recommender_movies.get()
     if not recommender.is_ready: return jsonify({"error": "Serviço de filmes indisponível"}), 503
-    return jsonify(recommender.GENRES_LIST)
+    key = make_key('movies_app', 'genres', recommender.cache_version)
+    return cached_response(key) or store_response(key, jsonify(recommender.GENRES_LIST))
 
 @movies_bp.route('/recommend', methods=['POST'])
 def recommend():
+    recommender = recommender_movies.get()
     if not recommender.is_ready: return jsonify({"error": "Serviço de filmes indisponível"}), 503
     data = request.get_json()
     movie_ids = data.get('movie_ids')
     genre = data.get('genre', None)
     if not movie_ids or len(movie_ids) < 3:
         return jsonify({"error": "São necessários pelo menos 3 filmes."}), 400
-    
+    mark('parse')
+
+    # O resultado depende só do conjunto de ids, do gênero e da versão do cache carregado
+    key = make_key('movies_app', 'recommend', recommender.cache_version, ids=movie_ids, genre=genre)
+    cached = cached_response(key)
+    if cached is not None: return cached
+    mark('cache_lookup')
     recommendations = recommender.recommend_movie_categories(movie_ids, genre)
     fav_genre, _, profile_movies = recommender.analyze_user_profile(movie_ids)
+    mark('profile')
     
-    return jsonify({
+    return store_response(key, json_response({
         "recommendations": recommendations,
         "profile": {
             "movies": profile_movies,
             "favorite_genre": fav_genre
         },
         "selected_genre": genre
-    })
+    }))
 
 # --- MUDANÇA 3: Inicializador para Execução Direta ---
 def create_app():
     app = Flask(__name__)
     app.register_blueprint(movies_bp)
+    metrics.init_app(app)
+    lazy.init_app(app, {'movies': recommender_movies})
     return app
 app = create_app()
@@ -1,14 +1,37 @@
 # build_movie_cache.py
-# VERSÃO 5.4 - A VERDADE SIMPLES: USA .split(',')
+# VERSÃO 6.2 - LEITURA EM BLOCOS, PREPARO E VETORIZAÇÃO EM PARALELO; DELTA INCREMENTAL; GERAÇÕES
+#
+# O CSV é lido em blocos com colunas tipadas; cada bloco é filtrado e tem os
+# textos montados (operações vetorizadas, sem apply) num processo do pool, que
+# também devolve as contagens de termos do bloco. O vocabulário do TF-IDF sai
+# da soma dessas contagens (mesmo critério do TfidfVectorizer: os
+# TFIDF_MAX_FEATURES termos mais frequentes) e a transformação roda em paralelo
+# por bloco. O resultado é o mesmo do build em memória, com um bloco por vez
+# na fila de cada processo.
+#
+# Com --delta ARQUIVO (no esquema do CSV, chave 'id' e coluna opcional 'op' =
+# upsert|delete), só os filmes do delta passam pelos filtros e pelo TF-IDF,
+# com o vocabulário e o idf salvos em 'movie_tfidf_vocabulary.pkl'; matriz,
+# IVF (centróides mantidos), busca, dedup e gêneros são atualizados. O CSV de
+# origem não é reescrito: o delta deve ser incorporado a ele antes do próximo
+# build completo.
+#
+# Os arquivos gerados vão para uma geração nova em 'generations/', publicada
+# no ponteiro 'CURRENT' só no fim (common/generations.py); o modo incremental
+# parte da geração ativa e os servidores trocam para a nova sem reiniciar.
 
 import pandas as pd
+import numpy as np
 import json
 import pickle
+import os
+import re
 import sys
-from collections import Counter
-
-# Não precisamos mais de 'ast'
-# import ast
+import time
+import argparse
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
 
 try:
     import pyarrow
@@ -16,84 +39,351 @@ except ImportError:
     print("\nERRO: A biblioteca 'pyarrow' não está instalada. Use: pip install pyarrow\n")
     sys.exit(1)
 
-from sklearn.feature_extraction.text import TfidfVectorizer
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.ann_index import IVFIndex, prepare_vectors
+from common.artifacts import ARTIFACTS_DIR, load_artifacts, save_artifacts
+from common.compact import compact, storage_dtype, vector_arrays
+from common.generations import carry_over, new_generation, publish, resolve
+from common.incremental import INCREMENTAL_DRIFT_THRESHOLD, CatalogPatch, oov_rate, read_delta, sample_texts
+from common.search_index import SearchIndex
+from common.dedup import TitleDeduplicator
+from common.genre_bits import GenreBits
 
 MIN_VOTE_COUNT = 50
 GENRE_BLACKLIST = ['Erotic', 'TV Movie']
+TFIDF_MAX_FEATURES = 5000
+CACHE_DIR = '.'
+SOURCE_CSV = 'TMDB_movie_dataset.csv'
+PROCESSED_FILE = 'movies_processed.parquet'
+MATRIX_FILE = 'movie_tfidf_matrix.pkl'
+GENRES_FILE = 'genres.json'
+VOCABULARY_FILE = 'movie_tfidf_vocabulary.pkl'
 
-print("--- INICIANDO CONSTRUÇÃO DO CACHE (v5.4 - A Verdade) ---")
-try:
-    print("\n[PASSO 1/9] Carregando dataset original...")
-    df = pd.read_csv('TMDB_movie_dataset.csv', low_memory=False)
-    print(f"-> OK. {len(df)} linhas carregadas.")
-
-    print("\n[PASSO 2/9] Filtrando conteúdo adulto...")
-    df['adult'] = df['adult'].astype(str).str.lower().fillna('false') == 'true'
-    df = df[df['adult'] == False]
-    print(f"-> OK. {len(df)} filmes restantes.")
-
-    print(f"\n[PASSO 3/9] Filtrando por contagem de votos (mínimo: {MIN_VOTE_COUNT})...")
-    df['vote_count'] = pd.to_numeric(df['vote_count'], errors='coerce').fillna(0)
-    df = df[df['vote_count'] >= MIN_VOTE_COUNT]
-    print(f"-> OK. {len(df)} filmes restantes.")
-
-    # --- AQUI ESTÁ A CORREÇÃO HUMILHANTE E DEFINITIVA ---
-    print("\n[PASSO 4/9] Processando a coluna 'genres' como texto simples (split)...")
-    def get_genres_from_string(data_str):
-        try:
-            # Apenas separa a string pela vírgula e remove espaços em branco
-            return [genre.strip() for genre in str(data_str).split(',') if genre.strip()]
-        except:
-            return []
-            
-    df['genres_list'] = df['genres'].apply(get_genres_from_string)
-    empty_genres_count = len(df[df['genres_list'].apply(len) == 0])
-    print(f"-> OK. {len(df)} filmes processados. {empty_genres_count} filmes ficaram sem gênero.")
-    # --- FIM DA CORREÇÃO ---
-
-    print(f"\n[PASSO 5/9] Removendo filmes com gêneros da blacklist ({GENRE_BLACKLIST})...")
-    df = df[df['genres_list'].apply(lambda g: not any(blacklisted in genre for blacklisted in GENRE_BLACKLIST for genre in g))]
-    print(f"-> OK. {len(df)} filmes restantes.")
-
-    print("\n[PASSO 6/9] Removendo linhas com dados essenciais faltando...")
-    required_cols = ['id', 'title', 'overview', 'genres', 'keywords', 'release_date', 'popularity', 'vote_average', 'poster_path']
-    df = df.dropna(subset=required_cols).copy()
-    print(f"-> OK. {len(df)} filmes restantes após o dropna.")
-
-    print("\n[PASSO 7/9] Contando e salvando gêneros únicos...")
-    all_genres = Counter([genre for sublist in df['genres_list'] for genre in sublist])
-    if not all_genres:
-        print("\n!!!!!!!!!! ALERTA CRÍTICO: NENHUM GÊNERO ENCONTRADO APÓS TODOS OS FILTROS !!!!!!!!!\n")
-        sys.exit("Abortando devido à falha na coleta de gêneros.")
-        
-    clean_genres = sorted([genre for genre, count in all_genres.items() if count > 100])
-    with open('genres.json', 'w', encoding='utf-8') as f:
+# Linhas por bloco do CSV e processos do pool (1 = tudo no processo principal)
+MOVIE_BUILD_CHUNK_ROWS = int(os.getenv('MOVIE_BUILD_CHUNK_ROWS', '100000'))
+MOVIE_BUILD_WORKERS = int(os.getenv('MOVIE_BUILD_WORKERS', str(os.cpu_count() or 1)))
+
+# Só as colunas usadas, com tipos fixos; id e vote_count chegam como texto e são convertidos com tolerância a lixo
+CSV_DTYPES = {
+    'id': str, 'title': str, 'original_title': str, 'overview': str, 'genres': str, 'keywords': str,
+    'release_date': str, 'poster_path': str, 'adult': str, 'vote_count': str,
+    'popularity': 'float64', 'vote_average': 'float64',
+}
+REQUIRED_COLUMNS = ['id', 'title', 'overview', 'genres', 'keywords', 'release_date', 'popularity', 'vote_average', 'poster_path']
+PROCESSED_COLUMNS = ['id', 'title', 'release_date', 'popularity', 'vote_average', 'genres', 'poster_path', 'search_features', 'content_features']
+BLACKLIST_PATTERN = '|'.join(re.escape(g) for g in GENRE_BLACKLIST)
+FILTER_STEPS = [('adult', 'conteúdo adulto'), ('votes', f'menos de {MIN_VOTE_COUNT} votos'), ('blacklist', f'gêneros da blacklist {GENRE_BLACKLIST}'), ('dropna', 'dados essenciais faltando'), ('id', 'id inválido')]
+
+
+def prepare_chunk(chunk):
+    """
+    Filtra um bloco do CSV e monta os textos de busca e de conteúdo.
+
+    Returns:
+        tuple: (DataFrame processado, contagem de termos, documentos por termo, contagem de gêneros, linhas após cada filtro)
+    """
+    counts = {'read': len(chunk)}
+    chunk = chunk[chunk['adult'].str.lower() != 'true']
+    counts['adult'] = len(chunk)
+    chunk = chunk[pd.to_numeric(chunk['vote_count'], errors='coerce').fillna(0) >= MIN_VOTE_COUNT]
+    counts['votes'] = len(chunk)
+    # Um gênero da blacklist contido em qualquer item da lista = contido no texto (gêneros não têm vírgula)
+    chunk = chunk[~chunk['genres'].fillna('').str.contains(BLACKLIST_PATTERN, regex=True)]
+    counts['blacklist'] = len(chunk)
+    chunk = chunk.dropna(subset=REQUIRED_COLUMNS)
+    counts['dropna'] = len(chunk)
+
+    genres = chunk['genres'].str.split(',').explode().str.strip()
+    genre_counts = genres[genres != ''].value_counts()
+
+    ids = pd.to_numeric(chunk['id'], errors='coerce')
+    chunk = chunk[ids.notna()].assign(id=ids[ids.notna()].astype(int))
+    counts['id'] = len(chunk)
+
+    # "Science Fiction, Action" -> "sciencefiction action"
+    genres_text = chunk['genres'].str.lower().str.replace(' ', '', regex=False).str.replace(',+', ' ', regex=True).str.strip()
+    keywords_text = chunk['keywords'].fillna('').str.replace(',', ' ').str.lower()
+    chunk = chunk.assign(
+        content_features=chunk['overview'].fillna('') + ' ' + (genres_text + ' ') * 2 + (keywords_text + ' ') * 3,
+        search_features=chunk['title'].str.lower() + ' ' + chunk['original_title'].str.lower().fillna(''),
+    )[PROCESSED_COLUMNS]
+
+    term_counts, document_counts = pd.Series(dtype='int64'), pd.Series(dtype='int64')
+    try:
+        vectorizer = CountVectorizer(stop_words='english')
+        counts_matrix = vectorizer.fit_transform(chunk['content_features'])
+        terms = vectorizer.get_feature_names_out()
+        term_counts = pd.Series(np.asarray(counts_matrix.sum(axis=0)).ravel(), index=terms)
+        document_counts = pd.Series(np.bincount(counts_matrix.indices, minlength=len(terms)), index=terms)
+    except ValueError:
+        pass  # bloco sem nenhum termo (vazio ou só stop words)
+    return chunk, term_counts, document_counts, genre_counts, counts
+
+
+def select_vocabulary(term_counts, document_counts, n_documents, max_features=TFIDF_MAX_FEATURES):
+    """
+    Vocabulário e IDF do TF-IDF a partir das contagens somadas dos blocos.
+
+    Mesmo critério do TfidfVectorizer(max_features=...): os termos em ordem
+    alfabética, os `max_features` de maior contagem total, e idf suavizado.
+
+    Returns:
+        tuple: (dict termo -> coluna, array de idf)
+    """
+    term_counts = term_counts.groupby(level=0).sum().sort_index()
+    document_counts = document_counts.groupby(level=0).sum().reindex(term_counts.index)
+    keep = np.arange(len(term_counts))
+    if len(term_counts) > max_features: keep = np.sort((-term_counts.to_numpy()).argsort()[:max_features])
+    vocabulary = {term: column for column, term in enumerate(term_counts.index[keep])}
+    idf = np.log((1 + n_documents) / (1 + document_counts.to_numpy()[keep].astype(np.float64))) + 1
+    return vocabulary, idf
+
+
+# Mesma análise de texto (tokens e stop words) do CountVectorizer do TF-IDF
+CONTENT_ANALYZER = CountVectorizer(stop_words='english').build_analyzer()
+_VOCABULARY, _IDF = None, None
+
+
+def _init_transform(vocabulary, idf):
+    global _VOCABULARY, _IDF
+    _VOCABULARY, _IDF = vocabulary, idf
+
+
+def transform_chunk(texts):
+    """Matriz TF-IDF (normalizada L2) de um bloco de textos com o vocabulário global."""
+    tfidf = CountVectorizer(stop_words='english', vocabulary=_VOCABULARY).transform(texts).astype(np.float64)
+    tfidf.data *= _IDF[tfidf.indices]
+    return normalize(tfidf, norm='l2', copy=False)
+
+
+def parallel_map(func, items, workers, initializer=None, initargs=()):
+    """`map` ordenado em `workers` processos, com no máximo 2 tarefas por processo na fila (memória limitada)."""
+    if workers <= 1:
+        if initializer: initializer(*initargs)
+        yield from map(func, items)
+        return
+    with multiprocessing.Pool(workers, initializer=initializer, initargs=initargs) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.apply_async(func, (item,)))
+            if len(pending) >= 2 * workers: yield pending.popleft().get()
+        while pending: yield pending.popleft().get()
+
+
+class BuildSteps:
+    def __init__(self, total):
+        self.total = total
+        self.current = 0
+        self.timings = []
+
+    @contextmanager
+    def step(self, title):
+        self.current += 1
+        print(f"\n[PASSO {self.current}/{self.total}] {title}...")
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        self.timings.append((title, elapsed))
+        print(f"-> OK em {elapsed:.1f}s.")
+
+    def summary(self):
+        for title, elapsed in self.timings: print(f"   {elapsed:8.1f}s  {title}")
+        print(f"   {sum(e for _, e in self.timings):8.1f}s  total")
+
+
+def read_source(upserts=None, deleted=()):
+    """Blocos do CSV; com um delta, sem as linhas substituídas ou removidas e com as do delta num bloco final."""
+    reader = pd.read_csv(SOURCE_CSV, usecols=list(CSV_DTYPES), dtype=CSV_DTYPES, chunksize=MOVIE_BUILD_CHUNK_ROWS)
+    if upserts is None:
+        yield from reader
+        return
+    replaced = pd.Index(delta_ids(upserts['id'])).union(pd.Index(delta_ids(deleted))).dropna()
+    for chunk in reader: yield chunk[~delta_ids(chunk['id']).isin(replaced)]
+    yield upserts
+
+
+def delta_ids(ids):
+    return pd.to_numeric(pd.Series(ids), errors='coerce')
+
+
+def as_source(frame):
+    """Linhas do delta no formato dos blocos do CSV (colunas e tipos de CSV_DTYPES), venham de CSV, JSON ou parquet."""
+    frame = frame.reindex(columns=list(CSV_DTYPES))
+    for column, dtype in CSV_DTYPES.items():
+        values = frame[column]
+        frame[column] = values.where(values.isna(), values.astype(str)) if dtype is str else values.astype(dtype)
+    return frame
+
+
+def frequent_genres(genre_counts):
+    """Gêneros listados no genres.json: os com mais de 100 filmes."""
+    return sorted(genre for genre, count in genre_counts.items() if count > 100)
+
+
+def save_genres(output_dir, clean_genres):
+    with open(os.path.join(output_dir, GENRES_FILE), 'w', encoding='utf-8') as f:
         json.dump(clean_genres, f, ensure_ascii=False, indent=4)
-    print(f"-> OK. Lista de {len(clean_genres)} gêneros salva em 'genres.json'.")
-
-    print("\n[PASSO 8/9] Criando features de texto e matriz de similaridade...")
-    df['genres_text'] = df['genres_list'].apply(lambda g: ' '.join([name.replace(' ', '').lower() for name in g]))
-    # Keywords também são strings simples
-    df['keywords_text'] = df['keywords'].fillna('').str.replace(',', ' ').str.lower()
-    
-    df['content_features'] = (df['overview'].fillna('') + ' ' + (df['genres_text'] + ' ') * 2 + (df['keywords_text'] + ' ') * 3)
-    df['search_features'] = df['title'].str.lower() + ' ' + df['original_title'].str.lower().fillna('')
-    df['id'] = pd.to_numeric(df['id'], errors='coerce').dropna().astype(int)
-    df = df.dropna(subset=['id'])
-    
-    df_processed = df[['id', 'title', 'release_date', 'popularity', 'vote_average', 'genres', 'poster_path', 'search_features', 'content_features']].reset_index(drop=True)
-    
-    tfidf_vectorizer = TfidfVectorizer(stop_words='english', max_features=5000)
-    tfidf_matrix = tfidf_vectorizer.fit_transform(df_processed['content_features'])
-    with open('movie_tfidf_matrix.pkl', 'wb') as f: pickle.dump(tfidf_matrix, f)
-    print("-> OK. Matriz TF-IDF salva.")
-
-    print("\n[PASSO 9/9] Salvando DataFrame processado no cache final...")
-    df_to_save = df_processed.drop(columns=['content_features'])
-    df_to_save.to_parquet('movies_processed.parquet', engine='pyarrow')
-    print("-> OK. Cache de filmes salvo.")
-    
-    print(f"\n--- CONSTRUÇÃO DO CACHE (v5.4) CONCLUÍDA! {len(df_to_save)} filmes processados. ---")
-
-except Exception as e:
-    print(f"\n--- ERRO DURANTE A CONSTRUÇÃO DO CACHE ---"); import traceback; traceback.print_exc()
+
+
+def save_indexes(output_dir, df_processed, tfidf_matrix, ann_index, tfidf_norms, normalized_matrix, metadata):
+    """Grava na geração a matriz TF-IDF e os artefatos mmap (busca, dedup e bitset de gêneros refeitos a partir do DataFrame)."""
+    with open(os.path.join(output_dir, MATRIX_FILE), 'wb') as f: pickle.dump(tfidf_matrix, f)
+    print(f"-> Matriz TF-IDF {tfidf_matrix.shape} salva.")
+    search_index = SearchIndex.build(df_processed['search_features'], df_processed['popularity'])
+    # Pares de títulos quase idênticos, consultados na finalização das recomendações
+    title_dedup = TitleDeduplicator.build(df_processed['title'])
+    # Bitset com todos os gêneros do catálogo (genres.json lista só os frequentes)
+    genre_bits = GenreBits.build(df_processed['genres'])
+    # Vetores servidos no tipo compacto (VECTOR_DTYPE); o IVF já saiu da matriz completa
+    vectors = compact(normalized_matrix)
+    save_artifacts(os.path.join(output_dir, ARTIFACTS_DIR), {
+        **vector_arrays('tfidf_matrix', vectors),
+        'tfidf_norms': tfidf_norms,
+        **ann_index.to_arrays(),
+        **search_index.to_arrays(),
+        **title_dedup.to_arrays(),
+        **genre_bits.to_arrays(),
+    }, metadata={'n_items': len(df_processed), 'vector_dtype': storage_dtype(vectors), **metadata})
+    print(f"-> Artefatos mmap (vetores em {storage_dtype(vectors)}, índice ANN com {ann_index.n_lists} listas (nprobe {ann_index.nprobe}), {len(search_index.grams)} n-gramas de busca) salvos em '{ARTIFACTS_DIR}'.")
+
+
+def save_processed(output_dir, df_processed):
+    df_processed.to_parquet(os.path.join(output_dir, PROCESSED_FILE), engine='pyarrow')
+
+
+def full_build(output_dir, delta=None):
+    """Build completo em `output_dir`; `delta` = (linhas a incluir/substituir, ids a remover) aplicados ao CSV em memória."""
+    print(f"--- INICIANDO CONSTRUÇÃO DO CACHE (v6.2 - blocos de {MOVIE_BUILD_CHUNK_ROWS} linhas, {MOVIE_BUILD_WORKERS} processos) ---")
+    steps = BuildSteps(6)
+
+    with steps.step("Lendo o dataset em blocos, filtrando e montando os textos"):
+        frames, term_counts, document_counts, genre_counts = [], [], [], []
+        totals = dict.fromkeys(['read'] + [key for key, _ in FILTER_STEPS], 0)
+        reader = read_source(*(delta or ()))
+        for n, (frame, terms, documents, genres, counts) in enumerate(parallel_map(prepare_chunk, reader, MOVIE_BUILD_WORKERS), 1):
+            frames.append(frame); term_counts.append(terms); document_counts.append(documents); genre_counts.append(genres)
+            for key, value in counts.items(): totals[key] += value
+            print(f"   bloco {n}: {totals['read']} linhas lidas, {totals['id']} filmes mantidos")
+        previous = totals['read']
+        for key, description in FILTER_STEPS:
+            print(f"-> {previous - totals[key]} removidos ({description}); {totals[key]} restantes.")
+            previous = totals[key]
+
+    with steps.step("Contando e salvando gêneros únicos"):
+        all_genres = pd.concat(genre_counts).groupby(level=0).sum() if genre_counts else pd.Series(dtype='int64')
+        if all_genres.empty:
+            print("\n!!!!!!!!!! ALERTA CRÍTICO: NENHUM GÊNERO ENCONTRADO APÓS TODOS OS FILTROS !!!!!!!!!\n")
+            sys.exit("Abortando devido à falha na coleta de gêneros.")
+        clean_genres = frequent_genres(all_genres)
+        save_genres(output_dir, clean_genres)
+        print(f"-> Lista de {len(clean_genres)} gêneros salva em 'genres.json'.")
+
+    with steps.step("Selecionando o vocabulário do TF-IDF"):
+        texts = [frame.pop('content_features') for frame in frames]
+        df_processed = pd.concat(frames, ignore_index=True)
+        del frames
+        vocabulary, idf = select_vocabulary(pd.concat(term_counts), pd.concat(document_counts), len(df_processed))
+        del term_counts, document_counts
+        # Vocabulário e idf ficam salvos para o modo incremental vetorizar o delta do mesmo jeito
+        with open(os.path.join(output_dir, VOCABULARY_FILE), 'wb') as f: pickle.dump({'vocabulary': vocabulary, 'idf': idf}, f)
+        # Taxa de termos fora do vocabulário do próprio catálogo: referência para o desvio do modo incremental
+        baseline_oov = oov_rate(CONTENT_ANALYZER, vocabulary, sample_texts(pd.concat(texts, ignore_index=True))) if texts else 0.0
+        print(f"-> {len(vocabulary)} termos para {len(df_processed)} filmes.")
+
+    with steps.step("Vetorizando os textos em paralelo"):
+        blocks = list(parallel_map(transform_chunk, texts, MOVIE_BUILD_WORKERS, initializer=_init_transform, initargs=(vocabulary, idf)))
+        tfidf_matrix = sparse.vstack(blocks, format='csr') if blocks else sparse.csr_matrix((0, len(vocabulary)))
+        del texts, blocks
+
+    with steps.step("Montando os índices e salvando os artefatos"):
+        normalized_matrix, tfidf_norms = prepare_vectors(tfidf_matrix)
+        save_indexes(output_dir, df_processed, tfidf_matrix, IVFIndex.build(normalized_matrix), tfidf_norms, normalized_matrix, {'oov_rate': baseline_oov})
+
+    with steps.step("Salvando DataFrame processado no cache final"):
+        save_processed(output_dir, df_processed)
+
+    print(f"\n--- CONSTRUÇÃO DO CACHE (v6.2) CONCLUÍDA! {len(df_processed)} filmes processados. ---")
+    steps.summary()
+
+
+def incremental_build(delta_path, output_dir):
+    """
+    Aplica o delta à geração ativa com o vocabulário e o idf do último build completo, gravando a nova em `output_dir`.
+
+    Filmes do delta barrados pelos filtros do build saem do catálogo, como no build completo.
+
+    Returns:
+        tuple | None: (linhas do delta, ids removidos) se for preciso o build completo
+    """
+    print(f"--- INICIANDO ATUALIZAÇÃO INCREMENTAL DO CACHE ('{delta_path}') ---")
+    steps = BuildSteps(4)
+
+    with steps.step("Lendo o delta e aplicando os filtros do build"):
+        raw_upserts, raw_deleted = read_delta(delta_path, 'id', dtype=CSV_DTYPES)
+        raw_upserts = as_source(raw_upserts)
+        # Parte da geração ativa (no layout antigo, sem gerações, refaz tudo)
+        generation, active_dir = resolve(CACHE_DIR)
+        artifacts = load_artifacts(os.path.join(active_dir, ARTIFACTS_DIR)) if generation is not None else None
+        if artifacts is None or not os.path.exists(os.path.join(active_dir, VOCABULARY_FILE)):
+            print("-> Nenhuma geração publicada.")
+            return raw_upserts, raw_deleted
+        df_processed = pd.read_parquet(os.path.join(active_dir, PROCESSED_FILE))
+        if artifacts.metadata.get('n_items') != len(df_processed) or not df_processed['id'].is_unique:
+            print("-> Cache atual de outro catálogo (ou com ids repetidos).")
+            return raw_upserts, raw_deleted
+        upserts, _, _, _, counts = prepare_chunk(raw_upserts)
+        upserts = upserts.reset_index(drop=True)
+        texts = upserts.pop('content_features')
+        deleted = pd.Index(delta_ids(raw_deleted)).union(pd.Index(delta_ids(raw_upserts['id'])).difference(upserts['id'])).dropna()
+        patch = CatalogPatch(df_processed['id'], upserts['id'], deleted)
+        print(f"-> {counts['read'] - counts['id']} filmes do delta barrados pelos filtros; {patch.summary()}.")
+
+    with steps.step("Vetorizando o delta com o vocabulário salvo"):
+        with open(os.path.join(active_dir, VOCABULARY_FILE), 'rb') as f: saved = pickle.load(f)
+        drift = oov_rate(CONTENT_ANALYZER, saved['vocabulary'], texts) - artifacts.metadata.get('oov_rate', 0.0)
+        print(f"-> Termos fora do vocabulário no delta: {drift:+.1%} em relação ao build completo (limite {INCREMENTAL_DRIFT_THRESHOLD:.0%}).")
+        if drift > INCREMENTAL_DRIFT_THRESHOLD: return raw_upserts, raw_deleted
+        _init_transform(saved['vocabulary'], saved['idf'])
+        delta_tfidf = transform_chunk(texts)
+
+    with steps.step("Atualizando gêneros, matriz e índices"):
+        df_processed = patch.assemble(df_processed, upserts)
+        genres = df_processed['genres'].str.split(',').explode().str.strip()
+        save_genres(output_dir, frequent_genres(genres[genres != ''].value_counts()))
+        carry_over(active_dir, output_dir, [VOCABULARY_FILE])
+        with open(os.path.join(active_dir, MATRIX_FILE), 'rb') as f: tfidf_matrix = patch.assemble(pickle.load(f), delta_tfidf)
+        # Vetores refeitos da matriz completa (normalização O(nnz)): os gravados podem estar compactados
+        normalized_matrix, tfidf_norms = prepare_vectors(tfidf_matrix)
+        # Centróides mantidos: só a distribuição das linhas nas listas é refeita
+        ann_index = IVFIndex.from_centroids(normalized_matrix, np.array(artifacts['ann_centroids']))
+        save_indexes(output_dir, df_processed, tfidf_matrix, ann_index, tfidf_norms, normalized_matrix, {'oov_rate': artifacts.metadata.get('oov_rate', 0.0)})
+
+    with steps.step("Salvando DataFrame processado no cache final"):
+        save_processed(output_dir, df_processed)
+
+    print(f"\n--- ATUALIZAÇÃO INCREMENTAL CONCLUÍDA! {len(df_processed)} filmes no catálogo. ---")
+    steps.summary()
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Constrói o cache de filmes (executar na pasta do cache).")
+    parser.add_argument('--delta', help="arquivo de filmes incluídos/alterados/removidos a aplicar ao cache existente")
+    args = parser.parse_args()
+    output_dir = new_generation(CACHE_DIR)
+    delta = incremental_build(args.delta, output_dir) if args.delta else None
+    if delta is not None:
+        print("\n-> Desvio acima do limite ou cache incompatível: refazendo o cache completo com o delta aplicado ao CSV.")
+    if not args.delta or delta is not None: full_build(output_dir, delta)
+    print(f"-> Geração '{publish(CACHE_DIR, output_dir)}' publicada.")
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except Exception as e:
+        print(f"\n--- ERRO DURANTE A CONSTRUÇÃO DO CACHE ---"); import traceback; traceback.print_exc()
@@ -1,18 +1,42 @@
 # backend/music/app.py (v14.0 - COM SIMILARITY_SCORE CORRIGIDO)
 import os
+import sys
 import json
+import logging
 import pickle
 import pandas as pd
 import numpy as np
 from flask import Flask, Blueprint, jsonify, request
 from flask_cors import CORS
-from sklearn.metrics.pairwise import cosine_similarity
 import requests
 import base64
 from datetime import datetime, timedelta
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.ann_index import index_from_artifacts, prepare_vectors
+from common.artifacts import ARTIFACTS_DIR, load_artifacts
+from common.compact import compact, vectors_from_artifacts
+from common.generations import resolve
+from common.id_index import IdIndex
+from common.search_index import SearchIndex
+from common.response_cache import cache_version, cached_response, make_key, store_response
+from common.neighbors import NeighborTable
+from common.diversity import diversity_penalty
+from common.categories import Bucket, CategoryAllocator
+from common.precomputed import DISCOVER_ROTATION_SECONDS, PrecomputedPayload
+from common import lazy
+from common.lazy import LazyRecommender
+from common.serialization import json_response, records
+from common import metrics
+from common.metrics import mark
+
 # Blueprint para músicas
 music_bp = Blueprint('music', __name__, url_prefix='/api/music')
+# Mensagens por requisição vão para o log em nível DEBUG (LOG_LEVEL=DEBUG para ver)
+logger = logging.getLogger('music')
+# Endereços da API do Spotify (o teste de carga aponta para o mock local em loadtest/mock_spotify.py)
+SPOTIFY_ACCOUNTS_URL = os.getenv('SPOTIFY_ACCOUNTS_URL', 'https://accounts.spotify.com').rstrip('/')
+SPOTIFY_API_URL = os.getenv('SPOTIFY_API_URL', 'https://api.spotify.com').rstrip('/')
 
 # ========================================
 # GERENCIADOR DE TOKENS SPOTIFY
@@ -43,7 +67,7 @@ class SpotifyTokenManager:
             data = {'grant_type': 'client_credentials'}
 
             response = requests.post(
-                'https://accounts.spotify.com/api/token',
+                f'{SPOTIFY_ACCOUNTS_URL}/api/token',
                 headers=headers,
                 data=data,
                 timeout=10
@@ -72,15 +96,18 @@ token_manager = SpotifyTokenManager(
 # CLASSE DE RECOMENDAÇÃO
 # ========================================
 class MusicRecommender:
-    def __init__(self, df, feature_matrix):
+    def __init__(self, df, feature_matrix=None, artifacts=None):
         self.df = df
 
-        # Converter np.matrix para np.ndarray se necessário
-        if hasattr(feature_matrix, 'A'):
-            print("Convertendo feature_matrix de np.matrix para np.ndarray...")
-            self.feature_matrix = np.asarray(feature_matrix)
+        if artifacts is not None:
+            # Formato mmap: matriz já normalizada (e compactada, VECTOR_DTYPE) no build
+            self.feature_matrix = vectors_from_artifacts(artifacts, 'feature_matrix')
         else:
-            self.feature_matrix = feature_matrix
+            # Normaliza as linhas (np.matrix vira np.ndarray; matriz esparsa continua esparsa) e compacta
+            self.feature_matrix = compact(prepare_vectors(feature_matrix)[0])
+        self.index = index_from_artifacts(artifacts, self.feature_matrix)
+        self.neighbors = NeighborTable.from_artifacts(artifacts, len(self.df))
+        self.id_index = IdIndex(self.df['id'])
 
         print(f"Feature matrix shape: {self.feature_matrix.shape}")
 
@@ -89,51 +116,35 @@ class MusicRecommender:
         Gera recomendações baseadas nas faixas selecionadas
         """
         # Encontrar índices das faixas selecionadas
-        selected_indices = []
-        for track_id in track_ids:
-            idx = self.df[self.df['id'] == track_id].index
-            if len(idx) > 0:
-                selected_indices.append(idx[0])
+        # Na ordem da seleção, primeira linha de cada id
+        selected_indices = [row for row in map(self.id_index.row, track_ids) if row is not None]
 
         if not selected_indices:
-            print("Nenhuma faixa selecionada encontrada no dataset")
+            logger.debug("Nenhuma faixa selecionada encontrada no dataset")
             return pd.DataFrame()
 
-        print(f"Processando {len(selected_indices)} faixas selecionadas...")
+        logger.debug("Processando %d faixas selecionadas...", len(selected_indices))
+        mark('id_lookup')
 
-        # Para cada faixa selecionada, encontrar similares
+        # Vizinhos de cada faixa selecionada: tabela pré-calculada no build ou, na falta dela, consulta ao índice
+        n_neighbors = 20 + len(track_ids)
+        if self.neighbors is not None and n_neighbors <= self.neighbors.k:
+            top_indices, top_similarities = self.neighbors.lookup(selected_indices, n_neighbors)
+        else:
+            top_indices, top_similarities = self.index.search(self.feature_matrix[selected_indices], n_neighbors)
         all_recommendations = []
 
-        for idx in selected_indices:
-            # Obter vetor de features da faixa
-            track_vector = self.feature_matrix[idx:idx+1]
-
-            # Converter matriz esparsa para array denso
-            if hasattr(track_vector, 'toarray'):
-                track_vector = track_vector.toarray()
-            else:
-                track_vector = np.asarray(track_vector)
-
-            # Converter feature_matrix também se necessário
-            if hasattr(self.feature_matrix, 'toarray'):
-                feature_matrix_dense = self.feature_matrix.toarray()
-            else:
-                feature_matrix_dense = self.feature_matrix
-
-            # Calcular similaridade com todas as outras faixas
-            similarities = cosine_similarity(track_vector, feature_matrix_dense).flatten()
-
-            # Criar DataFrame com resultados
+        for indices, similarities in zip(top_indices, top_similarities):
+            # Remover a própria faixa e faixas já selecionadas
+            keep = indices >= 0
+            keep[keep] = ~self.id_index.isin(indices[keep], track_ids)
             similar_df = pd.DataFrame({
-                'id': self.df['id'].values,
-                'similarity': similarities
+                'id': self.df['id'].values[indices[keep]],
+                'similarity': similarities[keep]
             })
 
-            # Remover a própria faixa e faixas já selecionadas
-            similar_df = similar_df[~similar_df['id'].isin(track_ids)]
-
             # Selecionar top 20 mais similares
-            top_similar = similar_df.nlargest(20, 'similarity')
+            top_similar = similar_df.head(20)
 
             all_recommendations.append(top_similar)
 
@@ -149,6 +160,8 @@ class MusicRecommender:
         if not combined_recs.empty:
             combined_recs['similarity'] = combined_recs['similarity'] ** 4
 
+        mark('similarity')
+
         # Mesclar com dados completos
         result = combined_recs.merge(self.df, on='id', how='left')
 
@@ -161,8 +174,9 @@ class MusicRecommender:
         # ===== CORREÇÃO CRÍTICA: ADICIONAR SIMILARITY_SCORE =====
         result = self._calculate_display_scores(result)
         # ========================================================
+        mark('penalty')
 
-        print(f"Geradas {len(result)} recomendações")
+        logger.debug("Geradas %d recomendações", len(result))
 
         return result
 
@@ -173,17 +187,8 @@ class MusicRecommender:
         # Detectar nome da coluna de artista
         artist_col = 'artists' if 'artists' in df.columns else 'artist_name'
 
-        artist_counts = {}
-        penalties = []
-
-        for artist in df[artist_col].values:
-            count = artist_counts.get(artist, 0)
-            penalty = 0.85 ** count
-            penalties.append(penalty)
-            artist_counts[artist] = count + 1
-
         df = df.copy()
-        df['penalized_score'] = df['similarity'] * penalties
+        df['penalized_score'] = df['similarity'] * diversity_penalty(df[artist_col], 0.85)
         df = df.sort_values('penalized_score', ascending=False)
 
         return df
@@ -225,80 +230,106 @@ class MusicRecommender:
 # ========================================
 # CARREGAMENTO DE DADOS
 # ========================================
-print("\n" + "="*50)
-print("Carregando cache de músicas (v14.0)...")
-print("="*50)
-
-cache_dir = os.path.join(os.path.dirname(__file__), 'cache')
+class MusicCatalog:
+    """Tudo o que as rotas leem de uma geração do cache; uma instância por geração carregada."""
 
-try:
-    # Carregar DataFrame
-    df_music = pd.read_parquet(os.path.join(cache_dir, 'music_data.parquet'))
-
-    # Remover coluna de índice se existir
-    if 'Unnamed: 0' in df_music.columns:
-        print("Removendo coluna 'Unnamed: 0'...")
-        df_music = df_music.drop(columns=['Unnamed: 0'])
-
-    # Carregar feature matrix
-    with open(os.path.join(cache_dir, 'feature_matrix.pkl'), 'rb') as f:
-        feature_matrix = pickle.load(f)
+    def __init__(self, cache_dir=None):
+        self.is_ready = False
+        # Pasta do cache com as gerações; a vigia de gerações compara o CURRENT dela com a geração carregada
+        self.cache_root = cache_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
+        try:
+            self._load()
+            self.is_ready = True
+        except Exception as e:
+            print(f"ERRO ao carregar dados: {str(e)}")
+            import traceback
+            traceback.print_exc()
 
-    # Carregar lista de gêneros
-    with open(os.path.join(cache_dir, 'genres.json'), 'r', encoding='utf-8') as f:
-        genres_list = json.load(f)
+    def _load(self):
+        print("\n" + "="*50)
+        print("Carregando cache de músicas (v14.0)...")
+        print("="*50)
 
-    # Inicializar recomendador
-    recommender = MusicRecommender(df_music, feature_matrix)
+        # Geração ativa apontada por CURRENT (ou a própria pasta no layout antigo)
+        self.generation, cache_dir = resolve(self.cache_root)
+
+        # Carregar DataFrame
+        df_music = pd.read_parquet(os.path.join(cache_dir, 'music_data.parquet'))
+
+        # Remover coluna de índice se existir
+        if 'Unnamed: 0' in df_music.columns:
+            print("Removendo coluna 'Unnamed: 0'...")
+            df_music = df_music.drop(columns=['Unnamed: 0'])
+        self.df_music = df_music
+
+        # Carregar feature matrix (formato mmap do build ou, na falta dele, o pickle legado)
+        artifacts = load_artifacts(os.path.join(cache_dir, ARTIFACTS_DIR))
+        feature_matrix = None
+        if artifacts is None:
+            with open(os.path.join(cache_dir, 'feature_matrix.pkl'), 'rb') as f:
+                feature_matrix = pickle.load(f)
+
+        # Carregar lista de gêneros
+        with open(os.path.join(cache_dir, 'genres.json'), 'r', encoding='utf-8') as f:
+            self.genres_list = json.load(f)
+
+        # Inicializar recomendador
+        self.recommender = MusicRecommender(df_music, feature_matrix, artifacts)
+        # Índice invertido de busca (nome + artista), gerado no build
+        self.search_index = SearchIndex.from_artifacts(artifacts, len(df_music))
+        # Versão do cache carregado, usada nas chaves do cache de respostas
+        self.cache_version = cache_version(artifacts, os.path.join(cache_dir, 'music_data.parquet'))
+        # A amostra era sorteada a cada chamada: sem rotação configurada, ela muda a cada hora
+        self.discover_payload = PrecomputedPayload(lambda slot: build_discover_payload(df_music, slot), rotation=DISCOVER_ROTATION_SECONDS or 3600)
+
+        print(f"✓ Sistema de músicas pronto!")
+        print(f"✓ {len(df_music)} faixas carregadas")
+        print(f"✓ {len(self.genres_list)} gêneros disponíveis")
+        print(f"✓ Colunas: {df_music.columns.tolist()}")
+        print(f"✓ Geração do cache: {self.generation or 'layout antigo (sem CURRENT)'}")
+        print("="*50 + "\n")
 
-    print(f"✓ Sistema de músicas pronto!")
-    print(f"✓ {len(df_music)} faixas carregadas")
-    print(f"✓ {len(genres_list)} gêneros disponíveis")
-    print(f"✓ Colunas: {df_music.columns.tolist()}")
-    print("="*50 + "\n")
+# O cache carrega em segundo plano (ou na primeira requisição) e troca de geração sem reiniciar o serviço
+music_catalog = LazyRecommender('music', MusicCatalog)
 
-except Exception as e:
-    print(f"ERRO ao carregar dados: {str(e)}")
-    import traceback
-    traceback.print_exc()
-    raise
+def unavailable():
+    return jsonify({'error': 'Serviço de músicas indisponível'}), 503
 
 # ========================================
 # ROTAS DA API
 # ========================================
 
-@music_bp.route('/discover', methods=['GET'])
-def discover():
-    """Retorna músicas para descoberta inicial"""
-    try:
-        print("\n[GET /discover] Buscando músicas para descoberta...")
-
-        # Músicas icônicas (populares)
-        if 'popularity' in df_music.columns:
-            iconic = df_music.nlargest(36, 'popularity')
+def build_discover_payload(df_music, slot):
+    """Payload do /discover; a amostra "explorar" usa a janela de rotação como semente"""
+    # Músicas icônicas (populares)
+    if 'popularity' in df_music.columns:
+        iconic = df_music.nlargest(36, 'popularity')
+    else:
+        iconic = df_music.head(36)
+
+    # Músicas para explorar (alta qualidade, diversas)
+    if 'popularity' in df_music.columns:
+        explore_df = df_music[df_music['popularity'] > 50]
+        if len(explore_df) >= 36:
+            explore = explore_df.sample(36, random_state=slot % 2**32)
         else:
-            iconic = df_music.head(36)
+            explore = explore_df
+    else:
+        explore = df_music.sample(min(36, len(df_music)), random_state=slot % 2**32)
 
-        # Músicas para explorar (alta qualidade, diversas)
-        if 'popularity' in df_music.columns:
-            explore_df = df_music[df_music['popularity'] > 50]
-            if len(explore_df) >= 36:
-                explore = explore_df.sample(36)
-            else:
-                explore = explore_df
-        else:
-            explore = df_music.sample(min(36, len(df_music)))
+    print(f"✓ Payload de descoberta montado: {len(iconic)} icônicas e {len(explore)} explorar")
+    return {
+        'iconic': records(iconic, 'music'),
+        'explore': records(explore, 'music')
+    }
 
-        # Converter para dicionários
-        iconic_list = iconic.to_dict('records')
-        explore_list = explore.to_dict('records')
-
-        print(f"✓ Retornando {len(iconic_list)} icônicas e {len(explore_list)} explorar")
-
-        return jsonify({
-            'iconic': iconic_list,
-            'explore': explore_list
-        })
+@music_bp.route('/discover', methods=['GET'])
+def discover():
+    """Retorna músicas para descoberta inicial (payload pré-serializado)"""
+    catalog = music_catalog.get()
+    if not catalog.is_ready: return unavailable()
+    try:
+        return catalog.discover_payload.response()
 
     except Exception as e:
         print(f"✗ Erro em /discover: {str(e)}")
@@ -309,9 +340,12 @@ def discover():
 @music_bp.route('/genres', methods=['GET'])
 def get_genres():
     """Retorna lista de gêneros disponíveis"""
+    catalog = music_catalog.get()
+    if not catalog.is_ready: return unavailable()
     try:
-        print(f"\n[GET /genres] Retornando {len(genres_list)} gêneros")
-        return jsonify(genres_list)
+        logger.debug("[GET /genres] Retornando %d gêneros", len(catalog.genres_list))
+        key = make_key('music_app', 'genres', catalog.cache_version)
+        return cached_response(key) or store_response(key, jsonify(catalog.genres_list))
     except Exception as e:
         print(f"✗ Erro em /genres: {str(e)}")
         return jsonify([])
@@ -324,8 +358,22 @@ def search():
     if not query:
         return jsonify([])
 
+    catalog = music_catalog.get()
+    if not catalog.is_ready: return unavailable()
+    df_music = catalog.df_music
     try:
-        print(f"\n[GET /search] Buscando por: '{query}'")
+        logger.debug("[GET /search] Buscando por: '%s'", query)
+        key = make_key('music_app', 'search', catalog.cache_version, q=query)
+        cached = cached_response(key)
+        if cached is not None: return cached
+        mark('cache_lookup')
+
+        if catalog.search_index is not None:
+            rows = catalog.search_index.search(query, 50)
+            mark('search')
+            results = records(df_music.iloc[rows], 'music')
+            logger.debug("✓ Encontradas %d músicas", len(results))
+            return store_response(key, json_response(results))
 
         # Detectar nomes de colunas
         name_col = 'name' if 'name' in df_music.columns else 'track_name'
@@ -337,11 +385,13 @@ def search():
             df_music[artist_col].str.lower().str.contains(query, na=False, regex=False)
         )
 
-        results = df_music[mask].head(50).to_dict('records')
+        matches = df_music[mask].head(50)
+        mark('search')
+        results = records(matches, 'music')
 
-        print(f"✓ Encontradas {len(results)} músicas")
+        logger.debug("✓ Encontradas %d músicas", len(results))
 
-        return jsonify(results)
+        return store_response(key, json_response(results))
 
     except Exception as e:
         print(f"✗ Erro em /search: {str(e)}")
@@ -352,76 +402,62 @@ def search():
 @music_bp.route('/recommend', methods=['POST'])
 def recommend():
     """Gera recomendações baseadas em faixas selecionadas"""
+    catalog = music_catalog.get()
+    if not catalog.is_ready: return unavailable()
+    df_music, recommender = catalog.df_music, catalog.recommender
     try:
         data = request.json
         track_ids = data.get('track_ids', [])
         genre = data.get('genre', None)
 
-        print(f"\n[POST /recommend] Recebido:")
-        print(f"  - {len(track_ids)} faixas")
-        print(f"  - Gênero: {genre}")
+        logger.debug("[POST /recommend] Recebido: %d faixas, gênero: %s", len(track_ids), genre)
 
         if len(track_ids) < 3:
             return jsonify({'error': 'Selecione pelo menos 3 músicas'}), 400
+        mark('parse')
+
+        # O resultado depende só do conjunto de ids, do gênero e da versão do cache carregado
+        key = make_key('music_app', 'recommend', catalog.cache_version, ids=track_ids, genre=genre)
+        cached = cached_response(key)
+        if cached is not None: return cached
+        mark('cache_lookup')
 
         # Obter recomendações
         recs_df = recommender.get_recommendations(track_ids, genre_to_explore=genre)
 
         if recs_df.empty:
-            print("✗ Nenhuma recomendação gerada")
+            logger.debug("✗ Nenhuma recomendação gerada")
             return jsonify({'error': 'Não foi possível gerar recomendações'}), 500
 
         # Detectar nome da coluna de gênero
         genre_col = 'track_genre' if 'track_genre' in df_music.columns else 'genres'
 
-        # Categorizar recomendações
-        categories = {}
-        used_ids = set()
-
+        # Categorizar recomendações (uma passada sobre o ranking, sem repetir faixas)
         # 1. Principais (com similarity_score)
-        main_recs = recs_df.head(12)
-        categories['main'] = main_recs.to_dict('records')
-        used_ids.update(main_recs['id'].values)
+        buckets = [Bucket('main', 12)]
 
         # 2. Explorando gênero (se selecionado)
         if genre and genre_col in recs_df.columns:
-            genre_recs = recs_df[
-                (recs_df[genre_col] == genre) &
-                (~recs_df['id'].isin(used_ids))
-            ].head(6)
-
-            if not genre_recs.empty:
-                categories[f'exploring_{genre}'] = genre_recs.to_dict('records')
-                used_ids.update(genre_recs['id'].values)
+            buckets.append(Bucket(f'exploring_{genre}', 6, mask=(recs_df[genre_col] == genre).to_numpy()))
 
         # 3. Baseado em gênero dominante
-        selected_tracks = df_music[df_music['id'].isin(track_ids)]
+        selected_tracks = df_music.iloc[recommender.id_index.rows(track_ids)]
         if genre_col in selected_tracks.columns:
             dominant_genre = selected_tracks[genre_col].mode()
 
             if len(dominant_genre) > 0 and dominant_genre.iloc[0] != genre:
-                genre_based = recs_df[
-                    (recs_df[genre_col] == dominant_genre.iloc[0]) &
-                    (~recs_df['id'].isin(used_ids))
-                ].head(6)
-
-                if not genre_based.empty:
-                    categories[f'based_on_{dominant_genre.iloc[0]}'] = genre_based.to_dict('records')
-                    used_ids.update(genre_based['id'].values)
+                buckets.append(Bucket(f'based_on_{dominant_genre.iloc[0]}', 6, mask=(recs_df[genre_col] == dominant_genre.iloc[0]).to_numpy()))
 
         # 4. Joias escondidas
         if 'popularity' in recs_df.columns:
-            hidden_gems = recs_df[
-                (recs_df['popularity'] < 50) &
-                (~recs_df['id'].isin(used_ids))
-            ].head(6)
+            buckets.append(Bucket('hidden_gems', 6, mask=(recs_df['popularity'] < 50).to_numpy()))
 
-            if not hidden_gems.empty:
-                categories['hidden_gems'] = hidden_gems.to_dict('records')
+        picks = CategoryAllocator(recs_df['id']).allocate(buckets)
+        categories = {name: records(recs_df.iloc[positions], 'music') for name, positions in picks.items() if name == 'main' or len(positions)}
 
         # Analisar perfil do usuário
         profile = {
-            'tracks': selected_tracks.to_dict('records')
+            'tracks': records(selected_tracks, 'music')
         }
 
         if genre_col in selected_tracks.columns:
@@ -429,14 +465,14 @@ def recommend():
             profile['dominant_genre'] = dominant.iloc[0] if len(dominant) > 0 else None
             profile['genres_found'] = selected_tracks[genre_col].unique().tolist()
 
-        print(f"✓ Recomendações geradas com sucesso!")
-        print(f"  - Categorias: {list(categories.keys())}")
+        mark('categorization')
+        logger.debug("✓ Recomendações geradas: %s", list(categories.keys()))
 
-        return jsonify({
+        return store_response(key, json_response({
             'recommendations': categories,
             'profile': profile,
             'selected_genre': genre
-        })
+        }))
 
     except Exception as e:
         print("\n" + "="*50)
@@ -457,7 +493,7 @@ def get_track_details():
         if not track_ids:
             return jsonify({})
 
-        print(f"\n[POST /get-track-details] Buscando detalhes de {len(track_ids)} faixas...")
+        logger.debug("[POST /get-track-details] Buscando detalhes de %d faixas...", len(track_ids))
 
         # Obter token
         token = token_manager.get_token()
@@ -474,10 +510,11 @@ def get_track_details():
 
             headers = {'Authorization': f'Bearer {token}'}
             response = requests.get(
-                f'https://api.spotify.com/v1/tracks?ids={ids_param}',
+                f'{SPOTIFY_API_URL}/v1/tracks?ids={ids_param}',
                 headers=headers,
                 timeout=10
             )
+            mark('spotify')
 
             if response.status_code == 200:
                 tracks = response.json().get('tracks', [])
@@ -489,7 +526,7 @@ def get_track_details():
                             'preview_url': track.get('preview_url')
                         }
 
-        print(f"✓ Detalhes obtidos para {len(details)} faixas")
+        logger.debug("✓ Detalhes obtidos para %d faixas", len(details))
 
         return jsonify(details)
 
@@ -506,9 +543,12 @@ def create_app():
     app = Flask(__name__)
     CORS(app)
     app.register_blueprint(music_bp)
+    metrics.init_app(app)
+    lazy.init_app(app, {'music': music_catalog})
     return app
 
 if __name__ == '__main__':
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
     app = create_app()
     print("\n" + "="*50)
     print("Iniciando servidor Flask na porta 5002...")
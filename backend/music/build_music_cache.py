@@ -1,80 +1,221 @@
-# music/build_music_cache.py (v1.0)
+# music/build_music_cache.py (v1.2 - Gerações de cache)
+#
+# Sem argumentos, refaz o cache a partir de 'spotify_dataset.csv'. Com
+# --delta ARQUIVO (no esquema do CSV, chave 'track_id' e coluna opcional
+# 'op' = upsert|delete), transforma só as faixas do delta com os encoders de
+# 'music_encoders.pkl' e atualiza DataFrame, matriz, IVF (centróides mantidos),
+# vizinhos e índices derivados. O CSV de origem não é reescrito: o delta deve
+# ser incorporado a ele antes do próximo build completo.
+#
+# Todo build grava uma geração nova em 'cache/generations/', já com os nomes
+# que o recomendador lê, e só no fim a publica no ponteiro 'cache/CURRENT'
+# (common/generations.py); os servidores trocam para ela sem reiniciar.
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import MinMaxScaler, OneHotEncoder
 from scipy.sparse import hstack, csr_matrix
 import os
+import sys
 import pickle
 import json
-
-print("--- INICIANDO CONSTRUÇÃO DE CACHE PARA MÚSICAS ---")
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.ann_index import IVFIndex, prepare_vectors
+from common.artifacts import ARTIFACTS_DIR, load_artifacts, save_artifacts
+from common.compact import compact, storage_dtype, vector_arrays
+from common.generations import carry_over, new_generation, publish, resolve
+from common.incremental import INCREMENTAL_DRIFT_THRESHOLD, CatalogPatch, conform, read_delta
+from common.neighbors import NeighborTable
+from common.search_index import SearchIndex
+from common.genre_bits import GenreBits
 
 # --- Configurações ---
 CACHE_DIR = 'cache'
 INPUT_CSV = os.path.join(CACHE_DIR, 'spotify_dataset.csv')
-OUTPUT_DF_PARQUET = os.path.join(CACHE_DIR, 'music_processed.parquet')
-OUTPUT_MATRIX_PKL = os.path.join(CACHE_DIR, 'music_feature_matrix.pkl')
-OUTPUT_GENRES_JSON = os.path.join(CACHE_DIR, 'music_genres.json')
-OUTPUT_ENCODERS_PKL = os.path.join(CACHE_DIR, 'music_encoders.pkl') # Salvar os encoders é uma boa prática
-
-# Garante que o diretório de cache exista
-os.makedirs(CACHE_DIR, exist_ok=True)
-
-# --- Passo 1: Carregar e Limpar os Dados ---
-print(f"[PASSO 1/3] Carregando e limpando dados de '{INPUT_CSV}'...")
-try:
-    df = pd.read_csv(INPUT_CSV)
-except FileNotFoundError:
-    print(f"--- ERRO FATAL: Arquivo '{INPUT_CSV}' não encontrado. ---")
-    print("Certifique-se de que o dataset do Spotify está na pasta 'music/cache/'.")
-    exit()
-
-df.columns = df.columns.str.strip()
+# Arquivos de saída (dentro da pasta da geração, com os nomes lidos pelo MusicRecommender)
+OUTPUT_DF_PARQUET = 'music_data.parquet'
+OUTPUT_MATRIX_PKL = 'feature_matrix.pkl'
+OUTPUT_GENRES_JSON = 'genres.json'
+OUTPUT_ENCODERS_PKL = 'music_encoders.pkl' # Salvar os encoders é uma boa prática
 
 audio_feature_cols = ['acousticness', 'danceability', 'energy', 'instrumentalness', 'liveness', 'loudness', 'speechiness', 'tempo', 'valence']
 required_cols = ['track_id', 'track_name', 'artists', 'track_genre', 'popularity'] + audio_feature_cols
-
-df = df.dropna(subset=required_cols).copy()
-df = df.rename(columns={'track_id': 'id', 'track_name': 'name', 'track_genre': 'genres'})
-df = df.drop_duplicates(subset=['name', 'artists'])
-df['artists'] = df['artists'].str.split(';').str[0]
-df = df.reset_index(drop=True)
-print(f"-> Dados limpos. {len(df)} faixas únicas.")
-
-# --- Passo 2: Vetorizar Features ---
-print("[PASSO 2/3] Vetorizando features (Gênero + Áudio)...")
-genre_encoder = OneHotEncoder(handle_unknown='ignore', sparse_output=True)
-numerical_scaler = MinMaxScaler()
-
-genre_matrix = genre_encoder.fit_transform(df[['genres']])
-numerical_data = df[audio_feature_cols].astype(np.float32)
-numerical_matrix = numerical_scaler.fit_transform(numerical_data)
-
 W_GENRE, W_AUDIO = 0.6, 0.4
-feature_matrix = hstack([
-    genre_matrix.astype(np.float32) * W_GENRE,
-    csr_matrix(numerical_matrix).astype(np.float32) * W_AUDIO
-]).tocsr()
-print("-> Matriz de features criada.")
-
-# --- Passo 3: Salvar Artefatos em Cache ---
-print("[PASSO 3/3] Salvando arquivos de cache...")
-df.to_parquet(OUTPUT_DF_PARQUET)
-print(f"-> DataFrame processado salvo em '{OUTPUT_DF_PARQUET}'.")
-
-with open(OUTPUT_MATRIX_PKL, 'wb') as f:
-    pickle.dump(feature_matrix, f)
-print(f"-> Matriz de features salva em '{OUTPUT_MATRIX_PKL}'.")
-
-all_genres = sorted(df['genres'].unique().tolist())
-with open(OUTPUT_GENRES_JSON, 'w', encoding='utf-8') as f:
-    json.dump(all_genres, f, ensure_ascii=False, indent=4)
-print(f"-> Lista de gêneros salva em '{OUTPUT_GENRES_JSON}'.")
-
-# Salva os encoders para consistência futura, se necessário
-with open(OUTPUT_ENCODERS_PKL, 'wb') as f:
-    pickle.dump({'genre_encoder': genre_encoder, 'numerical_scaler': numerical_scaler}, f)
-print(f"-> Encoders salvos em '{OUTPUT_ENCODERS_PKL}'.")
 
 
-print("\n--- CONSTRUÇÃO DE CACHE DE MÚSICAS CONCLUÍDA ---")
+def load_source():
+    try:
+        df = pd.read_csv(INPUT_CSV)
+    except FileNotFoundError:
+        print(f"--- ERRO FATAL: Arquivo '{INPUT_CSV}' não encontrado. ---")
+        print("Certifique-se de que o dataset do Spotify está na pasta 'music/cache/'.")
+        exit()
+    df.columns = df.columns.str.strip()
+    return df
+
+
+def patched_source(upserts, deleted):
+    """CSV de origem com o delta aplicado em memória (faixas do delta no fim), para o build completo."""
+    source = load_source()
+    replaced = source['track_id'].isin(upserts['track_id']) | source['track_id'].isin(deleted)
+    return pd.concat([source[~replaced], upserts], ignore_index=True)
+
+
+def clean(df):
+    """Limpeza do dataset bruto (as mesmas regras valem para o CSV e para o delta)."""
+    df = df.dropna(subset=required_cols).copy()
+    df = df.rename(columns={'track_id': 'id', 'track_name': 'name', 'track_genre': 'genres'})
+    df = df.drop_duplicates(subset=['name', 'artists'])
+    df['artists'] = df['artists'].str.split(';').str[0]
+    return df.reset_index(drop=True)
+
+
+def vectorize(df, genre_encoder, numerical_scaler):
+    genre_matrix = genre_encoder.transform(df[['genres']])
+    numerical_matrix = numerical_scaler.transform(df[audio_feature_cols].astype(np.float32))
+    return hstack([
+        genre_matrix.astype(np.float32) * W_GENRE,
+        csr_matrix(numerical_matrix).astype(np.float32) * W_AUDIO
+    ]).tocsr()
+
+
+def drift_rate(df, genre_encoder, numerical_scaler):
+    """Fração das faixas com gênero desconhecido pelo encoder ou atributo de áudio fora da faixa do ajuste."""
+    if df.empty: return 0.0
+    unknown_genre = ~df['genres'].isin(genre_encoder.categories_[0])
+    values = df[audio_feature_cols].astype(np.float32).to_numpy()
+    out_of_range = ((values < numerical_scaler.data_min_) | (values > numerical_scaler.data_max_)).any(axis=1)
+    return float((unknown_genre.to_numpy() | out_of_range).mean())
+
+
+def save_outputs(output_dir, df, feature_matrix, normalized_matrix, feature_norms, ann_index, neighbors):
+    """Grava na geração DataFrame, matriz, gêneros e artefatos (busca e bitset de gêneros refeitos a partir do DataFrame)."""
+    df.to_parquet(os.path.join(output_dir, OUTPUT_DF_PARQUET))
+    print(f"-> DataFrame processado salvo em '{OUTPUT_DF_PARQUET}'.")
+
+    with open(os.path.join(output_dir, OUTPUT_MATRIX_PKL), 'wb') as f:
+        pickle.dump(feature_matrix, f)
+    print(f"-> Matriz de features salva em '{OUTPUT_MATRIX_PKL}'.")
+
+    all_genres = sorted(df['genres'].unique().tolist())
+    with open(os.path.join(output_dir, OUTPUT_GENRES_JSON), 'w', encoding='utf-8') as f:
+        json.dump(all_genres, f, ensure_ascii=False, indent=4)
+    print(f"-> Lista de gêneros salva em '{OUTPUT_GENRES_JSON}'.")
+
+    search_index = SearchIndex.build(df['name'] + ' ' + df['artists'], df['popularity'])
+    genre_bits = GenreBits.build(df['genres'], vocabulary=all_genres)
+    artifacts_path = os.path.join(output_dir, ARTIFACTS_DIR)
+    # Vetores servidos no tipo compacto (VECTOR_DTYPE); ANN e vizinhos já saíram da matriz completa
+    vectors = compact(normalized_matrix)
+    save_artifacts(artifacts_path, {
+        **vector_arrays('feature_matrix', vectors),
+        'feature_norms': feature_norms,
+        **ann_index.to_arrays(),
+        **neighbors.to_arrays(),
+        **search_index.to_arrays(),
+        **genre_bits.to_arrays(),
+    }, metadata={'weights': {'genre': W_GENRE, 'audio': W_AUDIO}, 'n_items': len(df), 'vector_dtype': storage_dtype(vectors)})
+    print(f"-> Artefatos mmap (vetores em {storage_dtype(vectors)}, índice ANN com {ann_index.n_lists} listas (nprobe {ann_index.nprobe}), top-{neighbors.k} vizinhos) salvos em '{artifacts_path}'.")
+
+
+def full_build(source, output_dir):
+    # --- Passo 1: Limpar os Dados ---
+    df = clean(source)
+    print(f"-> Dados limpos. {len(df)} faixas únicas.")
+
+    # --- Passo 2: Vetorizar Features ---
+    print("[PASSO 2/3] Vetorizando features (Gênero + Áudio)...")
+    genre_encoder = OneHotEncoder(handle_unknown='ignore', sparse_output=True).fit(df[['genres']])
+    numerical_scaler = MinMaxScaler().fit(df[audio_feature_cols].astype(np.float32))
+    feature_matrix = vectorize(df, genre_encoder, numerical_scaler)
+    print("-> Matriz de features criada.")
+
+    # --- Passo 3: Salvar Artefatos em Cache ---
+    print("[PASSO 3/3] Salvando arquivos de cache...")
+    # Salva os encoders: o modo incremental transforma o delta com eles
+    with open(os.path.join(output_dir, OUTPUT_ENCODERS_PKL), 'wb') as f:
+        pickle.dump({'genre_encoder': genre_encoder, 'numerical_scaler': numerical_scaler}, f)
+    print(f"-> Encoders salvos em '{OUTPUT_ENCODERS_PKL}'.")
+
+    normalized_matrix, feature_norms = prepare_vectors(feature_matrix)
+    save_outputs(output_dir, df, feature_matrix, normalized_matrix, feature_norms, IVFIndex.build(normalized_matrix), NeighborTable.build(normalized_matrix))
+
+
+def incremental_build(delta_path, output_dir):
+    """
+    Aplica o delta ao cache da geração ativa, gravando a geração nova em `output_dir`.
+
+    Faixas do delta descartadas pela limpeza (dados faltando, ou mesmo nome e
+    artista de outra faixa do catálogo) saem do catálogo, como no build completo.
+
+    Returns:
+        pd.DataFrame | None: o CSV de origem com o delta aplicado se for preciso o build completo
+    """
+    raw_upserts, raw_deleted = read_delta(delta_path, 'track_id')
+    raw_upserts.columns = raw_upserts.columns.str.strip()
+    # Parte da geração ativa: no layout antigo os nomes dos arquivos do build eram outros
+    generation, active_dir = resolve(CACHE_DIR)
+    artifacts = load_artifacts(os.path.join(active_dir, ARTIFACTS_DIR)) if generation is not None else None
+    if artifacts is None:
+        print("-> Nenhuma geração publicada.")
+        return patched_source(raw_upserts, raw_deleted)
+    df = pd.read_parquet(os.path.join(active_dir, OUTPUT_DF_PARQUET))
+    if artifacts.metadata.get('n_items') != len(df) or not df['id'].is_unique:
+        print("-> Cache atual de outro catálogo (ou com ids repetidos).")
+        return patched_source(raw_upserts, raw_deleted)
+
+    upserts = conform(clean(raw_upserts), df)
+    others = df[~df['id'].isin(raw_upserts['track_id']) & ~df['id'].isin(raw_deleted)]
+    duplicate = pd.MultiIndex.from_frame(upserts[['name', 'artists']]).isin(pd.MultiIndex.from_frame(others[['name', 'artists']]))
+    upserts = upserts[~duplicate].reset_index(drop=True)
+    deleted = pd.Index(raw_deleted).union(pd.Index(raw_upserts['track_id']).difference(upserts['id']))
+    patch = CatalogPatch(df['id'], upserts['id'], deleted)
+    print(f"-> Delta '{delta_path}': {patch.summary()}.")
+
+    with open(os.path.join(active_dir, OUTPUT_ENCODERS_PKL), 'rb') as f: encoders = pickle.load(f)
+    drift = drift_rate(upserts, encoders['genre_encoder'], encoders['numerical_scaler'])
+    print(f"-> Faixas do delta fora do ajuste dos encoders: {drift:.1%} (limite {INCREMENTAL_DRIFT_THRESHOLD:.0%}).")
+    if drift > INCREMENTAL_DRIFT_THRESHOLD: return patched_source(raw_upserts, raw_deleted)
+
+    delta_matrix = vectorize(upserts, encoders['genre_encoder'], encoders['numerical_scaler'])
+    with open(os.path.join(active_dir, OUTPUT_MATRIX_PKL), 'rb') as f: feature_matrix = patch.assemble(pickle.load(f), delta_matrix)
+    # Vetores refeitos da matriz completa (normalização O(nnz)): os gravados podem estar compactados
+    normalized_matrix, feature_norms = prepare_vectors(feature_matrix)
+    # Centróides mantidos: só a distribuição das linhas nas listas é refeita
+    ann_index = IVFIndex.from_centroids(normalized_matrix, np.array(artifacts['ann_centroids']))
+    neighbors = NeighborTable(artifacts['neighbor_ids'], artifacts['neighbor_scores']).update(normalized_matrix, patch)
+    carry_over(active_dir, output_dir, [OUTPUT_ENCODERS_PKL])
+    save_outputs(output_dir, patch.assemble(df, upserts), feature_matrix, normalized_matrix, feature_norms, ann_index, neighbors)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Constrói o cache de músicas.")
+    parser.add_argument('--delta', help="arquivo de faixas incluídas/alteradas/removidas a aplicar ao cache existente")
+    args = parser.parse_args()
+
+    print("--- INICIANDO CONSTRUÇÃO DE CACHE PARA MÚSICAS ---")
+
+    # Garante que o diretório de cache exista
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    output_dir = new_generation(CACHE_DIR)
+    source = None
+    if args.delta:
+        print("Modo incremental: aplicando o delta com os encoders salvos...")
+        source = incremental_build(args.delta, output_dir)
+        if source is not None:
+            print("-> Desvio acima do limite ou cache incompatível: refazendo o cache completo com o delta aplicado ao CSV.")
+    else:
+        # --- Passo 1: Carregar e Limpar os Dados ---
+        print(f"[PASSO 1/3] Carregando e limpando dados de '{INPUT_CSV}'...")
+        source = load_source()
+    if source is not None: full_build(source, output_dir)
+    print(f"-> Geração '{publish(CACHE_DIR, output_dir)}' publicada em '{CACHE_DIR}'.")
+
+    print("\n--- CONSTRUÇÃO DE CACHE DE MÚSICAS CONCLUÍDA ---")
+
+
+if __name__ == '__main__':
+    main()
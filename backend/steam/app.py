@@ -2,59 +2,83 @@
 import pandas as pd
 import numpy as np
 import pickle
-from sklearn.metrics.pairwise import cosine_similarity
 from thefuzz import process
 from flask import Flask, request, jsonify
 import json
 import traceback
-from collections import defaultdict
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.ann_index import ANN_CANDIDATE_POOL, dot_scores, index_from_artifacts, prepare_vectors, profile_query, sample_profiles
+from common.artifacts import ARTIFACTS_DIR, load_artifacts
+from common.compact import compact, vectors_from_artifacts
+from common.generations import resolve
+from common.id_index import IdIndex
+from common.search_index import SearchIndex
+from common.fuzzy_search import TitleBounds, fuzzy_search
+from common.categories import Bucket, CategoryAllocator
+from common.genre_bits import GenreBits
+from common import lazy
+from common.lazy import LazyRecommender
+from common.precomputed import PrecomputedPayload
+from common.serialization import json_response, records
+from common import metrics
+from common.metrics import mark
+from common.response_cache import cache_version, cached_response, make_key, store_response
+from common.diversity import CATALOG_STAT_PROFILES, DIVERSITY_TOP_M, PenaltyGroups, diversity_penalty, first_list_item, truncate_candidates
 
 # --- Funções e Classes (sem mudanças, exceto a rota 'recommend') ---
 
-def sanitize_for_json(data):
-    if isinstance(data, (list, tuple)): return [sanitize_for_json(item) for item in data]
-    if isinstance(data, dict): return {key: sanitize_for_json(value) for key, value in data.items()}
-    if isinstance(data, np.ndarray): return data.tolist()
-    if isinstance(data, (np.int64, np.int32, np.int16)): return int(data)
-    if isinstance(data, (np.float64, np.float32)): return float(data)
-    if pd.isna(data): return None
-    return data
-
-def check_genre_in_item(genres_item, target_genre):
-    if genres_item is None: return False
-    if isinstance(genres_item, list): return target_genre in genres_item
-    if not isinstance(genres_item, str): genres_item = str(genres_item)
-    return target_genre in genres_item
+# Ranking: boost do gênero explorado e penalidade para diversificar desenvolvedores
+GENRE_BOOST = 1.2
+DEVELOPER_PENALTY_FACTOR = 0.85
 
 class GameRecommender:
-    def __init__(self):
+    def __init__(self, cache_dir=None):
         self.is_ready = False
+        # Pasta do cache com as gerações; a vigia de gerações compara o CURRENT dela com a geração carregada
+        self.cache_root = cache_dir or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache')
         try:
             print("Carregando cache de jogos (v13.9)...")
-            base_dir = os.path.dirname(__file__)
-            CACHE_DIR = os.path.join(base_dir, 'cache')
+            # Geração ativa apontada por CURRENT (ou a própria pasta no layout antigo)
+            self.generation, CACHE_DIR = resolve(self.cache_root)
             self.df = pd.read_parquet(os.path.join(CACHE_DIR, 'games_processed_df.parquet'))
             
-            # Carrega as matrizes
-            with open(os.path.join(CACHE_DIR, 'genres_matrix.pkl'), 'rb') as f: self.genres_matrix = pickle.load(f)
-            with open(os.path.join(CACHE_DIR, 'categories_matrix.pkl'), 'rb') as f: self.categories_matrix = pickle.load(f)
-            with open(os.path.join(CACHE_DIR, 'description_matrix.pkl'), 'rb') as f: self.description_matrix = pickle.load(f)
-            with open(os.path.join(CACHE_DIR, 'developers_matrix.pkl'), 'rb') as f: self.developers_matrix = pickle.load(f)
             with open(os.path.join(CACHE_DIR, 'games_genres.json'), 'r', encoding='utf-8') as f: self.genres = json.load(f)
             
-            # Converte para np.ndarray se necessário
-            if not isinstance(self.genres_matrix, np.ndarray): self.genres_matrix = self.genres_matrix.toarray()
-            if not isinstance(self.categories_matrix, np.ndarray): self.categories_matrix = self.categories_matrix.toarray()
-            if not isinstance(self.description_matrix, np.ndarray): self.description_matrix = self.description_matrix.toarray()
-            if not isinstance(self.developers_matrix, np.ndarray): self.developers_matrix = self.developers_matrix.toarray()
-
-            weights = {'genres': 4.0, 'categories': 3.0, 'description': 1.0, 'developers': 1.0}
-            self.feature_matrix = (
-                self.genres_matrix * weights['genres'] + self.categories_matrix * weights['categories'] +
-                self.description_matrix * weights['description'] + self.developers_matrix * weights['developers']
-            )
+            artifacts = load_artifacts(os.path.join(CACHE_DIR, ARTIFACTS_DIR))
+            if artifacts is not None:
+                # Formato mmap: matriz esparsa já ponderada, normalizada e compactada (VECTOR_DTYPE) no build, sem densificar
+                self.feature_matrix, self.feature_norms = vectors_from_artifacts(artifacts, 'feature_matrix'), artifacts['feature_norms']
+            else:
+                # Carrega as matrizes
+                with open(os.path.join(CACHE_DIR, 'genres_matrix.pkl'), 'rb') as f: self.genres_matrix = pickle.load(f)
+                with open(os.path.join(CACHE_DIR, 'categories_matrix.pkl'), 'rb') as f: self.categories_matrix = pickle.load(f)
+                with open(os.path.join(CACHE_DIR, 'description_matrix.pkl'), 'rb') as f: self.description_matrix = pickle.load(f)
+                with open(os.path.join(CACHE_DIR, 'developers_matrix.pkl'), 'rb') as f: self.developers_matrix = pickle.load(f)
+
+                # Soma ponderada ainda esparsa; só o resultado vira np.ndarray, já no tipo compacto (VECTOR_DTYPE)
+                weights = {'genres': 4.0, 'categories': 3.0, 'description': 1.0, 'developers': 1.0}
+                weighted_matrix = (
+                    self.genres_matrix * weights['genres'] + self.categories_matrix * weights['categories'] +
+                    self.description_matrix * weights['description'] + self.developers_matrix * weights['developers']
+                )
+                if not isinstance(weighted_matrix, np.ndarray): weighted_matrix = weighted_matrix.toarray()
+                self.feature_matrix, self.feature_norms = prepare_vectors(weighted_matrix)
+                self.feature_matrix = compact(self.feature_matrix)
+                del self.genres_matrix, self.categories_matrix, self.description_matrix, self.developers_matrix
+            self.index = index_from_artifacts(artifacts, self.feature_matrix)
+            self.title_index = SearchIndex.from_artifacts(artifacts, len(self.df))
+            # Contagens por título para o limite superior do WRatio (busca com o resultado exato do extractBests)
+            self.title_bounds = TitleBounds(self.title_index) if self.title_index is not None else None
+            self.id_index = IdIndex(self.df['appid'])
+            self.genre_bits = GenreBits.from_artifacts(artifacts, self.df['genres'])
+            self.cache_version = cache_version(artifacts, os.path.join(CACHE_DIR, 'games_processed_df.parquet'))
             self.df['release_year'] = pd.to_datetime(self.df['release_date'], errors='coerce', format='%d/%b./%Y', dayfirst=True).dt.year
+            # Mínimo do display_score (penalized_score do ranking completo): com o pool do ANN ou o modo truncado, estimado aqui uma vez
+            self.MIN_PENALIZED_SCORE = self._catalog_min_score() if self.index.approximate or DIVERSITY_TOP_M else None
+            self.discover_payload = PrecomputedPayload(self._discover_payload)
             self.is_ready = True
             print(f">>> Sistema de jogos pronto. {len(self.df)} jogos e {len(self.genres)} gêneros carregados. <<<")
         except Exception as e:
@@ -63,64 +87,61 @@ class GameRecommender:
 
     def get_df_as_records(self, df_to_convert):
         if df_to_convert is None or df_to_convert.empty: return []
-        records = df_to_convert.to_dict('records')
-        return sanitize_for_json(records)
+        # Só os campos do schema de jogos, convertidos por coluna
+        return records(df_to_convert, 'games')
 
     def search_games(self, query, limit=30):
         if not self.is_ready or not query: return []
+        if self.title_index is not None:
+            # WRatio em C só nos títulos que podem alcançar o corte (mesmo resultado do extractBests)
+            return self.get_df_as_records(self.df.iloc[fuzzy_search(self.title_index, query, limit=limit, score_cutoff=60, bounds=self.title_bounds)])
         choices = self.df['name']
         results = process.extractBests(query, choices, score_cutoff=60, limit=limit)
         if not results: return []
         result_indices = [r[2] for r in results]
         return self.get_df_as_records(self.df.iloc[result_indices])
 
-    def discover_games(self):
+    def discover_games(self, seed=42):
         if not self.is_ready: return {}, {}
         iconic_appids = [570, 730, 271590, 1091500, 292030, 1245620, 620, 413150]
-        iconic_games = self.df[self.df['appid'].isin(iconic_appids)]
+        iconic_games = self.df.iloc[self.id_index.rows(iconic_appids)]
         explore_df = self.df[
             (self.df['quality'] > 0.92) &
-            (~self.df['genres'].apply(lambda g: check_genre_in_item(g, 'Ação') or check_genre_in_item(g, 'Aventura') or check_genre_in_item(g, 'RPG') or check_genre_in_item(g, 'Estratégia')))
-        ].sample(n=29, random_state=42)
+            (~self.genre_bits.mask(['Ação', 'Aventura', 'RPG', 'Estratégia']))
+        ].sample(n=29, random_state=seed)
         return self.get_df_as_records(iconic_games), self.get_df_as_records(explore_df)
 
+    def _discover_payload(self, slot):
+        # A janela de rotação só desloca a semente da amostra "explorar" (0 = amostra de sempre)
+        iconic, explore = self.discover_games(seed=42 + slot)
+        return {"iconic_games": iconic, "explore_games": explore}
+
     def get_recommendations(self, selected_game_ids, genre_to_explore=None):
         if not self.is_ready or not selected_game_ids: return pd.DataFrame()
         
-        selected_indices = self.df.index[self.df['appid'].isin(selected_game_ids)].tolist()
-        if not selected_indices: return pd.DataFrame()
+        selected_indices = self.id_index.rows(selected_game_ids)
+        if not selected_indices.size: return pd.DataFrame()
+        mark('id_lookup')
 
-        profile_vector = np.mean(self.feature_matrix[selected_indices], axis=0).reshape(1, -1)
-        similarities = cosine_similarity(profile_vector, self.feature_matrix).flatten()
+        query = profile_query(self.feature_matrix, self.feature_norms, selected_indices)
+        # Com o índice aproximado apenas o pool de candidatos é pontuado; a busca exata ranqueia o catálogo inteiro
+        pool_size = ANN_CANDIDATE_POOL if self.index.approximate else len(self.df)
+        top_indices, top_similarities = self.index.search(query, pool_size + len(selected_indices))
+        found = top_indices[0] >= 0
 
-        recs_df = self.df.copy()
-        recs_df['similarity'] = similarities
+        recs_df = self.df.iloc[top_indices[0][found]].copy()
+        recs_df['similarity'] = top_similarities[0][found]
+        mark('similarity')
         
         # --- LÓGICA DE PONTUAÇÃO HÍBRIDA APRIMORADA ---
-        # A similaridade agora tem um peso muito maior
-        recs_df['hybrid_score'] = (recs_df['similarity'] ** 2) * (recs_df['quality'] * 0.5 + 0.5)
-
-        # Boost para o gênero explorado
-        if genre_to_explore:
-            genre_mask = recs_df['genres'].apply(lambda g: check_genre_in_item(g, genre_to_explore))
-            recs_df.loc[genre_mask, 'hybrid_score'] *= 1.2 # Boost de 20%
-
-        # Penalidade para diversificar desenvolvedores
-        developer_penalty_factor = 0.85
-        developer_counts = defaultdict(int)
-        penalized_scores = []
-        
+        genre_mask = self.genre_bits.mask(genre_to_explore, rows=recs_df.index) if genre_to_explore else None
+        recs_df['hybrid_score'] = self._hybrid_scores(recs_df['similarity'].to_numpy(), recs_df['quality'].to_numpy(), genre_mask)
+
         # Remove os jogos de entrada e ordena pelo score híbrido
-        final_df = recs_df[~recs_df['appid'].isin(selected_game_ids)].sort_values('hybrid_score', ascending=False)
-
-        for _, row in final_df.iterrows():
-            developers_list = row['developers']
-            developer = developers_list[0] if isinstance(developers_list, list) and developers_list else 'N/A'
-            penalty = developer_penalty_factor ** developer_counts[developer]
-            penalized_scores.append(row['hybrid_score'] * penalty)
-            developer_counts[developer] += 1
-            
-        final_df['penalized_score'] = penalized_scores
+        final_df = truncate_candidates(recs_df[~np.isin(recs_df.index, selected_indices)].sort_values('hybrid_score', ascending=False))
+
+        penalty = diversity_penalty(first_list_item(final_df['developers']), DEVELOPER_PENALTY_FACTOR)
+        final_df['penalized_score'] = final_df['hybrid_score'].to_numpy() * penalty
         final_df = final_df.sort_values('penalized_score', ascending=False)
 
         # --- LÓGICA DE DISPLAY SCORE (PORCENTAGEM) ---
@@ -128,39 +149,69 @@ class GameRecommender:
         if not final_df.empty:
             scores = final_df['penalized_score']
             max_score, min_score = scores.max(), scores.min()
+            # Com o pool do ANN o mínimo do ranking completo vem da estimativa da carga
+            if self.MIN_PENALIZED_SCORE is not None: min_score = min(min_score, self.MIN_PENALIZED_SCORE)
             if max_score > min_score:
                 final_df['display_score'] = end_score_display + ((scores - min_score) / (max_score - min_score)) * (top_score_display - end_score_display)
             else:
                 final_df['display_score'] = top_score_display
-        
+        mark('penalty')
         return final_df
 
+    @staticmethod
+    def _hybrid_scores(similarities, quality, genre_mask=None):
+        """Score híbrido: a similaridade tem um peso muito maior que a qualidade; +20% para o gênero explorado."""
+        hybrid_scores = similarities ** 2 * (quality * 0.5 + 0.5)
+        return hybrid_scores if genre_mask is None else np.where(genre_mask, hybrid_scores * GENRE_BOOST, hybrid_scores)
+
+    def _catalog_min_score(self, n_profiles=CATALOG_STAT_PROFILES):
+        """Menor penalized_score do ranking completo (catálogo inteiro), mediana sobre perfis de amostra; só na carga."""
+        developer_groups = PenaltyGroups(first_list_item(self.df['developers']))
+        quality = self.df['quality'].to_numpy()
+        minimums = []
+        for rows in sample_profiles(len(self.df), n_profiles):
+            similarities = dot_scores(profile_query(self.feature_matrix, self.feature_norms, rows), self.feature_matrix)[0]
+            minimums.append(np.nanmin(developer_groups.penalized(self._hybrid_scores(similarities, quality), DEVELOPER_PENALTY_FACTOR, exclude=rows)))
+        return float(np.median(minimums)) if minimums else None
+
 # --- Rotas da API ---
 
+# O cache carrega em segundo plano (ou na primeira requisição) e troca de geração sem reiniciar o serviço
+recommender_games = LazyRecommender('games', GameRecommender)
 app = Flask(__name__)
-recommender = GameRecommender()
+metrics.init_app(app, domain='games')
+lazy.init_app(app, {'games': recommender_games})
 
 @app.route('/api/games/discover', methods=['GET'])
 def discover():
+    recommender = recommender_games.get()
     if not recommender.is_ready: return jsonify({"error": "Serviço de jogos indisponível"}), 503
-    iconic, explore = recommender.discover_games()
-    return jsonify({"iconic_games": iconic, "explore_games": explore})
+    return recommender.discover_payload.response()
 
 @app.route('/api/games/genres', methods=['GET'])
 def get_genres():
+    recommender = recommender_games.get()
     if not recommender.is_ready: return jsonify({"error": "Serviço de jogos indisponível"}), 503
-    return jsonify(recommender.genres)
+    key = make_key('steam_app', 'genres', recommender.cache_version)
+    return cached_response(key) or store_response(key, jsonify(recommender.genres))
 
 @app.route('/api/games/search', methods=['GET'])
 def search():
+    recommender = recommender_games.get()
     if not recommender.is_ready: return jsonify({"error": "Serviço de jogos indisponível"}), 503
     query = request.args.get('q', '')
+    key = make_key('steam_app', 'search', recommender.cache_version, q=query)
+    cached = cached_response(key)
+    if cached is not None: return cached
+    mark('cache_lookup')
     results = recommender.search_games(query)
-    return jsonify(results)
+    mark('search')
+    return store_response(key, json_response(results))
 
 @app.route('/api/games/recommend', methods=['POST'])
 def recommend():
     try:
+        recommender = recommender_games.get()
         if not recommender.is_ready: return jsonify({"error": "Serviço de jogos indisponível"}), 503
         data = request.get_json()
         game_ids = data.get('game_ids')
@@ -168,49 +219,50 @@ def recommend():
 
         if not game_ids or len(game_ids) < 3:
             return jsonify({"error": "São necessários pelo menos 3 jogos."}), 400
+        mark('parse')
+
+        # O resultado depende só do conjunto de ids, do gênero e da versão do cache carregado
+        key = make_key('steam_app', 'recommend', recommender.cache_version, ids=game_ids, genre=genre)
+        cached = cached_response(key)
+        if cached is not None: return cached
+        mark('cache_lookup')
 
         recs_df = recommender.get_recommendations(game_ids, genre_to_explore=genre)
         if recs_df.empty:
             return jsonify({"recommendations": {}, "profile": {}})
 
-        # --- LÓGICA DE CATEGORIZAÇÃO SEM REPETIÇÃO ---
-        used_appids = set(game_ids)
-        
-        def get_unique_recs(df, num, exclude_ids):
-            recs = df[~df['appid'].isin(exclude_ids)].head(num)
-            exclude_ids.update(recs['appid'].tolist())
-            return recs
-
-        main_recs = get_unique_recs(recs_df, 12, used_appids)
-        hidden_gems = get_unique_recs(recs_df[recs_df['quality'] < 0.88], 6, used_appids)
-        
-        genre_favorites = pd.DataFrame()
-        if genre:
-            genre_recs_df = recs_df[recs_df['genres'].apply(lambda g: check_genre_in_item(g, genre))]
-            genre_favorites = get_unique_recs(genre_recs_df, 6, used_appids)
-
-        recommendations = {
-            "main": recommender.get_df_as_records(main_recs),
-            "hidden_gems": recommender.get_df_as_records(hidden_gems),
-            "genre_favorites": recommender.get_df_as_records(genre_favorites),
-        }
-
-        profile_df = recommender.df[recommender.df['appid'].isin(game_ids)]
-        all_genres = [g for genres_list in profile_df['genres'] for g in genres_list if g]
-        dominant_genre = pd.Series(all_genres).mode()[0] if all_genres else "Variado"
-        
-        profile = {
-            "games": recommender.get_df_as_records(profile_df),
-            "dominant_genre": dominant_genre,
-            "selected_genre": genre or ""
-        }
-
-        return jsonify({"recommendations": recommendations, "profile": profile})
+        return store_response(key, json_response(recommendation_payload(recommender, game_ids, genre, recs_df)))
     except Exception as e:
         print("\n--- ERRO NA ROTA /api/games/recommend ---")
         traceback.print_exc()
         print("-----------------------------------------\n")
         return jsonify({"error": "Ocorreu um erro interno no servidor."}), 500
 
+def recommendation_payload(recommender, game_ids, genre, recs_df):
+    """Corpo do /recommend a partir do ranking: categorias da página e perfil."""
+    # --- LÓGICA DE CATEGORIZAÇÃO SEM REPETIÇÃO (uma passada sobre o ranking) ---
+    buckets = [Bucket("main", 12), Bucket("hidden_gems", 6, mask=(recs_df['quality'] < 0.88).to_numpy())]
+    if genre: buckets.append(Bucket("genre_favorites", 6, mask=recommender.genre_bits.mask(genre, rows=recs_df.index)))
+    picks = CategoryAllocator(recs_df['appid'], used_ids=game_ids).allocate(buckets)
+
+    recommendations = {
+        "main": recommender.get_df_as_records(recs_df.iloc[picks["main"]]),
+        "hidden_gems": recommender.get_df_as_records(recs_df.iloc[picks["hidden_gems"]]),
+        "genre_favorites": recommender.get_df_as_records(recs_df.iloc[picks["genre_favorites"]]) if genre else [],
+    }
+
+    profile_df = recommender.df.iloc[recommender.id_index.rows(game_ids)]
+    all_genres = [g for genres_list in profile_df['genres'] for g in genres_list if g]
+    dominant_genre = pd.Series(all_genres).mode()[0] if all_genres else "Variado"
+
+    profile = {
+        "games": recommender.get_df_as_records(profile_df),
+        "dominant_genre": dominant_genre,
+        "selected_genre": genre or ""
+    }
+    mark('categorization')
+
+    return {"recommendations": recommendations, "profile": profile}
+
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
@@ -1,89 +1,234 @@
-# steam/build_games_cache.py (v1.7.1 - Correção do fillna)
+# steam/build_games_cache.py (v1.9 - Gerações de cache)
+#
+# Sem argumentos, refaz o cache inteiro a partir de 'cache/games_processed_df.parquet'.
+# Com --delta ARQUIVO (parquet/json/jsonl/csv no esquema do DataFrame, chave
+# 'appid' e coluna opcional 'op' = upsert|delete), aplica o delta ao cache da
+# geração ativa e vetoriza só as linhas do delta com o 'unified_vectorizer.pkl'
+# já ajustado; matrizes, IVF (centróides mantidos) e vizinhos são atualizados.
+# Se o delta trouxer vocabulário novo demais (INCREMENTAL_DRIFT_THRESHOLD),
+# cai no build completo sobre o DataFrame já atualizado.
+#
+# Todo build grava uma geração nova em 'cache/generations/' e só no fim a
+# publica no ponteiro 'cache/CURRENT' (common/generations.py); os servidores
+# trocam para ela sem reiniciar.
 import pandas as pd
+import numpy as np
 import pickle
 from sklearn.feature_extraction.text import TfidfVectorizer
 import os
+import sys
 import json
+import argparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.ann_index import IVFIndex, prepare_vectors
+from common.artifacts import ARTIFACTS_DIR, load_artifacts, save_artifacts
+from common.compact import compact, storage_dtype, vector_arrays
+from common.generations import carry_over, new_generation, publish, resolve
+from common.incremental import INCREMENTAL_DRIFT_THRESHOLD, CatalogPatch, conform, oov_rate, read_delta, sample_texts
+from common.neighbors import NeighborTable
+from common.search_index import SearchIndex
+from common.fuzzy_search import process_title
+from common.genre_bits import GenreBits
 
 # --- Configurações ---
 CACHE_DIR = 'cache'
-INPUT_FILE = os.path.join(CACHE_DIR, 'games_processed_df.parquet')
-# Arquivos de saída
-GENRES_MATRIX_FILE = os.path.join(CACHE_DIR, 'genres_matrix.pkl')
-CATEGORIES_MATRIX_FILE = os.path.join(CACHE_DIR, 'categories_matrix.pkl')
-DESCRIPTION_MATRIX_FILE = os.path.join(CACHE_DIR, 'description_matrix.pkl')
-DEVELOPERS_MATRIX_FILE = os.path.join(CACHE_DIR, 'developers_matrix.pkl')
-VECTORIZER_FILE = os.path.join(CACHE_DIR, 'unified_vectorizer.pkl')
-
-# --- INÍCIO DO PROCESSO ---
-print("--- INICIANDO CONSTRUÇÃO DE CACHE VETORIAL (v1.7.1) ---")
-
-# Garante que o diretório de cache exista
-os.makedirs(CACHE_DIR, exist_ok=True)
-
-if not os.path.exists(INPUT_FILE):
-    print(f"ERRO CRÍTICO: O arquivo de entrada '{INPUT_FILE}' não foi encontrado.")
-    print("Certifique-se de que o arquivo de dados enriquecido da v1.6 está na pasta 'cache'.")
-else:
-    # PASSO 1: Carregar o DataFrame enriquecido
-    print(f"[PASSO 1/4] Carregando dados de '{INPUT_FILE}'...")
-    df = pd.read_parquet(INPUT_FILE)
-    print(f"-> OK. {len(df)} jogos carregados.")
+GAMES_DF_FILE = 'games_processed_df.parquet'
+INPUT_FILE = os.path.join(CACHE_DIR, GAMES_DF_FILE)
+# Arquivos de saída (dentro da pasta da geração)
+GENRES_MATRIX_FILE = 'genres_matrix.pkl'
+CATEGORIES_MATRIX_FILE = 'categories_matrix.pkl'
+DESCRIPTION_MATRIX_FILE = 'description_matrix.pkl'
+DEVELOPERS_MATRIX_FILE = 'developers_matrix.pkl'
+VECTORIZER_FILE = 'unified_vectorizer.pkl'
+GAMES_GENRES_FILE = 'games_genres.json'
+# Mesmos pesos usados pelo GameRecommender para combinar as matrizes
+FEATURE_WEIGHTS = {'genres': 4.0, 'categories': 3.0, 'description': 1.0, 'developers': 1.0}
+# Matriz -> arquivo (o texto de cada matriz fica na coluna '<nome>_text')
+MATRIX_FILES = {'genres': GENRES_MATRIX_FILE, 'categories': CATEGORIES_MATRIX_FILE, 'description': DESCRIPTION_MATRIX_FILE, 'developers': DEVELOPERS_MATRIX_FILE}
+KEY_COLUMN = 'appid'
 
-    # PASSO 2: Preparar os campos de texto
-    print("[PASSO 2/4] Preparando campos de texto para vetorização...")
-    
+
+def prepare_texts(df):
+    """Cópia do DataFrame com os campos de texto usados na vetorização."""
+    df = df.copy()
     # --- CORREÇÃO AQUI ---
     # Substitui valores nulos em colunas de lista com uma lista vazia
     # A função apply garante que cada célula seja tratada individualmente
-    df['genres'] = df['genres'].apply(lambda x: x if isinstance(x, list) else [])
-    df['categories'] = df['categories'].apply(lambda x: x if isinstance(x, list) else [])
-    df['developers'] = df['developers'].apply(lambda x: x if isinstance(x, list) else [])
+    # (colunas de lista lidas do parquet chegam como np.ndarray)
+    df['genres'] = df['genres'].apply(lambda x: list(x) if isinstance(x, (list, np.ndarray)) else [])
+    df['categories'] = df['categories'].apply(lambda x: list(x) if isinstance(x, (list, np.ndarray)) else [])
+    df['developers'] = df['developers'].apply(lambda x: list(x) if isinstance(x, (list, np.ndarray)) else [])
     # Para strings, fillna com '' funciona bem
-    df['short_description'].fillna('', inplace=True)
+    df['short_description'] = df['short_description'].fillna('')
     # --- FIM DA CORREÇÃO ---
 
     df['genres_text'] = df['genres'].apply(lambda x: ' '.join(x))
     df['categories_text'] = df['categories'].apply(lambda x: ' '.join([cat['description'] for cat in x if 'description' in cat]))
     df['developers_text'] = df['developers'].apply(lambda x: ''.join(d.replace(' ', '') for d in x)) # Junta nomes de devs para tratá-los como uma única palavra
     df['description_text'] = df['short_description']
+    return df
+
+
+def vectorize(vectorizer, df):
+    return {name: vectorizer.transform(df[f'{name}_text']) for name in MATRIX_FILES}
+
+
+def unified_texts(df):
+    """Os quatro textos de cada jogo, na ordem do corpus unificado."""
+    return pd.concat([df[f'{name}_text'] for name in ['genres', 'categories', 'description', 'developers']], ignore_index=True)
+
+
+def weighted_vectors(matrices):
+    return sum(matrices[name] * weight for name, weight in FEATURE_WEIGHTS.items())
+
+
+def save_derived(output_dir, df, texts, matrices, normalized_matrix, feature_norms, ann_index, neighbors, metadata):
+    """Grava na geração o DataFrame, as matrizes, a lista de gêneros e os artefatos mmap (índices derivados do DataFrame refeitos aqui)."""
+    df.to_parquet(os.path.join(output_dir, GAMES_DF_FILE))
+    for name, file_name in MATRIX_FILES.items():
+        with open(os.path.join(output_dir, file_name), 'wb') as f: pickle.dump(matrices[name], f)
+    print("-> OK. DataFrame e matrizes de vetores individuais salvos.")
+
+    all_genres = sorted(list(set(genre for sublist in texts['genres'] for genre in sublist)))
+    with open(os.path.join(output_dir, GAMES_GENRES_FILE), 'w', encoding='utf-8') as f:
+        json.dump(all_genres, f, ensure_ascii=False, indent=4)
+    genre_bits = GenreBits.build(texts['genres'], vocabulary=all_genres)
+    print(f"-> OK. Lista de gêneros salva em '{GAMES_GENRES_FILE}'.")
+    # Títulos já pré-processados para a busca fuzzy, indexados por trigramas (na ordem do DataFrame)
+    title_index = SearchIndex.build(df['name'].map(process_title))
+
+    artifacts_path = os.path.join(output_dir, ARTIFACTS_DIR)
+    # Vetores servidos no tipo compacto (VECTOR_DTYPE); ANN e vizinhos já saíram da matriz completa
+    vectors = compact(normalized_matrix)
+    manifest = save_artifacts(artifacts_path, {
+        **vector_arrays('feature_matrix', vectors),
+        'feature_norms': feature_norms,
+        **ann_index.to_arrays(),
+        **neighbors.to_arrays(),
+        **title_index.to_arrays(),
+        **genre_bits.to_arrays(),
+    }, metadata={'feature_weights': FEATURE_WEIGHTS, 'n_items': len(df), 'vector_dtype': storage_dtype(vectors), **metadata})
+    print(f"-> OK. Artefatos salvos em '{artifacts_path}' (vetores em {storage_dtype(vectors)}, hash {manifest['content_hash'][:12]}).")
+
+
+def full_build(df, output_dir):
+    # PASSO 2: Preparar os campos de texto
+    print("[PASSO 2/6] Preparando campos de texto para vetorização...")
+    texts = prepare_texts(df)
     print("-> OK. Campos de texto preparados.")
 
     # PASSO 3: Criar um vocabulário unificado
-    print("[PASSO 3/4] Criando vocabulário unificado e vetorizando campos...")
-    unified_corpus = pd.concat([
-        df['genres_text'],
-        df['categories_text'],
-        df['description_text'],
-        df['developers_text']
-    ], ignore_index=True)
-
+    print("[PASSO 3/6] Criando vocabulário unificado e vetorizando campos...")
+    unified_corpus = unified_texts(texts)
     unified_vectorizer = TfidfVectorizer(stop_words='english', max_features=5000)
     unified_vectorizer.fit(unified_corpus)
-    
-    with open(VECTORIZER_FILE, 'wb') as f:
+
+    with open(os.path.join(output_dir, VECTORIZER_FILE), 'wb') as f:
         pickle.dump(unified_vectorizer, f)
     print("-> OK. Vetorizador unificado salvo.")
+    # Taxa de termos fora do vocabulário do próprio corpus: referência para o desvio do modo incremental
+    baseline_oov = oov_rate(unified_vectorizer.build_analyzer(), unified_vectorizer.vocabulary_, sample_texts(unified_corpus))
 
     # PASSO 4: Vetorizar cada campo separadamente
-    print("[PASSO 4/4] Vetorizando campos individuais e salvando matrizes...")
-    genres_matrix = unified_vectorizer.transform(df['genres_text'])
-    categories_matrix = unified_vectorizer.transform(df['categories_text'])
-    description_matrix = unified_vectorizer.transform(df['description_text'])
-    developers_matrix = unified_vectorizer.transform(df['developers_text'])
-
-    with open(GENRES_MATRIX_FILE, 'wb') as f: pickle.dump(genres_matrix, f)
-    with open(CATEGORIES_MATRIX_FILE, 'wb') as f: pickle.dump(categories_matrix, f)
-    with open(DESCRIPTION_MATRIX_FILE, 'wb') as f: pickle.dump(description_matrix, f)
-    with open(DEVELOPERS_MATRIX_FILE, 'wb') as f: pickle.dump(developers_matrix, f)
-    print("-> OK. Matrizes de vetores individuais salvas.")
-
-    # PASSO 5: EXTRAIR E SALVAR LISTA DE GÊNEROS PARA O FRONTEND
-    print("[PASSO 5/5] Extraindo e salvando lista de gêneros...")
-    all_genres = sorted(list(set(genre for sublist in df['genres'] for genre in sublist)))
-    GAMES_GENRES_FILE = os.path.join(CACHE_DIR, 'games_genres.json')
-    with open(GAMES_GENRES_FILE, 'w', encoding='utf-8') as f:
-        json.dump(all_genres, f, ensure_ascii=False, indent=4)
-    print(f"-> OK. Lista de gêneros salva em '{GAMES_GENRES_FILE}'.")
+    print("[PASSO 4/6] Vetorizando campos individuais e salvando matrizes...")
+    matrices = vectorize(unified_vectorizer, texts)
+
+    # PASSO 5: CONSTRUIR O ÍNDICE ANN E OS VIZINHOS SOBRE A MATRIZ PONDERADA
+    print("[PASSO 5/6] Construindo índice de vizinhos aproximados (IVF) e tabela de vizinhos...")
+    normalized_matrix, feature_norms = prepare_vectors(weighted_vectors(matrices))
+    ann_index = IVFIndex.build(normalized_matrix)
+    neighbors = NeighborTable.build(normalized_matrix)
+    print(f"-> OK. Índice com {ann_index.n_lists} listas (nprobe {ann_index.nprobe}) e top-{neighbors.k} vizinhos de cada jogo.")
+
+    # PASSO 6: SALVAR MATRIZES, GÊNEROS E ARTEFATOS NO FORMATO MMAP (SEM PICKLE)
+    print("[PASSO 6/6] Salvando matrizes, gêneros e artefatos para carga via memory-map...")
+    save_derived(output_dir, df, texts, matrices, normalized_matrix, feature_norms, ann_index, neighbors, {'oov_rate': baseline_oov})
+
+
+def incremental_build(df, delta_path, output_dir):
+    """
+    Aplica o delta ao cache da geração ativa, gravando a geração nova em `output_dir`.
+
+    O DataFrame de partida é o da geração ativa; sem geração publicada, o de `INPUT_FILE`.
+
+    Returns:
+        tuple: (DataFrame com o delta aplicado, False se for preciso o build completo)
+    """
+    generation, active_dir = resolve(CACHE_DIR)
+    if generation is not None: df = pd.read_parquet(os.path.join(active_dir, GAMES_DF_FILE))
+    upserts, deleted = read_delta(delta_path, KEY_COLUMN)
+    upserts = conform(upserts, df)
+    patch = CatalogPatch(df[KEY_COLUMN], upserts[KEY_COLUMN], deleted)
+    print(f"-> Delta '{delta_path}': {patch.summary()}.")
+    df = patch.assemble(df, upserts)
+
+    artifacts = load_artifacts(os.path.join(active_dir, ARTIFACTS_DIR)) if generation is not None else None
+    if artifacts is None or artifacts.metadata.get('n_items') != patch.n_old:
+        print("-> Nenhuma geração publicada, ou de outro catálogo.")
+        return df, False
+    with open(os.path.join(active_dir, VECTORIZER_FILE), 'rb') as f: unified_vectorizer = pickle.load(f)
+    delta_texts = prepare_texts(upserts)
+    drift = oov_rate(unified_vectorizer.build_analyzer(), unified_vectorizer.vocabulary_, unified_texts(delta_texts)) - artifacts.metadata.get('oov_rate', 0.0)
+    print(f"-> Termos fora do vocabulário no delta: {drift:+.1%} em relação ao build completo (limite {INCREMENTAL_DRIFT_THRESHOLD:.0%}).")
+    if drift > INCREMENTAL_DRIFT_THRESHOLD: return df, False
+
+    delta_matrices = vectorize(unified_vectorizer, delta_texts)
+    matrices = {}
+    for name, file_name in MATRIX_FILES.items():
+        with open(os.path.join(active_dir, file_name), 'rb') as f: matrices[name] = patch.assemble(pickle.load(f), delta_matrices[name])
+    # Vetores refeitos das matrizes completas (normalização O(nnz)): os gravados podem estar compactados
+    normalized_matrix, feature_norms = prepare_vectors(weighted_vectors(matrices))
+    # Centróides mantidos: só a distribuição das linhas nas listas é refeita
+    ann_index = IVFIndex.from_centroids(normalized_matrix, np.array(artifacts['ann_centroids']))
+    neighbors = NeighborTable(artifacts['neighbor_ids'], artifacts['neighbor_scores']).update(normalized_matrix, patch)
+    carry_over(active_dir, output_dir, [VECTORIZER_FILE])
+    save_derived(output_dir, df, prepare_texts(df), matrices, normalized_matrix, feature_norms, ann_index, neighbors, {'oov_rate': artifacts.metadata.get('oov_rate', 0.0)})
+    return df, True
+
+
+def update_input(df):
+    """O delta também vai para a entrada, que é a fonte do próximo build completo."""
+    df.to_parquet(INPUT_FILE + '.tmp')
+    os.replace(INPUT_FILE + '.tmp', INPUT_FILE)
+    print(f"-> OK. '{INPUT_FILE}' atualizado com {len(df)} jogos.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Constrói o cache vetorial de jogos.")
+    parser.add_argument('--delta', help="arquivo de itens incluídos/alterados/removidos a aplicar ao cache existente")
+    args = parser.parse_args()
+
+    # --- INÍCIO DO PROCESSO ---
+    print("--- INICIANDO CONSTRUÇÃO DE CACHE VETORIAL (v1.9) ---")
+
+    # Garante que o diretório de cache exista
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    if not os.path.exists(INPUT_FILE):
+        print(f"ERRO CRÍTICO: O arquivo de entrada '{INPUT_FILE}' não foi encontrado.")
+        print("Certifique-se de que o arquivo de dados enriquecido da v1.6 está na pasta 'cache'.")
+        return
+
+    # PASSO 1: Carregar o DataFrame enriquecido
+    print(f"[PASSO 1/6] Carregando dados de '{INPUT_FILE}'...")
+    df = pd.read_parquet(INPUT_FILE)
+    print(f"-> OK. {len(df)} jogos carregados.")
+
+    output_dir = new_generation(CACHE_DIR)
+    if args.delta:
+        print("Modo incremental: aplicando o delta com o vetorizador salvo...")
+        df, applied = incremental_build(df, args.delta, output_dir)
+        if not applied:
+            print("-> Desvio acima do limite ou cache incompatível: refazendo o cache completo com o delta aplicado.")
+            full_build(df, output_dir)
+        update_input(df)
+    else:
+        full_build(df, output_dir)
+    print(f"-> OK. Geração '{publish(CACHE_DIR, output_dir)}' publicada em '{CACHE_DIR}'.")
+
+    print("\n--- CONSTRUÇÃO DO CACHE VETORIAL CONCLUÍDA! ---")
+
 
-    print("\n--- CONSTRUÇÃO DO CACHE VETORIAL CONCLUÍDA! ---")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
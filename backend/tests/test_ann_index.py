@@ -0,0 +1,57 @@
+# backend/tests/test_ann_index.py
+"""Recall do índice IVF (common/ann_index.py) contra a busca exata, com o nprobe padrão (calibrado no build)."""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from scipy import sparse
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.ann_index import ANN_RECALL_K, ANN_TARGET_RECALL, ExactIndex, IVFIndex, calibration_queries, index_from_artifacts, prepare_vectors, profile_query, recall_at_k, _nprobe_steps
+
+# Piso de recall@k nas consultas de teste (a calibração mira ANN_TARGET_RECALL nas consultas de amostra do build)
+RECALL_FLOOR = 0.90
+
+
+@pytest.fixture(scope='module', params=['dense', 'sparse'])
+def catalog(request):
+    """Catálogo com grupos, como os de gênero/artista: 6000 itens em torno de 60 centros."""
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(60, 48))
+    matrix = centers[rng.integers(0, 60, size=6000)] + rng.normal(scale=0.9, size=(6000, 48))
+    if request.param == 'sparse':
+        matrix = sparse.csr_matrix(np.where(matrix > 0.8, matrix, 0))
+    vectors, norms = prepare_vectors(matrix)
+    return vectors, norms, IVFIndex.build(vectors)
+
+
+def held_out_queries(vectors, norms, n=150, seed=7):
+    rng = np.random.default_rng(seed)
+    return np.vstack([profile_query(vectors, norms, rng.choice(vectors.shape[0], size=rng.integers(3, 6), replace=False)) for _ in range(n)])
+
+
+def test_default_nprobe_reaches_recall_floor(catalog):
+    vectors, norms, index = catalog
+    assert recall_at_k(index, held_out_queries(vectors, norms), ANN_RECALL_K) >= RECALL_FLOOR
+
+
+def test_loaded_index_uses_calibrated_nprobe(catalog):
+    vectors, norms, index = catalog
+    loaded = index_from_artifacts(index.to_arrays(), vectors)
+    assert loaded.approximate and loaded.nprobe == index.nprobe
+    assert recall_at_k(loaded, held_out_queries(vectors, norms), ANN_RECALL_K) >= RECALL_FLOOR
+
+
+def test_calibration_picks_smallest_sufficient_nprobe(catalog):
+    vectors, _, index = catalog
+    queries = calibration_queries(vectors)
+    assert recall_at_k(index, queries, ANN_RECALL_K) >= ANN_TARGET_RECALL
+    smaller = [nprobe for nprobe in _nprobe_steps(index.n_lists) if nprobe < index.nprobe]
+    if smaller: assert recall_at_k(index, queries, ANN_RECALL_K, nprobe=smaller[-1]) < ANN_TARGET_RECALL
+
+
+def test_exact_index_is_its_own_oracle(catalog):
+    vectors, norms, _ = catalog
+    assert recall_at_k(ExactIndex(vectors), held_out_queries(vectors, norms), ANN_RECALL_K) == 1.0
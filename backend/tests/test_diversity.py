@@ -0,0 +1,120 @@
+# backend/tests/test_diversity.py
+"""Paridade da penalidade de diversidade vetorizada (common/diversity.py) com os laços iterrows originais."""
+
+import os
+import sys
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.diversity import PenaltyGroups, diversity_penalty, first_list_item, truncate_candidates
+
+
+@pytest.fixture
+def games():
+    rng = np.random.default_rng(0)
+    studios = ['Valve', 'Ubisoft', 'Capcom', 'Bethesda', 'Indie', None]
+    developers = [rng.choice(studios, size=rng.integers(1, 3)).tolist() for _ in range(300)]
+    developers[::17] = [[] for _ in developers[::17]]
+    developers[::23] = [np.nan for _ in developers[::23]]
+    developers[::29] = ['Valve' for _ in developers[::29]]
+    return pd.DataFrame({'appid': np.arange(300), 'developers': developers, 'hybrid_score': rng.permutation(300) / 300 + 0.01})
+
+
+@pytest.fixture
+def tracks():
+    rng = np.random.default_rng(1)
+    artists = rng.choice(['A', 'B', 'C', 'D', 'E', 'F', 'G'], size=300, p=[0.4, 0.2, 0.1, 0.1, 0.1, 0.05, 0.05])
+    return pd.DataFrame({'id': np.arange(300), 'artists': artists, 'similarity': rng.permutation(300) / 300 + 0.01})
+
+
+def loop_games(recs_df, factor=0.85):
+    """Laço de steam/app.py e blueprints/games.py antes da vetorização."""
+    developer_counts = defaultdict(int)
+    penalized_scores = []
+    final_df = recs_df.sort_values('hybrid_score', ascending=False)
+    for _, row in final_df.iterrows():
+        developers_list = row['developers']
+        developer = developers_list[0] if isinstance(developers_list, list) and developers_list else 'N/A'
+        penalized_scores.append(row['hybrid_score'] * factor ** developer_counts[developer])
+        developer_counts[developer] += 1
+    final_df['penalized_score'] = penalized_scores
+    return final_df.sort_values('penalized_score', ascending=False)
+
+
+def vectorized_games(recs_df, factor=0.85, top_m=None):
+    final_df = truncate_candidates(recs_df.sort_values('hybrid_score', ascending=False), top_m)
+    final_df['penalized_score'] = final_df['hybrid_score'].to_numpy() * diversity_penalty(first_list_item(final_df['developers']), factor)
+    return final_df.sort_values('penalized_score', ascending=False)
+
+
+def loop_music(recs_df, input_artists, factor=0.85):
+    """Laço de blueprints/music.py antes da vetorização (artistas de entrada levam mais x0,5)."""
+    artist_counts = defaultdict(int)
+    penalized_scores = []
+    final_df = recs_df.sort_values('similarity', ascending=False)
+    for _, row in final_df.iterrows():
+        artist = row['artists']
+        penalty = factor ** artist_counts[artist]
+        if artist in input_artists: penalty *= 0.5
+        penalized_scores.append(row['similarity'] * penalty)
+        artist_counts[artist] += 1
+    final_df['final_score'] = penalized_scores
+    return final_df.sort_values('final_score', ascending=False)
+
+
+def vectorized_music(recs_df, input_artists, factor=0.85, top_m=None):
+    final_df = truncate_candidates(recs_df.sort_values('similarity', ascending=False), top_m)
+    penalty = diversity_penalty(final_df['artists'], factor)
+    penalty = np.where(final_df['artists'].isin(input_artists), penalty * 0.5, penalty)
+    final_df['final_score'] = final_df['similarity'].to_numpy() * penalty
+    return final_df.sort_values('final_score', ascending=False)
+
+
+def test_games_developer_penalty_matches_loop(games):
+    expected, result = loop_games(games), vectorized_games(games)
+    assert result['appid'].tolist() == expected['appid'].tolist()
+    np.testing.assert_allclose(result['penalized_score'], expected['penalized_score'], rtol=1e-12)
+
+
+def test_music_artist_penalty_matches_loop(tracks):
+    input_artists = np.array(['A', 'D'], dtype=object)
+    expected, result = loop_music(tracks, input_artists), vectorized_music(tracks, input_artists)
+    assert result['id'].tolist() == expected['id'].tolist()
+    np.testing.assert_allclose(result['final_score'], expected['final_score'], rtol=1e-12)
+
+
+@pytest.mark.parametrize('top_m', [1, 25, 100])
+def test_truncated_mode_matches_loop_on_top_candidates(games, tracks, top_m):
+    # O contador de uma posição só depende das anteriores: nos top-M o score é o do laço sobre o ranking inteiro
+    top_games = games.sort_values('hybrid_score', ascending=False).head(top_m)['appid']
+    expected = loop_games(games)
+    result = vectorized_games(games, top_m=top_m)
+    assert result['appid'].tolist() == expected[expected['appid'].isin(top_games)]['appid'].tolist()
+
+    input_artists = np.array(['B'], dtype=object)
+    top_tracks = tracks.sort_values('similarity', ascending=False).head(top_m)['id']
+    expected = loop_music(tracks, input_artists)
+    result = vectorized_music(tracks, input_artists, top_m=top_m)
+    assert result['id'].tolist() == expected[expected['id'].isin(top_tracks)]['id'].tolist()
+
+
+def test_penalty_groups_match_loop_over_whole_catalog(games, tracks):
+    # Estatísticas do catálogo (quantil do hidden_gems, mínimo do display_score) saem dos mesmos scores do laço
+    selected = np.array([3, 40, 41, 250])
+    input_artists = tracks['artists'].iloc[selected].unique()
+    groups = PenaltyGroups(tracks['artists'])
+    multiplier = np.where(groups.shares_key(selected), 0.5, 1.0)
+    result = groups.penalized(tracks['similarity'], exclude=selected, multiplier=multiplier)
+    expected = loop_music(tracks.drop(index=selected), input_artists)['final_score']
+    np.testing.assert_allclose(np.sort(result), np.sort(expected), rtol=1e-12)
+    assert np.quantile(result, 0.75) == pytest.approx(expected.quantile(0.75), rel=1e-12)
+
+    groups = PenaltyGroups(first_list_item(games['developers']))
+    result = groups.penalized(games['hybrid_score'], exclude=selected)
+    expected = loop_games(games.drop(index=selected))['penalized_score']
+    np.testing.assert_allclose(np.sort(result), np.sort(expected), rtol=1e-12)
+    assert result.min() == pytest.approx(expected.min(), rel=1e-12)
@@ -0,0 +1,69 @@
+# backend/tests/test_fuzzy_search.py
+"""Paridade da busca fuzzy de jogos (common/fuzzy_search.py) com o thefuzz.process.extractBests."""
+
+import os
+import sys
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+from rapidfuzz import fuzz, process as rprocess
+from thefuzz import process
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.fuzzy_search import TitleBounds, fuzzy_search, process_query, process_title
+from common.search_index import SearchIndex
+
+WORDS = ['half', 'life', 'counter', 'strike', 'portal', 'the', 'witcher', 'dark', 'souls', 'of', 'pekora', 'peak', 'stardew',
+         'valley', 'civilization', 'edition', 'remastered', 'war', 'craft', 'league', 'legends', 'dota', 'x', 'ii', '2', '3']
+EDGE_TITLES = ['Pokémon Édition', 'ŸES man', 'Game® 2', 'a - - - b', 'Half-Life 2', 'Counter-Strike: Global Offensive', 'Ünïcödé',
+               '東方 Project', 'the the the', None, float('nan'), '', '!!!', 'Pek', 'PEK pek Pek']
+EDGE_QUERIES = ['Pek', 'pek', 'é', 'Pokémon', 'ŸES', 'Game®', 'game 2', 'a b', 'the', 'x', '2', 'half life', 'counter strike', '東方', '!!!']
+
+
+@pytest.fixture(scope='module')
+def catalog():
+    rng = random.Random(7)
+    titles = [' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 5))).title() for _ in range(1500)]
+    titles += [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 30))) for _ in range(500)]
+    for title in EDGE_TITLES: titles.insert(rng.randrange(len(titles)), title)
+    names = pd.Series(titles)
+    index = SearchIndex.build(names.map(process_title))
+    return names, index, TitleBounds(index)
+
+
+def queries(names, n=300, seed=3):
+    rng = random.Random(seed)
+    titles = [t for t in names if isinstance(t, str) and t]
+    result = list(EDGE_QUERIES)
+    for _ in range(n):
+        title = rng.choice(titles)
+        i = rng.randrange(len(title))
+        result.append(rng.choice([title[:rng.randint(1, len(title))], title[:i] + rng.choice('aeiouk ') + title[i + 1:],
+                                  rng.choice(title.split() or [title]), title.upper()]))
+    return result
+
+
+def test_matches_extract_bests(catalog):
+    names, index, bounds = catalog
+    for query in queries(names):
+        expected = [key for _, _, key in process.extractBests(query, names, score_cutoff=60, limit=30)]
+        assert list(fuzzy_search(index, query, limit=30, score_cutoff=60, bounds=bounds)) == expected, query
+
+
+def test_without_bounds_scores_whole_catalog(catalog):
+    names, index, _ = catalog
+    for query in EDGE_QUERIES:
+        expected = [key for _, _, key in process.extractBests(query, names, score_cutoff=60, limit=30)]
+        assert list(fuzzy_search(index, query, limit=30, score_cutoff=60)) == expected, query
+
+
+def test_upper_bound_is_never_below_wratio(catalog):
+    names, index, bounds = catalog
+    titles = index.texts(np.arange(len(index.rows)))
+    for query in queries(names, n=100, seed=11):
+        query = process_query(query)
+        if not query: continue
+        scores = rprocess.cdist([query], titles, scorer=fuzz.WRatio, dtype=np.float64)[0]
+        assert (scores <= bounds.upper_bound(query) + 1e-6).all(), query
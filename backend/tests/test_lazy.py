@@ -0,0 +1,78 @@
+# backend/tests/test_lazy.py
+"""Troca de instância do LazyRecommender (common/lazy.py) sem expor instâncias não prontas."""
+
+import os
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.lazy import FAILED, READY, LazyRecommender
+
+
+class Recommender:
+    def __init__(self, name, is_ready=True, gate=None):
+        self.name = name
+        if gate is not None:
+            gate.loading.set()
+            gate.release.wait(5)
+        self.is_ready = is_ready
+
+
+class Gate:
+    def __init__(self):
+        self.loading, self.release = threading.Event(), threading.Event()
+
+
+def loaded(factories):
+    """LazyRecommender já carregado com a primeira fábrica; as próximas cargas usam as seguintes."""
+    factories = iter(factories)
+    lazy = LazyRecommender('test', lambda: next(factories)())
+    lazy.get()
+    return lazy
+
+
+def reload_in_background(lazy, gate):
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(swapped=lazy.reload(generation='g2')))
+    thread.start()
+    assert gate.loading.wait(5)
+    return thread, result
+
+
+def test_stays_ready_and_serves_previous_instance_while_reloading():
+    gate = Gate()
+    lazy = loaded([lambda: Recommender('g1'), lambda: Recommender('g2', gate=gate)])
+    thread, result = reload_in_background(lazy, gate)
+    assert lazy.get().name == 'g1'
+    assert lazy.status()['state'] == READY
+    assert lazy.status()['reloading']['generation'] == 'g2'
+    gate.release.set()
+    thread.join(5)
+    assert result['swapped'] and lazy.get().name == 'g2'
+    assert lazy.status()['state'] == READY and lazy.status()['reloading'] is None
+    assert lazy.swaps == 1
+
+
+def test_instance_that_is_not_ready_is_never_published():
+    gate = Gate()
+    lazy = loaded([lambda: Recommender('g1'), lambda: Recommender('g2', is_ready=False, gate=gate)])
+    thread, result = reload_in_background(lazy, gate)
+    gate.release.set()
+    thread.join(5)
+    assert not result['swapped']
+    assert lazy.get().name == 'g1' and lazy.state == READY
+    assert 'mantendo o cache anterior' in lazy.error
+
+
+def test_failed_reload_keeps_previous_instance():
+    def broken(): raise RuntimeError('cache corrompido')
+    lazy = loaded([lambda: Recommender('g1'), broken])
+    assert not lazy.reload()
+    assert lazy.get().name == 'g1' and lazy.state == READY
+    assert 'cache corrompido' in lazy.error
+
+
+def test_first_load_that_is_not_ready_is_failed():
+    lazy = LazyRecommender('test', lambda: Recommender('g1', is_ready=False))
+    assert not lazy.reload()
+    assert lazy.state == FAILED and lazy.is_loaded
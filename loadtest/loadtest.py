@@ -0,0 +1,204 @@
+# loadtest/loadtest.py
+"""
+Teste de carga HTTP de ponta a ponta (gateway, create_app ou os app.py de cada domínio).
+
+Cada sessão simula um usuário do frontend: carrega os gêneros e o discover,
+faz algumas buscas com palavras dos itens que viu, escolhe de 3 a 10 desses
+itens e pede as recomendações (com um gênero em metade das vezes); no domínio
+de músicas ainda busca os detalhes das faixas recomendadas (Spotify, que no
+teste deve ser o mock local de mock_spotify.py).
+
+As sessões chegam em ritmo aberto (processo de Poisson) calculado para a taxa
+alvo de requisições, independentemente de o servidor dar conta: se ele
+satura, a latência e as sessões descartadas (acima de --max-sessions) sobem em
+vez de a carga diminuir. O relatório traz, por endpoint, requisições, erros,
+vazão e percentis de latência.
+
+Uso (com o gateway na porta 5000 e os serviços apontando para o mock):
+    python mock_spotify.py &
+    SPOTIFY_ACCOUNTS_URL=http://localhost:5099 SPOTIFY_API_URL=http://localhost:5099 python ../run.py
+    python loadtest.py --base-url http://localhost:5000 --rps 50 --duration 60
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import defaultdict
+from datetime import datetime
+
+import aiohttp
+import numpy as np
+
+# Domínio -> (campo com os ids no corpo do recommend, chaves de id e de nome nos itens das respostas)
+DOMAINS = {
+    'games': ('game_ids', ('appid',), ('name',)),
+    'music': ('track_ids', ('id',), ('name', 'track_name')),
+    'movies': ('movie_ids', ('id',), ('title',)),
+}
+# Termos de busca quando a sessão ainda não viu nenhum item
+FALLBACK_TERMS = ['the', 'love', 'dark', 'star', 'world', 'night', 'rock', 'war']
+# Requisições por sessão (gêneros + discover + buscas + recommend), usadas para chegar à taxa alvo
+SEARCHES_PER_SESSION = (2, 4)
+
+
+class Stats:
+    def __init__(self, record_after):
+        self.record_after = record_after
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.sessions = defaultdict(int)
+
+    def record(self, endpoint, started_at, seconds, status):
+        if started_at < self.record_after: return
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][status] += 1
+
+    def report(self, elapsed):
+        rows = {}
+        for endpoint in sorted(self.latencies):
+            latencies_ms = np.array(self.latencies[endpoint]) * 1000
+            statuses = dict(self.statuses[endpoint])
+            errors = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 400)
+            p50, p90, p95, p99 = np.percentile(latencies_ms, [50, 90, 95, 99])
+            rows[endpoint] = {
+                'requests': len(latencies_ms), 'errors': errors, 'error_rate': round(errors / len(latencies_ms), 4),
+                'throughput_rps': round(len(latencies_ms) / elapsed, 2),
+                'p50_ms': round(float(p50), 2), 'p90_ms': round(float(p90), 2), 'p95_ms': round(float(p95), 2),
+                'p99_ms': round(float(p99), 2), 'max_ms': round(float(latencies_ms.max()), 2), 'statuses': statuses,
+            }
+        return rows
+
+
+async def call(session, stats, method, path, **kwargs):
+    """Faz a requisição e registra latência e status; retorna o corpo JSON (ou None)."""
+    endpoint = f"{method} {path}"
+    started_at = time.perf_counter()
+    try:
+        async with session.request(method, path, **kwargs) as response:
+            body = await response.read()
+            stats.record(endpoint, started_at, time.perf_counter() - started_at, str(response.status))
+            if response.status >= 400: return None
+            return json.loads(body) if body else None
+    except asyncio.TimeoutError:
+        stats.record(endpoint, started_at, time.perf_counter() - started_at, 'timeout')
+    except aiohttp.ClientError as e:
+        stats.record(endpoint, started_at, time.perf_counter() - started_at, type(e).__name__)
+    except ValueError:
+        stats.record(endpoint, started_at, time.perf_counter() - started_at, 'invalid_json')
+    return None
+
+
+def collect_items(body, id_keys, name_keys, seen, depth=0):
+    """Guarda (id -> nome) de todos os itens de uma resposta (listas e categorias aninhadas)."""
+    if depth > 4: return
+    if isinstance(body, dict):
+        item_id = next((body[k] for k in id_keys if k in body), None)
+        if item_id is not None and not isinstance(item_id, (dict, list)):
+            seen[item_id] = next((str(body[k]) for k in name_keys if body.get(k)), '')
+            return
+        for value in body.values(): collect_items(value, id_keys, name_keys, seen, depth + 1)
+    elif isinstance(body, list):
+        for value in body: collect_items(value, id_keys, name_keys, seen, depth + 1)
+
+
+async def run_session(session, stats, domain, rng, think_time):
+    ids_field, id_keys, name_keys = DOMAINS[domain]
+    base = f"/api/{domain}"
+
+    async def think():
+        if think_time > 0: await asyncio.sleep(rng.expovariate(1 / think_time))
+
+    seen = {}
+    genres = await call(session, stats, 'GET', f"{base}/genres")
+    collect_items(await call(session, stats, 'GET', f"{base}/discover"), id_keys, name_keys, seen)
+    for _ in range(rng.randint(*SEARCHES_PER_SESSION)):
+        await think()
+        words = [w for name in rng.sample(list(seen.values()), min(len(seen), 3)) for w in name.split() if len(w) > 2]
+        term = rng.choice(words or FALLBACK_TERMS).lower()
+        collect_items(await call(session, stats, 'GET', f"{base}/search", params={'q': term}), id_keys, name_keys, seen)
+
+    await think()
+    if len(seen) < 3:
+        stats.sessions['incomplete'] += 1
+        return
+    selected = rng.sample(list(seen), min(len(seen), rng.randint(3, 10)))
+    genre = rng.choice(genres) if isinstance(genres, list) and genres and rng.random() < 0.5 else None
+    recommendations = await call(session, stats, 'POST', f"{base}/recommend", json={ids_field: selected, 'genre': genre})
+
+    if domain == 'music' and recommendations:
+        recommended = {}
+        collect_items(recommendations.get('recommendations'), id_keys, name_keys, recommended)
+        if recommended: await call(session, stats, 'POST', f"{base}/get-track-details", json={'track_ids': list(recommended)[:50]})
+    stats.sessions['completed'] += 1
+
+
+async def run_load(args):
+    domains = [d.strip() for d in args.domains.split(',') if d.strip()]
+    rng = random.Random(args.seed)
+    requests_per_session = 3 + sum(SEARCHES_PER_SESSION) / 2 + (1 / len(domains) if 'music' in domains else 0)
+    session_rate = args.rps / requests_per_session
+    started = time.perf_counter()
+    stats = Stats(record_after=started + args.warmup)
+    active = set()
+
+    connector = aiohttp.TCPConnector(limit=args.max_sessions, force_close=False)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(base_url=args.base_url, connector=connector, timeout=timeout) as session:
+        next_arrival = started
+        while next_arrival < started + args.warmup + args.duration:
+            await asyncio.sleep(max(next_arrival - time.perf_counter(), 0))
+            if len(active) >= args.max_sessions:
+                stats.sessions['dropped'] += 1
+            else:
+                task = asyncio.create_task(run_session(session, stats, rng.choice(domains), random.Random(rng.random()), args.think_time))
+                active.add(task)
+                task.add_done_callback(active.discard)
+            next_arrival += rng.expovariate(session_rate)
+        if active: await asyncio.wait(active)
+    return stats, time.perf_counter() - stats.record_after
+
+
+def print_report(rows, sessions, elapsed):
+    print(f"\n{'endpoint':42s} {'req':>7s} {'erros':>6s} {'req/s':>8s} {'p50':>8s} {'p90':>8s} {'p95':>8s} {'p99':>8s} {'máx':>8s}  (ms)")
+    for endpoint, row in rows.items():
+        print(f"{endpoint:42s} {row['requests']:7d} {row['error_rate']:6.1%} {row['throughput_rps']:8.1f} "
+              f"{row['p50_ms']:8.1f} {row['p90_ms']:8.1f} {row['p95_ms']:8.1f} {row['p99_ms']:8.1f} {row['max_ms']:8.1f}")
+        failures = {s: c for s, c in row['statuses'].items() if not s.isdigit() or int(s) >= 400}
+        if failures: print(f"{'':42s} falhas: {failures}")
+    total = sum(row['requests'] for row in rows.values())
+    print(f"\nTotal: {total} requisições em {elapsed:.1f}s ({total / elapsed:.1f} req/s); sessões: {dict(sessions)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga HTTP com sessões de usuário simuladas")
+    parser.add_argument('--base-url', default='http://localhost:5000', help="gateway, create_app ou um serviço de domínio")
+    parser.add_argument('--domains', default='games,music,movies', help="domínios sorteados para as sessões")
+    parser.add_argument('--rps', type=float, default=20, help="taxa alvo de requisições por segundo")
+    parser.add_argument('--duration', type=float, default=60, help="segundos de chegada de sessões medidas")
+    parser.add_argument('--warmup', type=float, default=0, help="segundos iniciais fora das estatísticas")
+    parser.add_argument('--think-time', type=float, default=0.0, help="pausa média entre passos da sessão, em segundos")
+    parser.add_argument('--max-sessions', type=int, default=500, help="sessões simultâneas; acima disso novas sessões são descartadas")
+    parser.add_argument('--timeout', type=float, default=30, help="timeout de cada requisição, em segundos")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="arquivo JSON com o relatório")
+    args = parser.parse_args()
+
+    unknown = [d for d in args.domains.split(',') if d.strip() and d.strip() not in DOMAINS]
+    if unknown: parser.error(f"domínios desconhecidos: {unknown}")
+
+    stats, elapsed = asyncio.run(run_load(args))
+    rows = stats.report(elapsed)
+    print_report(rows, stats.sessions, elapsed)
+    if args.output:
+        report = {'created_at': datetime.now().isoformat(timespec='seconds'), 'config': vars(args), 'elapsed_seconds': round(elapsed, 2),
+                  'sessions': dict(stats.sessions), 'endpoints': rows}
+        with open(args.output, 'w', encoding='utf-8') as f: json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Relatório salvo em '{args.output}'.")
+    return 1 if any(row['errors'] for row in rows.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+# loadtest/mock_spotify.py
+"""
+Substituto local da API do Spotify para testes de carga sem rede.
+
+Implementa só o que o serviço de músicas usa:
+- POST /api/token  (client credentials, como accounts.spotify.com)
+- GET  /v1/tracks?ids=...  (até 50 ids, como api.spotify.com)
+
+Os metadados são derivados do id da faixa (sempre os mesmos para o mesmo id).
+MOCK_SPOTIFY_LATENCY_MS simula a latência da API real.
+
+Uso:
+    python mock_spotify.py   # porta 5099 (MOCK_SPOTIFY_PORT)
+    SPOTIFY_ACCOUNTS_URL=http://localhost:5099 SPOTIFY_API_URL=http://localhost:5099 python app.py
+"""
+
+import os
+import time
+import hashlib
+import secrets
+from flask import Flask, request, jsonify
+
+MOCK_SPOTIFY_PORT = int(os.getenv('MOCK_SPOTIFY_PORT', '5099'))
+MOCK_SPOTIFY_LATENCY_MS = float(os.getenv('MOCK_SPOTIFY_LATENCY_MS', '0'))
+TOKEN_EXPIRES_IN = 3600
+MAX_IDS = 50
+
+# Tokens emitidos pelo mock começam com este prefixo (continuam válidos se o mock reiniciar)
+TOKEN_PREFIX = 'mock-'
+
+app = Flask(__name__)
+
+
+def simulate_latency():
+    if MOCK_SPOTIFY_LATENCY_MS > 0: time.sleep(MOCK_SPOTIFY_LATENCY_MS / 1000)
+
+
+def error(status, message):
+    return jsonify({"error": {"status": status, "message": message}}), status
+
+
+def fake_track(track_id):
+    digest = hashlib.sha1(track_id.encode('utf-8')).hexdigest()
+    return {
+        "id": track_id,
+        "name": f"Track {digest[:6]}",
+        "album": {"images": [{"url": f"https://i.scdn.co/image/{digest}", "height": 640, "width": 640}]},
+        "artists": [{"id": digest[6:28], "name": f"Artist {digest[6:10]}"}],
+        "preview_url": f"https://p.scdn.co/mp3-preview/{digest}" if int(digest[-1], 16) % 4 else None,
+    }
+
+
+@app.route('/api/token', methods=['POST'])
+def token():
+    simulate_latency()
+    if not request.headers.get('Authorization', '').startswith('Basic '):
+        return jsonify({"error": "invalid_client"}), 401
+    if request.form.get('grant_type') != 'client_credentials':
+        return jsonify({"error": "unsupported_grant_type"}), 400
+    return jsonify({"access_token": TOKEN_PREFIX + secrets.token_urlsafe(24), "token_type": "Bearer", "expires_in": TOKEN_EXPIRES_IN})
+
+
+@app.route('/v1/tracks', methods=['GET'])
+def tracks():
+    simulate_latency()
+    authorization = request.headers.get('Authorization', '')
+    if not authorization.startswith('Bearer ' + TOKEN_PREFIX):
+        return error(401, "Invalid access token")
+    ids = [i for i in request.args.get('ids', '').split(',') if i]
+    if not ids: return error(400, "invalid id")
+    if len(ids) > MAX_IDS: return error(400, "Too many ids requested")
+    return jsonify({"tracks": [fake_track(i) for i in ids]})
+
+
+if __name__ == '__main__':
+    app.run(port=MOCK_SPOTIFY_PORT, threaded=True)
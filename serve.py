@@ -0,0 +1,167 @@
+# TFG_VERSAO_FINAL/serve.py
+"""
+Modo de produção: create_app servido pelo gunicorn com os caches pré-carregados.
+
+O processo mestre carrega os caches de todos os domínios servidos ANTES de
+criar os workers (preload_app), então os DataFrames ficam em páginas
+copy-on-write compartilhadas e as matrizes em mmap no page cache; `gc.freeze()`
+evita que o coletor de lixo dos workers toque (e copie) esses objetos. Os
+workers já nascem prontos, sem carga sob demanda.
+
+Recarga sem queda: com SIGHUP (`kill -HUP <pid do mestre>`) o mestre lê os
+caches de novo, cria workers novos e encerra os antigos depois que terminam as
+requisições em andamento. Se um cache novo falhar, o anterior continua em uso.
+Com CACHE_WATCH_SECONDS > 0 o mestre também observa os diretórios de cache e
+envia o SIGHUP a si mesmo quando um build termina (arquivos estáveis por um intervalo).
+
+Caches com gerações (common/generations.py): com CACHE_SWAP_SECONDS > 0 cada
+worker vigia o ponteiro CURRENT e troca para a geração nova em processo, sem
+reinício; as requisições em andamento terminam sobre a anterior. O mestre não
+troca (nem reinicia os workers por causa dessas pastas): um worker novo nasce
+com a geração do preload e troca na primeira verificação. Como a geração nova
+é carregada em cada worker, as páginas deixam de ser compartilhadas até o
+próximo SIGHUP, que volta a carregar tudo no mestre. Com CACHE_SWAP_SECONDS=0,
+a publicação de uma geração dispara o SIGHUP como qualquer outro build.
+
+Saúde e prontidão: /api/health responde enquanto o processo está de pé
+(liveness); /api/ready só dá 200 com todos os caches carregados (readiness).
+
+Configuração (variáveis de ambiente):
+    PORT / WEB_BIND        endereço (padrão 0.0.0.0:5000)
+    WEB_WORKERS            processos (padrão: número de CPUs)
+    WEB_THREADS            threads por processo (padrão 4)
+    WEB_TIMEOUT            segundos até um worker travado ser reiniciado (padrão 120)
+    WEB_GRACEFUL_TIMEOUT   segundos para terminar requisições na recarga/parada (padrão 30)
+    APP_DOMAINS            domínios servidos (ex.: "games" para um pod só de jogos)
+    CACHE_WATCH_SECONDS    intervalo de verificação dos caches (padrão 30; 0 desliga)
+    CACHE_SWAP_SECONDS     intervalo da vigia de gerações em cada worker (padrão 30; 0 desliga)
+
+Uso (Linux/macOS; o gunicorn não roda no Windows, onde continua valendo o run.py):
+    pip install -r backend/requirements_serve.txt
+    python serve.py
+"""
+
+import gc
+import os
+import sys
+import time
+import signal
+import threading
+
+# O mestre carrega tudo de forma síncrona: threads de aquecimento não sobrevivem ao fork
+os.environ['RECOMMENDER_WARMUP'] = 'false'
+# Pelo mesmo motivo a vigia de gerações não roda no create_app do mestre; cada worker inicia a sua no post_fork
+CACHE_SWAP_SECONDS = float(os.getenv('CACHE_SWAP_SECONDS', '30'))
+os.environ['CACHE_SWAP_SECONDS'] = '0'
+
+import numpy as np
+from gunicorn.app.base import BaseApplication
+
+from backend import create_app
+from common.artifacts import ARTIFACTS_DIR, MANIFEST_FILE
+from common.generations import current_generation
+from common.lazy import watch_generations
+from common.response_cache import RESPONSE_CACHE
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+# Diretórios de cache lidos pelos blueprints de cada domínio
+CACHE_DIRS = {
+    'games': os.path.join(BACKEND_DIR, 'steam', 'cache'),
+    'music': os.path.join(BACKEND_DIR, 'music', 'cache'),
+    'movies': os.path.join(BACKEND_DIR, 'movies', 'cache'),
+}
+
+WEB_BIND = os.getenv('WEB_BIND', f"0.0.0.0:{os.getenv('PORT', '5000')}")
+WEB_WORKERS = int(os.getenv('WEB_WORKERS', str(os.cpu_count() or 1)))
+WEB_THREADS = int(os.getenv('WEB_THREADS', '4'))
+WEB_TIMEOUT = int(os.getenv('WEB_TIMEOUT', '120'))
+WEB_GRACEFUL_TIMEOUT = int(os.getenv('WEB_GRACEFUL_TIMEOUT', '30'))
+CACHE_WATCH_SECONDS = float(os.getenv('CACHE_WATCH_SECONDS', '30'))
+
+
+def preload():
+    """Cria a aplicação e carrega os caches no processo mestre (na partida e a cada SIGHUP)."""
+    gc.unfreeze()  # na recarga, libera para coleta os objetos da carga anterior
+    app = create_app()
+    for lazy in app.extensions['recommenders'].values(): lazy.reload()
+    RESPONSE_CACHE.clear()
+    gc.collect()
+    gc.freeze()
+    return app
+
+
+def cache_fingerprint(domains):
+    """
+    Tamanho e mtime dos arquivos de cache dos domínios (nível do diretório + manifesto dos artefatos).
+
+    Pastas com gerações ficam de fora quando os workers trocam de geração sozinhos (CACHE_SWAP_SECONDS > 0).
+    """
+    stamp = []
+    for domain in domains:
+        directory = CACHE_DIRS[domain]
+        if CACHE_SWAP_SECONDS > 0 and current_generation(directory) is not None: continue
+        paths = [e.path for e in os.scandir(directory) if e.is_file()] if os.path.isdir(directory) else []
+        paths.append(os.path.join(directory, ARTIFACTS_DIR, MANIFEST_FILE))
+        for path in sorted(paths):
+            try: st = os.stat(path)
+            except OSError: continue
+            stamp.append((path, st.st_size, st.st_mtime_ns))
+    return stamp
+
+
+def watch_caches(server, domains, interval):
+    """Thread do mestre: pede a recarga quando os caches mudam e ficam estáveis por um intervalo."""
+    current = cache_fingerprint(domains)
+    while True:
+        time.sleep(interval)
+        changed = cache_fingerprint(domains)
+        if changed == current: continue
+        time.sleep(interval)
+        if cache_fingerprint(domains) != changed: continue  # build ainda em andamento
+        current = changed
+        server.log.info("Caches alterados em disco; recarregando os workers.")
+        os.kill(server.pid, signal.SIGHUP)
+
+
+def when_ready(server):
+    if CACHE_WATCH_SECONDS <= 0: return
+    domains = [d for d in server.app.wsgi().extensions['recommenders']]
+    threading.Thread(target=watch_caches, args=(server, domains, CACHE_WATCH_SECONDS), name='cache-watch', daemon=True).start()
+
+
+def post_fork(server, worker):
+    # Cada worker com a própria semente (o estado do numpy viria copiado do mestre)
+    np.random.seed()
+    if CACHE_SWAP_SECONDS > 0:
+        watch_generations(server.app.wsgi().extensions['recommenders'].values(), CACHE_SWAP_SECONDS)
+
+
+class ProductionServer(BaseApplication):
+    def __init__(self, options):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items(): self.cfg.set(key, value)
+
+    def load(self):
+        return preload()
+
+    def reload(self):
+        # Sem isso o gunicorn reaproveitaria a aplicação pré-carregada e os caches antigos
+        self.callable = None
+        super().reload()
+
+
+if __name__ == '__main__':
+    sys.exit(ProductionServer({
+        'bind': WEB_BIND,
+        'workers': WEB_WORKERS,
+        'threads': WEB_THREADS,
+        'worker_class': 'gthread' if WEB_THREADS > 1 else 'sync',
+        'timeout': WEB_TIMEOUT,
+        'graceful_timeout': WEB_GRACEFUL_TIMEOUT,
+        'preload_app': True,
+        'when_ready': when_ready,
+        'post_fork': post_fork,
+    }).run())